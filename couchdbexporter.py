@@ -1,12 +1,11 @@
 import couchdb
 import urlparse
-from jsonexporter import jsonizer
-import json
+from jsonexporter import as_dict
 
 
 class CouchDbExporter(object):
 	
-	def __init__(self, server_url, data_quality=[]):
+	def __init__(self, server_url, data_quality=[], shard=None):
 		self.min_data_quality = data_quality
 		self.server = server_url
 		self.connect(server_url)
@@ -27,15 +26,15 @@ class CouchDbExporter(object):
 	def execute(self, what):
 		if not self.good_quality(what):
 			return
-		# have to convert it to json and back because 
-		# on simple objects couchdb-python throws:
+		# couchdb-python takes dicts, on simple objects it throws:
 		# TypeError: argument of type 'instance' is not iterable
-		# and on dicts:
-		# AttributeError: 'dict' object has no attribute 'read'
-		doc = json.loads(json.dumps(what, default=jsonizer))
+		doc = as_dict(what)
 		self.db.save(doc)
 	
 
+	def completed(self, entity):
+		pass
+
 	def finish(self, completely_done = False):
 		pass
 
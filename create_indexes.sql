@@ -1,8 +1,6 @@
 ALTER TABLE ONLY artist ADD CONSTRAINT artist_pkey PRIMARY KEY (id);
-ALTER TABLE ONLY genre ADD CONSTRAINT genre_pkey PRIMARY KEY (id);
 ALTER TABLE ONLY image ADD CONSTRAINT image_pkey PRIMARY KEY (uri);
 ALTER TABLE ONLY label ADD CONSTRAINT label_pkey PRIMARY KEY (id);
-ALTER TABLE ONLY role ADD CONSTRAINT role_pkey PRIMARY KEY (role_name);
 ALTER TABLE ONLY release ADD CONSTRAINT release_pkey PRIMARY KEY (id);
 ALTER TABLE ONLY track ADD CONSTRAINT track_pkey PRIMARY KEY (track_id);
 ALTER TABLE ONLY master ADD CONSTRAINT master_pkey PRIMARY KEY (id);
@@ -10,13 +8,12 @@ ALTER TABLE ONLY releases_formats ADD CONSTRAINT releases_formats_pkey PRIMARY K
 ALTER TABLE ONLY releases_labels ADD CONSTRAINT releases_labels_pkey PRIMARY KEY (release_id, label, catno);
 ALTER TABLE ONLY releases_images ADD CONSTRAINT releases_images_pkey PRIMARY KEY (release_id, type,image_uri);
 ALTER TABLE ONLY releases_artists ADD CONSTRAINT releases_artists_pkey PRIMARY KEY (release_id, position);
---ALTER TABLE ONLY releases_extraartists ADD CONSTRAINT releases_extraartists_pkey PRIMARY KEY (release_id, artist_id, artist_name, anv, role);
+--ALTER TABLE ONLY releases_extraartists ADD CONSTRAINT releases_extraartists_pkey PRIMARY KEY (release_id, artist_id, artist_name, anv, role_id, role_details);
 ALTER TABLE ONLY tracks_artists ADD CONSTRAINT tracks_artists_pkey PRIMARY KEY (track_id, position);
---ALTER TABLE ONLY tracks_extraartists ADD CONSTRAINT tracks_extraartists_pkey PRIMARY KEY (track_id, artist_id, artist_name, anv, role);
+--ALTER TABLE ONLY tracks_extraartists ADD CONSTRAINT tracks_extraartists_pkey PRIMARY KEY (track_id, artist_id, artist_name, anv, role_id, role_details);
 ALTER TABLE ONLY artists_images ADD CONSTRAINT artists_images_pkey PRIMARY KEY (artist_id, type,image_uri);
 ALTER TABLE ONLY labels_images ADD CONSTRAINT labels_images_pkey PRIMARY KEY (label_id, type,image_uri);
 ALTER TABLE ONLY masters_images ADD CONSTRAINT masters_images_pkey PRIMARY KEY (master_id, type,image_uri);
---ALTER TABLE ONLY country ADD CONSTRAINT country_pkey PRIMARY_KEY (name);
 ALTER TABLE ONLY format ADD CONSTRAINT format_pkey PRIMARY KEY (name);
 
 ALTER TABLE ONLY artists_images ADD CONSTRAINT artists_images_artist_id_fkey FOREIGN KEY (artist_id) REFERENCES artist(id);
@@ -30,29 +27,42 @@ ALTER TABLE ONLY releases_images ADD CONSTRAINT releases_images_release_id_fkey
 ALTER TABLE ONLY releases_images ADD CONSTRAINT releases_images_image_uri_fkey FOREIGN KEY (image_uri) REFERENCES image(uri);
 ALTER TABLE ONLY masters_images ADD CONSTRAINT masters_images_master_id_fkey FOREIGN KEY (master_id) REFERENCES master(id);
 ALTER TABLE ONLY masters_images ADD CONSTRAINT masters_images_image_uri_fkey FOREIGN KEY (image_uri) REFERENCES image(uri);
+--genre, style, role, country, join_relation and format_description get their keys in create_tables.sql
+ALTER TABLE ONLY release ADD CONSTRAINT release_country_id_fkey FOREIGN KEY (country_id) REFERENCES country(id);
+ALTER TABLE ONLY releases_artists ADD CONSTRAINT releases_artists_join_relation_id_fkey FOREIGN KEY (join_relation_id) REFERENCES join_relation(id);
+ALTER TABLE ONLY releases_extraartists ADD CONSTRAINT releases_extraartists_role_id_fkey FOREIGN KEY (role_id) REFERENCES role(id);
+ALTER TABLE ONLY tracks_artists ADD CONSTRAINT tracks_artists_join_relation_id_fkey FOREIGN KEY (join_relation_id) REFERENCES join_relation(id);
+ALTER TABLE ONLY tracks_extraartists ADD CONSTRAINT tracks_extraartists_role_id_fkey FOREIGN KEY (role_id) REFERENCES role(id);
+ALTER TABLE ONLY masters_artists_joins ADD CONSTRAINT masters_artists_joins_join_relation_id_fkey FOREIGN KEY (join_relation_id) REFERENCES join_relation(id);
 
 CREATE INDEX release_title_idx ON release (title);
-CREATE INDEX release_country_idx ON release (country);
+CREATE INDEX release_country_idx ON release (country_id);
+CREATE INDEX release_genre_ids_idx ON release USING gin (genre_ids);
+CREATE INDEX release_style_ids_idx ON release USING gin (style_ids);
 CREATE INDEX release_barcode_idx ON release (barcode);
 CREATE INDEX releases_artists_id_idx ON releases_artists (artist_id);
 CREATE INDEX releases_artists_name_idx ON releases_artists (artist_name);
 CREATE INDEX releases_artists_releaseid_idx ON releases_artists (release_id);
 CREATE INDEX releases_extraartists_id_idx ON releases_extraartists (artist_id);
 --This one record prevents index being created as of no interest to us we delete it
-DELETE from releases_extraartists where release_id=4620841 and role='(Other,"Stage Sound & Light Technicians")';
+DELETE from releases_extraartists where release_id=4620841 and role_details='Stage Sound & Light Technicians';
 CREATE INDEX releases_extraartists_name_idx ON releases_extraartists (artist_name);
 CREATE INDEX releases_extraartists_releaseid_idx ON releases_extraartists (release_id);
+CREATE INDEX releases_extraartists_role_idx ON releases_extraartists (role_id);
 CREATE INDEX tracks_artists_id_idx ON tracks_artists (artist_id);
 CREATE INDEX tracks_artists_name_idx ON tracks_artists (artist_name);
 CREATE INDEX tracks_artists_trackid_idx ON tracks_artists (track_id);
 CREATE INDEX tracks_extraartists_id_idx ON tracks_extraartists (artist_id);
 CREATE INDEX tracks_extraartists_name_idx ON tracks_extraartists (artist_name);
 CREATE INDEX tracks_extraartists_trackid_idx ON tracks_extraartists (track_id);
+CREATE INDEX tracks_extraartists_role_idx ON tracks_extraartists (role_id);
 CREATE INDEX track_releaseid_idx ON track (release_id);
-CREATE INDEX track_releaseid_trackid ON track (release_id, track_id);
+--track_id is release_id * 100000 + trackno, so track_pkey already keeps the tracks of a release together
 CREATE INDEX releases_labels_name_idx ON releases_labels (label);
 CREATE INDEX releases_labels_catno_idx ON releases_labels (catno);
 CREATE INDEX releases_formats_releaseid_idx ON releases_formats (release_id);
 CREATE INDEX releases_images_releaseid_idx ON releases_images (release_id);
 CREATE INDEX label_name_idx ON label (name);
 CREATE INDEX artist_name_idx ON artist (name);
+CREATE INDEX master_genre_ids_idx ON master USING gin (genre_ids);
+CREATE INDEX master_style_ids_idx ON master USING gin (style_ids);
@@ -26,13 +26,6 @@ CREATE UNLOGGED TABLE artist (
 	data_quality 	text
 );
 
-CREATE UNLOGGED TABLE tmp_artists_images (
-    image_uri 	text,
-    type 		text,
-    artist_id 	integer
-);
-
-
 CREATE UNLOGGED TABLE artists_images (
     image_uri 	text,
     type 		text,
@@ -40,7 +33,8 @@ CREATE UNLOGGED TABLE artists_images (
 );
 
 CREATE UNLOGGED TABLE country (
-    name text
+    id 			serial PRIMARY KEY,
+    name 		text NOT NULL UNIQUE
 );
 
 CREATE UNLOGGED TABLE format (
@@ -48,8 +42,8 @@ CREATE UNLOGGED TABLE format (
 );
 
 CREATE UNLOGGED TABLE genre (
-    id 				integer NOT NULL,
-    name 			text,
+    id 				serial PRIMARY KEY,
+    name 			text NOT NULL UNIQUE,
     parent_genre 	integer,
     sub_genre 		integer
 );
@@ -61,14 +55,6 @@ CREATE UNLOGGED TABLE image (
     uri150 			text
 );
 
-CREATE UNLOGGED TABLE tmp_image (
-    height 			integer,
-    width 			integer,
-    uri 			text NOT NULL,
-    uri150 			text
-);
-
-
 CREATE UNLOGGED TABLE label (
     id 				integer NOT NULL,
     name 			text NOT NULL,
@@ -80,12 +66,6 @@ CREATE UNLOGGED TABLE label (
 	data_quality 	text
 );
 
-CREATE UNLOGGED TABLE tmp_labels_images (
-    image_uri 	text,
-    type 		text,
-    label_id 	integer
-);
-
 CREATE UNLOGGED TABLE labels_images (
     image_uri 	text,
     type 		text,
@@ -97,12 +77,12 @@ CREATE UNLOGGED TABLE release (
     id 			integer NOT NULL,
     status 		text,
     title 		text,
-    country 	text,
+    country_id 	integer,
     released 	text,
 	barcode		text,
     notes 		text,
-    genres 		text,
-    styles 		text,
+    genre_ids 	integer[],
+    style_ids 	integer[],
     master_id 	int,
 	data_quality text
 );
@@ -113,7 +93,7 @@ CREATE UNLOGGED TABLE releases_artists (
     artist_id 		integer,
     artist_name 	text,
     anv 			text,
-    join_relation 	text
+    join_relation_id integer
 );
 
 CREATE UNLOGGED TABLE releases_extraartists (
@@ -121,7 +101,8 @@ CREATE UNLOGGED TABLE releases_extraartists (
     artist_id 		integer,
     artist_name 	text,
     anv 			text,
-    role 			text
+    role_id 		integer,
+    role_details 	text
 );
 
 CREATE UNLOGGED TABLE releases_formats (
@@ -129,13 +110,7 @@ CREATE UNLOGGED TABLE releases_formats (
     "position" 		integer,
     format_name 	text,
     qty 			integer,
-    descriptions 	text[]
-);
-
-CREATE UNLOGGED TABLE tmp_releases_images (
-    image_uri 	text,
-    type 		text,
-    release_id 	integer
+    description_ids integer[]
 );
 
 CREATE UNLOGGED TABLE releases_images (
@@ -152,33 +127,50 @@ CREATE UNLOGGED TABLE releases_labels (
 );
 
 CREATE UNLOGGED TABLE role (
-    role_name text
+    id 			serial PRIMARY KEY,
+    name 		text NOT NULL UNIQUE
+);
+
+CREATE UNLOGGED TABLE style (
+    id 			serial PRIMARY KEY,
+    name 		text NOT NULL UNIQUE
+);
+
+CREATE UNLOGGED TABLE join_relation (
+    id 			serial PRIMARY KEY,
+    name 		text NOT NULL UNIQUE
+);
+
+CREATE UNLOGGED TABLE format_description (
+    id 			serial PRIMARY KEY,
+    name 		text NOT NULL UNIQUE
 );
 
 CREATE UNLOGGED TABLE track (
     release_id 	integer,
     "position" 	text,
-    track_id 	text,
+    track_id 	bigint,
     title 		text,
     duration 	text,
     trackno 	integer
 );
 
 CREATE UNLOGGED TABLE tracks_artists (
-    track_id 		text,
+    track_id 		bigint,
     "position"  	integer,
     artist_id 		integer,
     artist_name 	text,
     anv		 		text,
-    join_relation 	text
+    join_relation_id integer
 );
 
 CREATE UNLOGGED TABLE tracks_extraartists (
-    track_id 	text,
+    track_id 	bigint,
     artist_id 	integer,
     artist_name text,
     anv		 	text,
-    role 		text
+    role_id 	integer,
+    role_details text
 );
 
 CREATE UNLOGGED TABLE master (
@@ -187,8 +179,8 @@ CREATE UNLOGGED TABLE master (
     main_release 	integer NOT NULL,
     year 			int,
     notes 			text,
-    genres 			text,
-    styles 			text,
+    genre_ids 		integer[],
+    style_ids 		integer[],
 	data_quality 	text
 );
 
@@ -200,14 +192,14 @@ CREATE UNLOGGED TABLE masters_artists (
 CREATE UNLOGGED TABLE masters_artists_joins (
     artist1 		text,
     artist2 		text,
-    join_relation 	text,
+    join_relation_id integer,
     master_id 		integer
 );
 
 CREATE UNLOGGED TABLE masters_extraartists (
     master_id 		integer,
     artist_name 	text,
-    roles 			text[]
+    role_ids 		integer[]
 );
 
 CREATE UNLOGGED TABLE masters_formats (
@@ -217,12 +209,6 @@ CREATE UNLOGGED TABLE masters_formats (
     descriptions 	text[]
 );
 
-CREATE UNLOGGED TABLE tmp_masters_images (
-    image_uri text,
-    type 		text,
-    master_id integer
-);
-
 CREATE UNLOGGED TABLE masters_images (
     image_uri text,
     type 		text,
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''Checkpoints of how far into a dump the exporter has committed, for --resume.
+
+The checkpoint of discogs_20140501_releases.xml.gz is discogs_20140501_releases.xml.gz.checkpoint
+in the current directory, rewritten whenever the exporter commits:
+
+	{"dump": "discogs_20140501_releases.xml.gz", "size": 1234567, "sanitize": true,
+	 "offset": 987654321, "id": 123456, "records": 100000,
+	 "output": {"/srv/dump/releases.json": 4567890123}}
+
+offset is where the last committed record ends in the XML the parser reads, that is after
+decompressing and sanitizing. A resumed import seeks there in a plain dump and reads up to
+there in a compressed or sanitized one, then parses the rest behind the root element's
+opening tag, so it is a document again.
+
+output, for exporters that write files, is how long each of them was at the commit;
+a resumed import cuts them back to that, so nothing written after it is there twice.
+'''
+
+import json
+import os
+import discogsinput
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+
+class Checkpoint(object):
+	def __init__(self, dump, sanitize=False, directory='.'):
+		self.dump = dump
+		self.sanitize = sanitize
+		self.path = os.path.join(directory, os.path.basename(dump) + '.checkpoint')
+		self.size = os.path.getsize(dump)
+		# what the checkpoint resumed from adds to the offsets and counts of this run
+		self.base = 0
+		self.records = 0
+
+	def load(self):
+		'''The last checkpoint of the dump as a dict, or None if there is none.'''
+		if not os.path.exists(self.path):
+			return None
+		with open(self.path, 'rb') as f:
+			state = json.load(f)
+		if state['dump'] != os.path.basename(self.dump) or state['size'] != self.size:
+			raise ValueError('%s is the checkpoint of another %s' % (self.path, state['dump']))
+		if state['sanitize'] != self.sanitize:
+			raise ValueError('%s was written %s --sanitize, resume the same way' % (self.path,
+					'with' if state['sanitize'] else 'without'))
+		return state
+
+	def save(self, offset, id, records, output=None):
+		'''Records that everything up to offset, the end of record id, has been committed.'''
+		state = {'dump': os.path.basename(self.dump), 'size': self.size, 'sanitize': self.sanitize,
+				'offset': self.base + offset, 'id': id, 'records': self.records + records}
+		if output is not None:
+			state['output'] = output
+		with open(self.path + '.tmp', 'wb') as f:
+			json.dump(state, f)
+		os.rename(self.path + '.tmp', self.path)
+
+	def remove(self):
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+	def resume(self, state, root, decompressor=None):
+		'''Opens the dump after the checkpoint state, as a file object holding a <root> document.'''
+		head = '<%s>' % root
+		self.base = state['offset'] - len(head)
+		self.records = state['records']
+		if discogsinput.is_compressed(self.dump) or self.sanitize:
+			f = discogsinput.open_dump(self.dump, self.sanitize, decompressor)
+			try:
+				_skip(f, state['offset'])
+			except:
+				f.close()
+				raise
+		else:
+			f = open(self.dump, 'rb')
+			f.seek(state['offset'])
+		return _ResumedFile(f, head)
+
+
+def _skip(f, size):
+	'''Reads and drops the first size bytes of f.'''
+	while size > 0:
+		data = f.read(min(size, BLOCK_SIZE))
+		if not data:
+			raise IOError('The dump ends before its checkpoint')
+		size -= len(data)
+
+
+class _ResumedFile(object):
+	'''A dump read from a checkpoint on, with the opening tag of its root element in front.'''
+	def __init__(self, f, head):
+		self._f = f
+		self.source = f
+		self._head = head
+
+	def read(self, size=-1):
+		if self._head:
+			data, self._head = self._head, ''
+			return data
+		return self._f.read(size)
+
+	def close(self):
+		self._f.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
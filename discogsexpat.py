@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''expat backend: drives pyexpat directly with the dump handlers as callbacks.
+
+Compared to xml.sax this skips the Python level expatreader in between every
+event, collects text with buffer_text so a long <notes> or <profile> arrives in
+one characters() call, and feeds the parser in large chunks (from an mmap for
+plain files) instead of 64KB reads.
+'''
+
+import mmap
+import os
+from xml.parsers import expat
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def make_parser(handler, chunk_size=CHUNK_SIZE):
+	parser = expat.ParserCreate()
+	parser.buffer_text = True
+	parser.buffer_size = chunk_size
+	parser.StartElementHandler = handler.startElement
+	parser.EndElementHandler = handler.endElement
+	parser.CharacterDataHandler = handler.characters
+	return parser
+
+
+def _feed_mmap(parser, filename, chunk_size):
+	with open(filename, 'rb') as f:
+		if os.fstat(f.fileno()).st_size == 0:
+			return
+		m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			for offset in xrange(0, len(m), chunk_size):
+				parser.Parse(m[offset:offset + chunk_size], False)
+		finally:
+			m.close()
+
+
+def _feed_file(parser, f, chunk_size):
+	while 1:
+		data = f.read(chunk_size)
+		if not data:
+			break
+		parser.Parse(data, False)
+
+
+def parse(handler, source, chunk_size=CHUNK_SIZE):
+	'''Parses source, a file name or file object, with handler's callbacks.'''
+	parser = make_parser(handler, chunk_size)
+	handler.byteIndex = lambda: parser.CurrentByteIndex
+	if isinstance(source, basestring):
+		_feed_mmap(parser, source, chunk_size)
+	else:
+		_feed_file(parser, source, chunk_size)
+	parser.Parse('', True)
+	handler.endDocument()
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import xml.sax.handler
+import sys
+import model
+import re
+import discogsmetrics
+
+_roles = re.compile(r'([^[,]+(?:\[[^]]+])?)+')  # thanks to jlatour
+
+
+def parse_roles(text):
+	'''Splits "Producer, Mixed By [Assistant]" into ['Producer', ('Mixed By', 'Assistant')].'''
+	roles = []
+	for role in _roles.findall(text):
+		role = role.strip()
+		lIndex = role.find('[')
+		if lIndex != -1:
+			rIndex = role.find(']')
+			description = role[lIndex + 1: rIndex]
+			role = (role[:lIndex].strip(), description)
+		roles.append(role)
+	return roles
+
+
+def make_image(attrs):
+	img = model.ImageInfo()
+	img.height = attrs["height"]
+	img.imageType = attrs["type"]
+	img.uri = attrs["uri"]
+	img.uri150 = attrs["uri150"]
+	img.width = attrs["width"]
+	if len(attrs) != 5:
+		print "ATTR ERROR"
+		print attrs
+		sys.exit()
+	return img
+
+
+class _Node(object):
+	'''One element path: what to do when it starts and ends, and where its children lead.'''
+	__slots__ = ('children', 'start', 'end')
+
+	def __init__(self):
+		self.children = {}
+		self.start = None
+		self.end = None
+
+
+class PathHandler(xml.sax.handler.ContentHandler):
+	'''Base for the dump handlers, dispatching SAX events on the element path.
+
+	Subclasses declare which methods handle which paths, starting at the record element:
+
+		starts = {'release/formats/format': 'startFormat'}   # called with the attributes
+		ends = {'release/country': 'endCountry'}             # called with the stripped text
+
+	The paths are compiled into a tree once per handler. The handler keeps the node of the
+	current element, so each event costs a dictionary lookup instead of a scan of the element
+	stack. Elements on paths nobody handles are skipped along with everything below them.
+	'''
+	entity_name = None  # e.g. 'Release', for messages
+	record_tag = None  # e.g. 'release'
+	knownTags = frozenset()
+	starts = {}
+	ends = {}
+	checkpoint = None  # discogscheckpoint.Checkpoint of the dump, when the exporter has commit points
+	byteIndex = None  # set by the parser backends that can tell the byte offset of the current event
+
+	def __init__(self, exporter, stop_after=0, ignore_missing_tags=False):
+		self.exporter = exporter
+		self.stop_after = stop_after
+		self.ignore_missing_tags = ignore_missing_tags
+		self.unknown_tags = []
+		self.count = 0
+		self.stopped = False
+		self.resumed = False
+		self.storing = None
+		self.stored_at = None
+		self.text = []
+		self.document = self.compile()
+		self.ignored = _Node()
+		self.node = self.document
+		self.parents = []
+
+	def compile(self):
+		document = _Node()
+		for table, kind in ((self.starts, 'start'), (self.ends, 'end')):
+			for path, method in table.iteritems():
+				node = document
+				for name in path.split('/'):
+					node = node.children.setdefault(name, _Node())
+				setattr(node, kind, getattr(self, method))
+		return document
+
+	def unknownTag(self, name):
+		if not self.ignore_missing_tags:
+			print "Error: Unknown %s element '%s'." % (self.entity_name, name)
+			sys.exit()
+		elif not name in self.unknown_tags:
+			self.unknown_tags.append(name)
+
+	def startElement(self, name, attrs):
+		if not name in self.knownTags:
+			self.unknownTag(name)
+		parent = self.node
+		node = parent.children.get(name)
+		if node is None:
+			# wrapper elements such as <releases> keep us at the document level
+			node = self.document if parent is self.document else self.ignored
+		self.parents.append(parent)
+		self.node = node
+		self.text = []
+		if node.start is not None:
+			node.start(attrs)
+
+	def characters(self, data):
+		self.text.append(data)
+
+	def endElement(self, name):
+		node = self.node
+		if node.end is not None:
+			node.end(u''.join(self.text).strip())
+		self.text = []
+		self.node = self.parents.pop()
+
+	def storeRecord(self, store, record):
+		'''Hands record to store, one of the exporter's store methods.'''
+		self.storing = record
+		discogsmetrics.enter('export')
+		try:
+			store(record)
+		finally:
+			discogsmetrics.leave()
+			self.storing = None
+		if self.checkpoint is not None:
+			self.stored_at = (self.recordEnd(), record.id)
+		self.recordDone()
+
+	def recordEnd(self):
+		'''The byte offset after the record whose end tag is being handled.'''
+		return self.byteIndex() + len('</%s>' % self.record_tag)
+
+	def commitPoint(self):
+		'''Set as the exporter's on_commit, which calls it once the records it was handed are stored for good.'''
+		if self.checkpoint is None:
+			return
+		output = None
+		if hasattr(self.exporter, 'committedOutput'):
+			output = self.exporter.committedOutput()
+		if self.storing is not None:
+			# committed along with the record being stored
+			self.checkpoint.save(self.recordEnd(), self.storing.id, self.count + 1, output)
+		elif self.stored_at is not None:
+			offset, id = self.stored_at
+			self.checkpoint.save(offset, id, self.count, output)
+
+	def recordDone(self):
+		'''To be called once the exporter was handed a record.'''
+		self.count += 1
+		if self.stop_after > 0 and self.count >= self.stop_after:
+			self.stopped = True
+			self.endDocument()
+			raise model.ParserStopError(self.count)
+
+	def endDocument(self):
+		if self.ignore_missing_tags and len(self.unknown_tags) > 0:
+			print 'Encountered some unknown %s tags: %s' % (self.entity_name, self.unknown_tags)
+		discogsmetrics.enter('export')
+		try:
+			if not self.stopped and not self.resumed:
+				# every record of the dump went by, the exporter may drop what was not among them
+				self.exporter.completed(self.record_tag)
+			self.exporter.finish()
+		finally:
+			discogsmetrics.leave()
+		if self.checkpoint is not None:
+			if not self.stopped:
+				self.checkpoint.remove()
+			# later commits are the next dump's
+			self.checkpoint = None
@@ -0,0 +1,270 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''File objects the parsers read the dumps through.
+
+Those wrapping the dump file keep it as their source, so position() can tell how
+far into the file on disk the parser got.'''
+
+import bz2
+import gzip
+import Queue
+import subprocess
+import sys
+import threading
+from os import path
+
+try:
+	import lzma
+except ImportError:
+	try:
+		from backports import lzma
+	except ImportError:
+		lzma = None
+
+BLOCK_SIZE = 4 * 1024 * 1024
+READ_AHEAD = 4  # blocks
+
+# every byte between 0x00 and 0x1F except tab, LF and CR is invalid in XML 1.0;
+# none of them can be part of a multi-byte UTF-8 sequence
+CONTROL_CHARS = ''.join(chr(c) for c in range(0x20) if c not in (0x09, 0x0A, 0x0D))
+
+COMPRESSED = ('.gz', '.bz2', '.xz')
+
+
+def is_compressed(filename):
+	return path.splitext(filename)[1] in COMPRESSED
+
+
+def sanitize_block(block):
+	return block.translate(None, CONTROL_CHARS)
+
+
+class _BlockFile(object):
+	'''Read-only file object handing out slices of large blocks produced by nextBlock().'''
+	def __init__(self):
+		self._data = ''
+		self._pos = 0
+		self._taken = 0  # bytes of the blocks before _data
+
+	def nextBlock(self, size):
+		'''Returns the next non-empty block, of about size bytes, or '' at the end.'''
+		raise NotImplementedError
+
+	def read(self, size=-1):
+		if size < 0:
+			blocks = [self._data[self._pos:]]
+			while 1:
+				block = self.nextBlock(BLOCK_SIZE)
+				if not block:
+					break
+				blocks.append(block)
+			data = ''.join(blocks)
+			self._taken += self._pos + len(data)
+			self._data, self._pos = '', 0
+			return data
+		if self._pos >= len(self._data):
+			self._taken += len(self._data)
+			self._data, self._pos = self.nextBlock(max(size, BLOCK_SIZE)), 0
+		data = self._data[self._pos:self._pos + size]
+		self._pos += len(data)
+		return data
+
+	def consumed(self):
+		'''How many bytes were read from this file.'''
+		return self._taken + self._pos
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+class SanitizedFile(_BlockFile):
+	'''Drops the control characters of another file object, in large blocks.'''
+	def __init__(self, f):
+		_BlockFile.__init__(self)
+		self._f = f
+		self.source = f
+
+	def nextBlock(self, size):
+		while 1:
+			block = self._f.read(size)
+			if not block:
+				return ''
+			block = sanitize_block(block)
+			if block:
+				return block
+
+	def close(self):
+		self._f.close()
+
+
+class ReadAheadFile(_BlockFile):
+	'''Reads (and decompresses) another file object in a background thread, keeping up to
+	depth blocks ready so decompression overlaps with parsing.
+
+	source: the compressed file f reads from, closed along with f.'''
+	def __init__(self, f, sanitize=False, block_size=BLOCK_SIZE, depth=READ_AHEAD, source=None):
+		_BlockFile.__init__(self)
+		self._f = f
+		self.source = source
+		self._queue = Queue.Queue(depth)
+		self.produced = 0  # bytes read into the queue, ahead of consumed()
+		self._done = False
+		self._closed = False
+		self._thread = threading.Thread(target=self._readAhead, args=(sanitize, block_size))
+		self._thread.daemon = True
+		self._thread.start()
+
+	def _readAhead(self, sanitize, block_size):
+		try:
+			while not self._closed:
+				block = self._f.read(block_size)
+				if block and sanitize:
+					block = sanitize_block(block)
+					if not block:
+						continue
+				self.produced += len(block)
+				self._queue.put(block)
+				if not block:
+					return
+		except Exception:
+			self._queue.put(sys.exc_info())
+
+	def nextBlock(self, size):
+		if self._done:
+			return ''
+		block = self._queue.get()
+		if isinstance(block, tuple):
+			self._done = True
+			raise block[0], block[1], block[2]
+		if not block:
+			self._done = True
+		return block
+
+	def close(self):
+		self._closed = True
+		# unblock the reader if it waits for room in the queue
+		while self._thread.is_alive():
+			try:
+				self._queue.get(timeout=0.1)
+			except Queue.Empty:
+				pass
+		self._f.close()
+		if self.source is not None:
+			self.source.close()
+
+
+class Bz2File(_BlockFile):
+	'''Decompresses a bzip2 file object, going on with the next stream where one ends
+	(as pbzip2 writes them); BZ2File of Python 2 stops after the first and takes no file object.'''
+	def __init__(self, f, read_size=BLOCK_SIZE / 4):
+		_BlockFile.__init__(self)
+		self._f = f
+		self._read_size = read_size
+		self._decompressor = bz2.BZ2Decompressor()
+
+	def nextBlock(self, size):
+		while 1:
+			data = self._f.read(self._read_size)
+			if not data:
+				return ''
+			blocks = []
+			while data:
+				try:
+					blocks.append(self._decompressor.decompress(data))
+				except EOFError:
+					# the previous stream ended right at the end of the last read
+					self._decompressor = bz2.BZ2Decompressor()
+					continue
+				data = self._decompressor.unused_data
+				if data:
+					self._decompressor = bz2.BZ2Decompressor()
+			block = ''.join(blocks)
+			if block:
+				return block
+
+	def close(self):
+		self._f.close()
+
+
+class ProcessFile(object):
+	'''Reads the standard output of a command, e.g. ['pigz', '-dc', filename].'''
+	def __init__(self, args):
+		self._args = args
+		try:
+			self._proc = subprocess.Popen(args, stdout=subprocess.PIPE, bufsize=-1, close_fds=True)
+		except OSError as e:
+			raise IOError('Cannot run %s: %s' % (args[0], e.strerror))
+
+	def read(self, size=-1):
+		data = self._proc.stdout.read(size)
+		if not data and self._proc.wait() != 0:
+			raise IOError('%s exited with status %d' % (' '.join(self._args), self._proc.returncode))
+		return data
+
+	def close(self):
+		if self._proc.poll() is None:
+			self._proc.terminate()
+		self._proc.stdout.close()
+		self._proc.wait()
+
+
+def _open_compressed(filename, decompressor):
+	'''Returns the decompressed file object and the file it reads, when that is read in this process.'''
+	if decompressor is not None:
+		return ProcessFile([decompressor, '-dc', filename]), None
+	if filename.endswith('.xz') and lzma is None:
+		return ProcessFile(['xz', '-dc', filename]), None
+	f = open(filename, 'rb')
+	if filename.endswith('.gz'):
+		return gzip.GzipFile(fileobj=f, mode='rb'), f
+	if filename.endswith('.bz2'):
+		return Bz2File(f), f
+	return lzma.LZMAFile(f), f
+
+
+def open_dump(f, sanitize=False, decompressor=None):
+	'''Opens a dump for reading; f is a file name or an already open file object.
+
+	Compressed dumps are decompressed in a read-ahead thread, with Python's own modules
+	or with the external decompressor command (e.g. pigz), which is run as "decompressor -dc f".
+	'''
+	if isinstance(f, basestring):
+		if is_compressed(f):
+			f, source = _open_compressed(f, decompressor)
+			return ReadAheadFile(f, sanitize, source=source)
+		f = open(f, 'rb')
+	if sanitize:
+		f = SanitizedFile(f)
+	return f
+
+
+def position(f):
+	'''How many bytes of the dump file f (from open_dump()) reads have been read, or None if not known.
+
+	Of a compressed dump, the part that was read ahead but not parsed yet does not count,
+	assuming that it compresses as well as the rest.'''
+	scale = 1.0
+	while not isinstance(f, file):
+		if isinstance(f, ReadAheadFile):
+			scale *= float(f.consumed()) / f.produced if f.produced > 0 else 0.0
+		f = getattr(f, 'source', None)
+		if f is None:
+			return None
+	return int(f.tell() * scale)
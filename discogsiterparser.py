@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''iterparse backend: lets a C parser (lxml when installed, cElementTree otherwise)
+build each record's element tree, converts the tree to the same model objects the
+SAX handlers build and hands them to the handler's own end-of-record method, so
+counting, -n and the exporters behave exactly as with the SAX backend.
+'''
+
+from operator import attrgetter
+import model
+import discogsmetrics
+from discogshandler import parse_roles, make_image
+
+try:
+	from lxml import etree
+	_lxml = True
+except ImportError:
+	import xml.etree.cElementTree as etree
+	_lxml = False
+
+_tag = attrgetter('tag')
+
+
+def _text(elem):
+	if elem.text is None:
+		return u''
+	return elem.text.strip()
+
+
+def _artist_joins(artists, joins):
+	for artist in artists:
+		for field in artist:
+			text = _text(field)
+			if len(text) == 0:
+				continue
+			if field.tag == 'id':
+				aj = model.ArtistJoin()
+				aj.artist_id = text
+				joins.append(aj)
+			elif field.tag == 'name':
+				joins[-1].artist_name = text
+			elif field.tag == 'anv':
+				joins[-1].anv = text
+			elif field.tag == 'join':
+				joins[-1].join_relation = text
+
+
+def _extraartists(artists, extraartists):
+	for artist in artists:
+		for field in artist:
+			text = _text(field)
+			if len(text) == 0:
+				continue
+			if field.tag == 'id':
+				eaj = model.Extraartist()
+				eaj.artist_id = text
+				extraartists.append(eaj)
+			elif field.tag == 'name':
+				extraartists[-1].artist_name = text
+			elif field.tag == 'anv':
+				extraartists[-1].anv = text
+			elif field.tag == 'role':
+				extraartists[-1].roles.extend(parse_roles(text))
+
+
+def _texts(elem, tag):
+	return [t for t in (_text(e) for e in elem if e.tag == tag) if len(t) != 0]
+
+
+def _track(elem):
+	trk = model.Track()
+	for child in elem:
+		tag = child.tag
+		if tag == 'title':
+			text = _text(child)
+			if len(text) != 0:
+				trk.title = text
+		elif tag == 'duration':
+			trk.duration = _text(child)
+		elif tag == 'position':
+			trk.position = _text(child)
+		elif tag == 'artists':
+			_artist_joins(child, trk.artistJoins)
+		elif tag == 'extraartists':
+			_extraartists(child, trk.extraartists)
+	return trk
+
+
+def release_from(elem):
+	release = model.Release()
+	release.id = int(elem.get('id'))
+	release.status = elem.get('status')
+	for child in elem:
+		tag = child.tag
+		if tag in ('title', 'country', 'released', 'notes', 'data_quality'):
+			text = _text(child)
+			if len(text) != 0:
+				setattr(release, tag, text)
+		elif tag == 'images':
+			release.images = [make_image(img.attrib) for img in child]
+		elif tag == 'artists':
+			_artist_joins(child, release.artistJoins)
+		elif tag == 'extraartists':
+			_extraartists(child, release.extraartists)
+		elif tag == 'genres':
+			release.genres = _texts(child, 'genre')
+		elif tag == 'styles':
+			release.styles = _texts(child, 'style')
+		elif tag == 'formats':
+			for f in child:
+				fmt = model.Format()
+				fmt.name = f.get('name')
+				fmt.qty = f.get('qty')
+				for descriptions in f:
+					fmt.descriptions.extend(_texts(descriptions, 'description'))
+				release.formats.append(fmt)
+		elif tag == 'labels':
+			for l in child:
+				lbl = model.ReleaseLabel()
+				lbl.name = l.get('name')
+				lbl.catno = l.get('catno')
+				release.labels.append(lbl)
+		elif tag == 'identifiers':
+			for identifier in child:
+				# Barcode
+				if identifier.get('type') == 'Barcode':
+					release.barcode = identifier.get('value')
+		elif tag == 'master_id':
+			release.master_id = int(_text(child))
+		elif tag == 'tracklist':
+			release.tracklist = [_track(trk) for trk in child if trk.tag == 'track']
+	return release
+
+
+def artist_from(elem):
+	artist = model.Artist()
+	for child in elem:
+		tag = child.tag
+		if tag == 'id':
+			artist.id = int(_text(child))
+		elif tag in ('name', 'realname', 'profile', 'data_quality'):
+			text = _text(child)
+			if len(text) != 0:
+				setattr(artist, tag, text)
+		elif tag == 'images':
+			artist.images = [make_image(img.attrib) for img in child]
+		elif tag == 'urls':
+			artist.urls = _texts(child, 'url')
+		elif tag in ('namevariations', 'aliases', 'groups', 'members'):
+			setattr(artist, tag, _texts(child, 'name'))
+	return artist
+
+
+def label_from(elem):
+	label = model.Label()
+	for child in elem:
+		tag = child.tag
+		if tag == 'id':
+			label.id = int(_text(child))
+		elif tag in ('name', 'contactinfo', 'profile', 'parentLabel', 'data_quality'):
+			text = _text(child)
+			if len(text) != 0:
+				setattr(label, tag, text)
+		elif tag == 'images':
+			label.images = [make_image(img.attrib) for img in child]
+		elif tag == 'urls':
+			label.urls = _texts(child, 'url')
+		elif tag == 'sublabels':
+			label.sublabels = _texts(child, 'label')
+	return label
+
+
+def master_from(elem):
+	master = model.Master()
+	master.id = int(elem.get('id'))
+	for child in elem:
+		tag = child.tag
+		if tag in ('title', 'main_release', 'notes', 'data_quality'):
+			text = _text(child)
+			if len(text) != 0:
+				setattr(master, tag, text)
+		elif tag == 'year':
+			text = _text(child)
+			if len(text) != 0:
+				master.year = int(text)
+		elif tag == 'images':
+			master.images = [make_image(img.attrib) for img in child]
+		elif tag == 'genres':
+			master.genres = _texts(child, 'genre')
+		elif tag == 'styles':
+			master.styles = _texts(child, 'style')
+		elif tag == 'artists':
+			for artist in child:
+				for field in artist:
+					text = _text(field)
+					if len(text) == 0:
+						continue
+					if field.tag == 'name':
+						master.artists.append(text)
+					elif field.tag == 'anv':
+						master.anv = text
+					elif field.tag == 'join':
+						aj = model.ArtistJoin()
+						if len(master.artists) > 0:
+							aj.artist1 = master.artists[-1]
+						else:
+							aj.artist1 = master.anv
+							master.artists.append(master.anv)
+						aj.join_relation = text
+						master.artistJoins.append(aj)
+	return master
+
+
+converters = {
+	'artist': artist_from,
+	'label': label_from,
+	'master': master_from,
+	'release': release_from,
+	}
+
+
+def _records(source, tag):
+	'''Yields the top level <tag> elements of source, freeing each once the caller is done with it.'''
+	if _lxml:
+		for event, elem in etree.iterparse(source, events=('end', ), tag=tag):
+			parent = elem.getparent()
+			if parent is not None and parent.getparent() is not None:
+				continue  # e.g. a <label> in <sublabels>
+			yield elem
+			elem.clear()
+			while elem.getprevious() is not None:
+				del parent[0]
+	else:
+		depth = 0
+		root = None
+		for event, elem in etree.iterparse(source, events=('start', 'end')):
+			if event == 'start':
+				if root is None:
+					root = elem
+				depth += 1
+				continue
+			depth -= 1
+			if depth == 1 and elem.tag == tag:
+				yield elem
+				root.clear()
+
+
+def parse(handler, source):
+	'''Parses source, a file name or file object, handing every record to handler.'''
+	tag = handler.record_tag
+	convert = converters[tag]
+	store = getattr(handler, handler.ends[tag])
+	for elem in _records(source, tag):
+		for name in set(map(_tag, elem.iter())).difference(handler.knownTags):
+			handler.unknownTag(name)
+		discogsmetrics.enter('model')
+		try:
+			setattr(handler, tag, convert(elem))
+		finally:
+			discogsmetrics.leave()
+		store(u'')
+	handler.endDocument()
@@ -14,109 +14,84 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-import xml.sax.handler
-import xml.sax
 import model
-import sys
-import os
+from discogshandler import PathHandler, make_image
 
-labelCounter = 0
 
+class LabelHandler(PathHandler):
+	entity_name = 'Label'
+	record_tag = 'label'
+	knownTags = frozenset((
+				'id',
+				'label',
+				'labels',
+				'data_quality',
+				'contactinfo',
+				'image',
+				'images',
+				'name',
+				'profile',
+				'parentLabel',
+				'sublabels',
+				'urls',
+				'url',
+				))
+	starts = {
+		'label': 'startLabel',
+		'label/images/image': 'startImage',
+		}
+	ends = {
+		'label': 'endLabel',
+		'label/id': 'endId',
+		'label/name': 'endName',
+		'label/contactinfo': 'endContactinfo',
+		'label/data_quality': 'endDataQuality',
+		'label/profile': 'endProfile',
+		'label/urls/url': 'endUrl',
+		'label/parentLabel': 'endParentLabel',
+		'label/sublabels/label': 'endSublabel',
+		}
 
-class LabelHandler(xml.sax.handler.ContentHandler):
-	inElement = {
-				'id': False,
-				'label': False,
-				'labels': False,
-				'data_quality': False,
-				'contactinfo': False,
-				'image': False,
-				'images': False,
-				'name': False,
-				'profile': False,
-				'parentLabel': False,
-				'sublabels': False,
-				'urls': False,
-				'url': False,
-				}
-	label = model.Label()
-	buffer = ''
-	unknown_tags = []
+	def __init__(self, exporter, stop_after=0, ignore_missing_tags=False):
+		PathHandler.__init__(self, exporter, stop_after, ignore_missing_tags)
+		self.label = model.Label()
 
-	def __init__(self, exporter, stop_after=0, ignore_missing_tags = False):
-		self.exporter = exporter
-		self.stop_after = stop_after
-		self.ignore_missing_tags = ignore_missing_tags
+	def startLabel(self, attrs):
+		self.label = model.Label()
 
-	def startElement(self, name, attrs):
-		if not name in self.inElement:
-			if not self.ignore_missing_tags:
-				print "Error: Unknown Label element '%s'." % name
-				sys.exit()
-			elif not name in self.unknown_tags:
-				self.unknown_tags.append(name)
-		self.inElement[name] = True
-		if name == 'label':
-			if not self.inElement['sublabels']:
-				self.label = model.Label()
-		elif name == "image":
-			newImage = model.ImageInfo()
-			newImage.height = attrs["height"]
-			newImage.imageType = attrs["type"]
-			newImage.uri = attrs["uri"]
-			newImage.uri150 = attrs["uri150"]
-			newImage.width = attrs["width"]
-			self.label.images.append(newImage)
-			if len(attrs) != 5:
-				print "ATTR ERROR"
-				print attrs
-				sys.exit()
+	def startImage(self, attrs):
+		self.label.images.append(make_image(attrs))
 
-	def characters(self, data):
-		self.buffer += data
+	def endId(self, text):
+		self.label.id = int(text)
 
-	def endDocument(self):
-		self.exporter.finish()
+	def endName(self, text):
+		if len(text) != 0:
+			self.label.name = text
 
-	def endElement(self, name):
-		self.buffer = self.buffer.strip()
-		if name == 'id':
-			self.label.id = int(self.buffer)
-		if name == 'name':
-			if len(self.buffer) != 0:
-				self.label.name = self.buffer
-		elif name == 'contactinfo':
-			if len(self.buffer) != 0:
-				self.label.contactinfo = self.buffer
-		elif name == 'data_quality':
-			if len(self.buffer) != 0:
-				self.label.data_quality = self.buffer
-		elif name == 'profile':
-			if len(self.buffer) != 0:
-				self.label.profile = self.buffer
-		elif name == 'url':
-			if len(self.buffer) != 0:
-				self.label.urls.append(self.buffer)
-		elif name == 'parentLabel':
-			if len(self.buffer) != 0:
-				self.label.parentLabel = self.buffer
-		elif name == "label":
-			if self.inElement['sublabels']:
-				if len(self.buffer) != 0:
-					self.label.sublabels.append(self.buffer)
-			else:
-				self.exporter.storeLabel(self.label)
+	def endContactinfo(self, text):
+		if len(text) != 0:
+			self.label.contactinfo = text
 
-				global labelCounter
-				labelCounter += 1
-				if self.stop_after > 0 and labelCounter >= self.stop_after:
-					self.endDocument()
-					if self.ignore_missing_tags and len(self.unknown_tags) > 0:
-						print 'Encountered some unknown Label tags: %s' % (self.unknown_tags)
-					raise model.ParserStopError(labelCounter)
+	def endDataQuality(self, text):
+		if len(text) != 0:
+			self.label.data_quality = text
 
-		self.inElement[name] = False
-		self.buffer = ''
+	def endProfile(self, text):
+		if len(text) != 0:
+			self.label.profile = text
 
-#labels = {}
-#labelCounter = 0
+	def endUrl(self, text):
+		if len(text) != 0:
+			self.label.urls.append(text)
+
+	def endParentLabel(self, text):
+		if len(text) != 0:
+			self.label.parentLabel = text
+
+	def endSublabel(self, text):
+		if len(text) != 0:
+			self.label.sublabels.append(text)
+
+	def endLabel(self, text):
+		self.storeRecord(self.exporter.storeLabel, self.label)
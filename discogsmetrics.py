@@ -0,0 +1,255 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''Progress reports while parsing (--progress) and a JSON report of the run (--report).
+
+Progress is printed by a thread of its own, which looks at the handler's record count
+and at how far the dump file has been read, so parsing does not pay for it.
+
+With --report, the time of the run is also split into stages, each second counting
+for the innermost stage it was spent in:
+
+	xml        reading, decompressing and parsing the dumps, what is left of the others
+	model      the handlers' callbacks, building the records
+	serialize  turning records into dicts, JSON or rows
+	hash       taking the digests of uniq imports
+	export     the exporter's own work, writing to the database or to files
+'''
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+_time = time.time
+
+STAGES = ('xml', 'model', 'serialize', 'hash', 'export')
+
+
+class Stages(object):
+	'''Seconds spent in each stage. A stage's own seconds leave out those of the stages
+	nested in it, 'xml' gets the seconds no other stage took.'''
+	def __init__(self):
+		# 'wait' is the time spent waiting for the processes that parse for this one
+		self.seconds = dict.fromkeys(STAGES + ('wait', ), 0.0)
+		self.started = time.time()
+		self.nested = 0.0  # seconds spent in any stage so far
+		self._stack = []
+
+	def enter(self, stage):
+		self._stack.append((stage, time.time(), self.nested))
+
+	def leave(self):
+		stage, started, nested = self._stack.pop()
+		self.spent(stage, time.time() - started, nested)
+
+	def spent(self, stage, seconds, nested):
+		'''Counts seconds for stage, but those of the stages nested in it, which took the
+		seconds that self.nested went up by since it was nested.'''
+		self.seconds[stage] += seconds - (self.nested - nested)
+		self.nested = nested + seconds
+
+	def total(self):
+		seconds = dict(self.seconds)
+		seconds['xml'] = time.time() - self.started - sum(n for stage, n in seconds.iteritems() if stage != 'xml')
+		return seconds
+
+
+stages = None  # the Stages being timed, set by start_stages()
+
+
+def start_stages():
+	global stages
+	stages = Stages()
+
+
+def enter(stage):
+	if stages is not None:
+		stages.enter(stage)
+
+
+def leave():
+	if stages is not None:
+		stages.leave()
+
+
+def stage_seconds():
+	'''The seconds per stage up to now, or None when stages are not timed.'''
+	if stages is None:
+		return None
+	return stages.total()
+
+
+def timed(stage):
+	'''Decorates a function whose time counts for stage.'''
+	def decorate(function):
+		@functools.wraps(function)
+		def timed_function(*args, **kwargs):
+			s = stages
+			if s is None:
+				return function(*args, **kwargs)
+			started, nested = _time(), s.nested
+			try:
+				return function(*args, **kwargs)
+			finally:
+				s.spent(stage, _time() - started, nested)
+		return timed_function
+	return decorate
+
+
+def instrument(handler):
+	'''Times the element callbacks of handler as the model stage; characters() only
+	gathers the text, its time counts for xml rather than doubling its cost.'''
+	for name in ('startElement', 'endElement'):
+		setattr(handler, name, _timedCallback(getattr(handler, name), stages))
+
+
+def _timedCallback(callback, s):
+	# as timed('model'), without its checks: this runs for every element
+	seconds = s.seconds
+	def timed_callback(*args):
+		started, nested = _time(), s.nested
+		try:
+			return callback(*args)
+		finally:
+			spent = _time() - started
+			seconds['model'] += spent - (s.nested - nested)
+			s.nested = nested + spent
+	return timed_callback
+
+
+def _size(n):
+	for unit in ('B', 'KB', 'MB', 'GB'):
+		if n < 1024:
+			break
+		n /= 1024.0
+	else:
+		unit = 'TB'
+	return '%.1f %s' % (n, unit)
+
+
+def _duration(seconds):
+	minutes, seconds = divmod(int(seconds), 60)
+	hours, minutes = divmod(minutes, 60)
+	return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+class Progress(object):
+	'''Watches the parsing of one dump and, every interval seconds, prints to stderr how far it got.
+
+	position: returns how many bytes of the dump file (as it is on disk, so compressed for
+	a compressed dump) have been read, or None when that is not known.'''
+	def __init__(self, dump, handler, position=None, interval=0):
+		self.dump = dump
+		self.handler = handler
+		self.size = os.path.getsize(dump)
+		self._position = position
+		self.started = time.time()
+		self.seconds = None
+		self.start_position = self.position() or 0
+		self.last_position = None
+		self._stop = threading.Event()
+		self._thread = None
+		if interval > 0:
+			self._thread = threading.Thread(target=self._run, args=(interval, ))
+			self._thread.daemon = True
+			self._thread.start()
+
+	def position(self):
+		if self._position is None:
+			return None
+		try:
+			position = self._position()
+		except (AttributeError, ValueError):
+			# the parser has not started or the file is closed already
+			return None
+		if position is None or position < 0:
+			return None
+		self.last_position = position
+		return position
+
+	def _run(self, interval):
+		while not self._stop.wait(interval):
+			sys.stderr.write(self.line() + '\n')
+
+	def line(self):
+		seconds = time.time() - self.started
+		records = self.handler.count
+		line = '%s: %d records (%d/s)' % (os.path.basename(self.dump), records, records / max(seconds, 0.001))
+		position = self.position()
+		if position is None:
+			return line
+		rate = (position - self.start_position) / max(seconds, 0.001)
+		line += ', %s of %s read (%s/s), %.1f%% done' % (_size(position), _size(self.size), _size(rate),
+				100.0 * position / max(self.size, 1))
+		if rate > 0:
+			line += ', ETA %s' % _duration((self.size - position) / rate)
+		return line
+
+	def stop(self, finished=True):
+		'''Stops the reports, returns the summary of the dump for the JSON report;
+		finished tells whether the whole dump was parsed.'''
+		if self.seconds is None:
+			self.seconds = time.time() - self.started
+			self._stop.set()
+			if self._thread is not None:
+				self._thread.join()
+		records = self.handler.count
+		summary = {'dump': self.dump, 'records': records, 'seconds': round(self.seconds, 3),
+				'records_per_second': round(records / max(self.seconds, 0.001), 1), 'size': self.size}
+		if finished:
+			position = self.size
+		else:
+			position = self.position() or self.last_position
+		if position is not None:
+			summary['bytes'] = position - self.start_position
+			summary['bytes_per_second'] = round(summary['bytes'] / max(self.seconds, 0.001))
+		return summary
+
+
+class Report(object):
+	'''What --report writes: the summaries of the dumps and the seconds per stage.'''
+	def __init__(self, argv):
+		self.argv = argv
+		self.started = time.time()
+		self.dumps = []
+		self.stages = None
+
+	def add(self, summary):
+		self.dumps.append(summary)
+
+	def addStages(self, seconds):
+		'''Adds the seconds per stage of a process that parsed for this one (--concurrent, --jobs).'''
+		if self.stages is None:
+			self.stages = {}
+		for stage, n in seconds.iteritems():
+			self.stages[stage] = self.stages.get(stage, 0.0) + n
+
+	def write(self, path, failed=False):
+		report = {'argv': self.argv, 'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+				'seconds': round(time.time() - self.started, 3), 'failed': failed, 'dumps': self.dumps,
+				'records': sum(d['records'] for d in self.dumps)}
+		seconds = stage_seconds()
+		if seconds is not None:
+			if self.stages is not None:
+				for stage, n in self.stages.iteritems():
+					seconds[stage] += n
+			report['stages'] = dict((stage, round(seconds[stage], 3)) for stage in STAGES)
+		with open(path, 'w') as f:
+			json.dump(report, f, indent=1, sort_keys=True)
+			f.write('\n')
@@ -16,10 +16,19 @@
 
 import xml.sax.handler
 import xml.sax
+import os
 import sys
 import jsonexporter
 import argparse # in < 2.7 pip install argparse
-import gzip
+import multiprocessing
+import traceback
+import functools
+import time
+import discogsinput
+import discogssplitter
+import discogscheckpoint
+import discogsmetrics
+import discogsprofile
 
 from os import path
 from model import ParserStopError
@@ -27,9 +36,12 @@ from collections import deque
 
 #sys.setdefaultencoding('utf-8')
 options = None
+report = None  # discogsmetrics.Report of the run, with --report
 
 exporters = { 'json': 'jsonexporter.JsonConsoleExporter', 
 	'pgsql' : 'postgresexporter.PostgresExporter', 
+	'pgcopy': 'postgresexporter.PostgresCopyExporter',
+	'pgbatch': 'postgresexporter.PostgresBatchExporter',
 	'pgdump': 'postgresexporter.PostgresConsoleDumper',
 	'couch' : 'couchdbexporter.CouchDbExporter',
 	'mongo' : 'mongodbexporter.MongoDbExporter',
@@ -52,125 +64,258 @@ def first_file_match(file_pattern):
 	return matches[0] if len(matches) > 0 else None
 
 
-def parseArtists(parser, exporter):
+# entity: (handler module, handler class)
+entities = {
+	'artists': ('discogsartistparser', 'ArtistHandler'),
+	'labels': ('discogslabelparser', 'LabelHandler'),
+	'releases': ('discogsreleaseparser', 'ReleaseHandler'),
+	'masters': ('discogsmasterparser', 'MasterHandler'),
+	}
+
+# entities whose dumps can be cut into byte ranges for --jobs, with their record tag
+splittable = {
+	'artists': 'artist',
+	'releases': 'release',
+	}
+
+
+def dump_file(entity):
 	global options
-	artist_file = None
-	in_file = first_file_match('_artists.xml')
 	if options.date is not None:
-		artist_file = "discogs_%s_artists.xml" % options.date
-	elif in_file is not None:
-		artist_file = in_file
+		in_file = "discogs_%s_%s.xml" % (options.date, entity)
+		for suffix in ('', ) + discogsinput.COMPRESSED:
+			if path.exists(in_file + suffix):
+				return in_file + suffix
+		return in_file
+	return first_file_match('_%s.xml' % entity)
 
-	if artist_file is None:
-		#print "No artist file specified."
-		return
-	elif not path.exists(artist_file):
-		#print "File %s doesn't exist:" % artist_file
-		return
 
-	from discogsartistparser import ArtistHandler
-	artistHandler = ArtistHandler(exporter, stop_after=options.n, ignore_missing_tags = options.ignore_unknown_tags)
-	parser.setContentHandler(artistHandler)
-	try:
-		if artist_file.endswith(".gz"):
-			with gzip.open(artist_file) as f:
-				parser.parse(f)
-		else:
-			parser.parse(artist_file)
-	except ParserStopError as pse:
-		print "Parsed %d artists then stopped as requested." % pse.records_parsed
-#	except model.ParserStopError as pse22:
-#		print "Parsed %d artists then stopped as requested." % pse.records_parsed
-#	except Exception as ex:
-#		print "Raised unknown error"
-#		print type(ex)
+def make_handler(entity, exporter, stop_after):
+	global options
+	module_name, class_name = entities[entity]
+	module = __import__(module_name)
+	return getattr(module, class_name)(exporter, stop_after=stop_after, ignore_missing_tags=options.ignore_unknown_tags)
 
 
-def parseLabels(parser, exporter):
+def run_parser(parser, handler, source):
+	'''Parses source, a file name or file object, with the selected --parser-backend.'''
 	global options
-	label_file = None
-	in_file = first_file_match('_labels.xml')
-	if options.date is not None:
-		label_file = "discogs_%s_labels.xml" % options.date
-	elif in_file is not None:
-		label_file = in_file
-
-	if label_file is None:
-		#print "No label file specified."
+	if options.parser_backend == 'iterparse':
+		import discogsiterparser
+		discogsiterparser.parse(handler, source)
+	elif options.parser_backend == 'expat':
+		import discogsexpat
+		discogsexpat.parse(handler, source, options.buffer_size * 1024 * 1024)
+	else:
+		# expatreader keeps its pyexpat parser to itself, the Locator only tells lines and columns
+		handler.byteIndex = lambda: parser._parser.CurrentByteIndex
+		parser.setContentHandler(handler)
+		parser.parse(source)
+
+
+def parse(entity, parser, exporter):
+	'''Parses the dump of one entity, returns the number of records parsed.'''
+	global options
+	in_file = dump_file(entity)
+	if in_file is None:
+		#print "No %s file specified." % entity
 		return
-	elif not path.exists(label_file):
-		#print "File %s doesn't exist:" % label_file
+	elif not path.exists(in_file):
+		#print "File %s doesn't exist:" % in_file
 		return
 
-	from discogslabelparser import LabelHandler
-	labelHandler = LabelHandler(exporter, stop_after=options.n, ignore_missing_tags = options.ignore_unknown_tags)
-	parser.setContentHandler(labelHandler)
-	try:
-		if label_file.endswith(".gz"):
-			with gzip.open(label_file) as f:
-				parser.parse(f)
+	if options.jobs > 1 and entity in splittable:
+		if discogsinput.is_compressed(in_file):
+			print "Cannot split compressed %s, parsing it in a single job." % in_file
 		else:
-			parser.parse(label_file)
+			return parseParallel(entity, in_file)
+
+	handler = make_handler(entity, exporter, options.n)
+	if discogsmetrics.stages is not None:
+		discogsmetrics.instrument(handler)
+	state = None
+	if hasattr(exporter, 'on_commit') and options.parser_backend != 'iterparse':
+		handler.checkpoint = discogscheckpoint.Checkpoint(in_file, options.sanitize)
+		exporter.on_commit = handler.commitPoint
+		if options.resume:
+			try:
+				state = handler.checkpoint.load()
+			except ValueError as e:
+				print "Cannot resume: %s" % e
+				sys.exit(1)
+	if state is not None:
+		print "Resuming %s after %s %s, the %d. record." % (in_file, handler.record_tag, state['id'], state['records'])
+		if 'output' in state and hasattr(exporter, 'truncateOutput'):
+			exporter.truncateOutput(state['output'])
+		handler.resumed = True
+		source = handler.checkpoint.resume(state, entity, options.decompressor)
+	elif discogsinput.is_compressed(in_file) or options.sanitize:
+		source = discogsinput.open_dump(in_file, options.sanitize, options.decompressor)
+	elif options.parser_backend == 'iterparse' and options.progress > 0:
+		# iterparse does not tell how far it got, the file does
+		source = open(in_file, 'rb')
+	else:
+		source = None
+	if source is not None:
+		position = functools.partial(discogsinput.position, source)
+	else:
+		position = lambda: handler.byteIndex() if handler.byteIndex is not None else None
+	progress = discogsmetrics.Progress(in_file, handler, position, options.progress)
+	profile = None
+	if options.profile is not None:
+		profile = discogsprofile.Profile(options.profile, entity, options.profile_memory)
+		profile.start()
+	finished = False
+	try:
+		try:
+			run_parser(parser, handler, source if source is not None else in_file)
+			finished = True
+		finally:
+			if profile is not None:
+				# one write, the dumps of -c share stderr
+				sys.stderr.write("Profile of %s: %s\n" % (entity, ', '.join(profile.stop())))
+			# while the source can still tell where it stopped
+			summary = progress.stop(finished)
+			if report is not None:
+				report.add(summary)
+			if source is not None:
+				source.close()
 	except ParserStopError as pse:
-		print "Parsed %d labels then stopped as requested." % pse.records_parsed
+		jsonexporter.write_console("Parsed %d %s then stopped as requested.\n" % (pse.records_parsed, entity))
+	return handler.count
 
 
-def parseReleases(parser, exporter):
+def parseRange(job):
+	'''Parses one byte range of a dump in a worker process,
+	returns (records parsed, exit status, seconds per stage or None).'''
 	global options
-	release_file = None
-	in_file = first_file_match('_releases.xml')
-	if options.date is not None:
-		release_file = "discogs_%s_releases.xml" % options.date
-	elif in_file is not None:
-		release_file = in_file
-
-	if release_file is None:
-		#print "No release file specified."
-		return
-	elif not path.exists(release_file):
-		#print "File %s doesn't exist:" % release_file
+	entity, in_file, start, end, shard, stop_after = job
+	count, status = 0, 0
+	if discogsmetrics.stages is not None:
+		discogsmetrics.start_stages()
+	try:
+		exporter = make_exporter(options, shard=shard)
+		handler = make_handler(entity, exporter, stop_after)
+		if discogsmetrics.stages is not None:
+			discogsmetrics.instrument(handler)
+		try:
+			with discogsinput.open_dump(discogssplitter.RangeFile(in_file, start, end, entity), options.sanitize) as f:
+				run_parser(xml.sax.make_parser(), handler, f)
+		except ParserStopError:
+			pass
+		finally:
+			exporter.finish(completely_done=True)
+		count = handler.count
+	except SystemExit as e:
+		status = e.code if isinstance(e.code, int) else 1
+	except Exception:
+		traceback.print_exc()
+		status = 1
+	return (count, status, discogsmetrics.stage_seconds())
+
+
+def parseParallel(entity, in_file):
+	global options
+	ranges = discogssplitter.split(in_file, splittable[entity], options.jobs)
+	if len(ranges) == 0:
 		return
-
-	from discogsreleaseparser import ReleaseHandler
-	releaseHandler = ReleaseHandler(exporter, stop_after=options.n, ignore_missing_tags = options.ignore_unknown_tags)
-	parser.setContentHandler(releaseHandler)
+	stop_after = 0
+	if options.n:
+		stop_after = (options.n + len(ranges) - 1) / len(ranges)
+	jobs = [(entity, in_file, start, end, shard, stop_after) for shard, (start, end) in enumerate(ranges)]
+	started = time.time()
+	pool = multiprocessing.Pool(len(jobs))
+	discogsmetrics.enter('wait')
 	try:
-		if release_file.endswith(".gz"):
-			with gzip.open(release_file) as f:
-				parser.parse(f)
-		else:
-			parser.parse(release_file)
-	except ParserStopError as pse:
-		print "Parsed %d releases then stopped as requested." % pse.records_parsed
+		results = pool.map(parseRange, jobs)
+	finally:
+		discogsmetrics.leave()
+		pool.close()
+		pool.join()
+	count = sum(r[0] for r in results)
+	print "Parsed %d %s in %d jobs." % (count, entity, len(jobs))
+	if report is not None:
+		seconds = time.time() - started
+		size = path.getsize(in_file)
+		report.add({'dump': in_file, 'records': count, 'seconds': round(seconds, 3), 'jobs': len(jobs),
+				'records_per_second': round(count / max(seconds, 0.001), 1), 'size': size})
+		for r in results:
+			if r[2] is not None:
+				report.addStages(r[2])
+	status = max(r[1] for r in results)
+	if status:
+		sys.exit(status)
+	return count
+
+
+def parseEntity(entity, results):
+	'''Parses one dump in its own process with its own parser and exporter, for --concurrent.'''
+	global options
+	# the console is shared with the other dumps, keep lines whole
+	sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', 1)
+	jsonexporter.console_shared = True
+	count, status = 0, 0
+	if discogsmetrics.stages is not None:
+		discogsmetrics.start_stages()
+	try:
+		exporter = make_exporter(options)
+		try:
+			count = parse(entity, xml.sax.make_parser(), exporter)
+		finally:
+			exporter.finish(completely_done=True)
+	except SystemExit as e:
+		status = e.code if isinstance(e.code, int) else 1
+	except Exception:
+		traceback.print_exc()
+		status = 1
+	summaries = report.dumps if report is not None else []
+	results.put((entity, count, status, summaries, discogsmetrics.stage_seconds()))
+
+
+def parseConcurrently():
+	'''Runs every dump in its own process, returns the worst exit status.'''
+	results = multiprocessing.Queue()
+	workers = []
+	for entity in ('artists', 'labels', 'releases', 'masters'):
+		in_file = dump_file(entity)
+		if in_file is not None and path.exists(in_file):
+			worker = multiprocessing.Process(target=parseEntity, args=(entity, results), name=entity)
+			worker.start()
+			workers.append(worker)
+	parsed = dict((worker.name, (0, 1)) for worker in workers)
+	discogsmetrics.enter('wait')
+	for worker in workers:
+		entity, count, status, summaries, seconds = results.get()
+		parsed[entity] = (count, status)
+		if report is not None:
+			for summary in summaries:
+				report.add(summary)
+			if seconds is not None:
+				report.addStages(seconds)
+	discogsmetrics.leave()
+	for worker in workers:
+		worker.join()
+		if worker.exitcode:
+			parsed[worker.name] = (parsed[worker.name][0], worker.exitcode)
+	for entity, (count, status) in sorted(parsed.iteritems()):
+		print "Parsed %d %s%s." % (count, entity, ' (failed)' if status else '')
+	return max([status for count, status in parsed.itervalues()] or [0])
 
 
-def parseMasters(parser, exporter):
-	global options
-	master_file = None
-	in_file = first_file_match('_masters.xml')
-	if options.date is not None:
-		master_file = "discogs_%s_masters.xml" % options.date
-	elif in_file is not None:
-		master_file = in_file
+def parseArtists(parser, exporter):
+	parse('artists', parser, exporter)
 
-	if master_file is None:
-		#print "No masters file specified."
-		return
-	elif not path.exists(master_file):
-		#print "File %s doesn't exist:" % master_file
-		return
 
-	from discogsmasterparser import MasterHandler
-	masterHandler = MasterHandler(exporter, stop_after=options.n, ignore_missing_tags = options.ignore_unknown_tags)
-	parser.setContentHandler(masterHandler)
-	try:
-		if master_file.endswith(".gz"):
-			with gzip.open(master_file) as f:
-				parser.parse(f)
-		else:
-			parser.parse(master_file)
-	except ParserStopError as pse:
-		print "Parsed %d masters then stopped as requested." % pse.records_parsed
+def parseLabels(parser, exporter):
+	parse('labels', parser, exporter)
+
+
+def parseReleases(parser, exporter):
+	parse('releases', parser, exporter)
+
+
+def parseMasters(parser, exporter):
+	parse('masters', parser, exporter)
 
 
 
@@ -184,7 +329,16 @@ def select_exporter(options):
 	# should I be throwing an exception here?
 	return exporters['json']
 
-def make_exporter(options):
+def make_exporter(options, shard=None):
+	'''The exporter for the parser; with --workers, a pipeline to that many exporters.
+	Processes of --jobs get their own exporter, they are workers already.'''
+	if options.workers > 1 and shard is None:
+		import pipelineexporter
+		return pipelineexporter.PipelineExporter(functools.partial(make_output_exporter, options), options.workers)
+	return make_output_exporter(options, shard)
+
+
+def make_output_exporter(options, shard=None):
 	exp_module = select_exporter(options)
 
 	parts = exp_module.split('.')
@@ -193,7 +347,9 @@ def make_exporter(options):
 		m = getattr(m, parts[i])
 
 	data_quality = list(x.strip().lower() for x in (options.data_quality or '').split(',') if x)
-	return m(options.params, data_quality=data_quality)
+	if shard is None:
+		return m(options.params, data_quality=data_quality)
+	return m(options.params, data_quality=data_quality, shard=shard)
 
 
 
@@ -218,6 +374,19 @@ that --params is used, e.g.:
 	opt_parser.add_argument('-p', '--params', help='Parameters for output, e.g. connection string')
 	opt_parser.add_argument('-i', '--ignore-unknown-tags', action='store_true', dest='ignore_unknown_tags', help='Do not error out when encountering unknown tags')
 	opt_parser.add_argument('-q', '--quality', dest='data_quality', help='Comma-separated list of permissable data_quality values.')
+	opt_parser.add_argument('-c', '--concurrent', action='store_true', help='Parse each dump in its own process with its own exporter')
+	opt_parser.add_argument('-j', '--jobs', type=int, default=1, help='Parse the artists and releases dumps in this many processes, each with its own exporter')
+	opt_parser.add_argument('-w', '--workers', type=int, default=1, help='Store the records in this many exporter processes, each with its own connection, while parsing goes on')
+	opt_parser.add_argument('--serializer', choices=sorted(jsonexporter.serializers), default='json', help='JSON library for the json, mongo and couch outputs: json (default) or ujson')
+	opt_parser.add_argument('-s', '--sanitize', action='store_true', help='Strip the control characters that are invalid in XML while reading the dumps')
+	opt_parser.add_argument('--decompressor', help='External command decompressing .gz, .bz2 or .xz dumps as "COMMAND -dc FILE", e.g. pigz. Default is to decompress in a background thread')
+	opt_parser.add_argument('--parser-backend', choices=('sax', 'iterparse', 'expat'), default='sax', dest='parser_backend', help='sax (default), iterparse, which builds each record with lxml or cElementTree, or expat, which drives pyexpat directly')
+	opt_parser.add_argument('--buffer-size', type=int, default=8, dest='buffer_size', help='Size in MB of the chunks the expat backend feeds to the parser (default 8)')
+	opt_parser.add_argument('--progress', type=float, default=0, metavar='SECONDS', help='Print records/s, MB/s, how much of the dump is done and the ETA to stderr every SECONDS')
+	opt_parser.add_argument('--report', metavar='FILE', help='Write the rates of every dump and the seconds spent per stage (xml, model, serialize, hash, export) as JSON to FILE')
+	opt_parser.add_argument('--profile', metavar='DIR', help='Profile the parsing of each dump into DIR: ENTITY.pstats for pstats and ENTITY.collapsed, sampled stacks for flame graphs. Best with -n')
+	opt_parser.add_argument('--profile-memory', type=float, default=0, metavar='SECONDS', dest='profile_memory', help='With --profile, also take a tracemalloc snapshot every SECONDS and list the lines that allocated the most')
+	opt_parser.add_argument('--resume', action='store_true', help='Continue each dump after the checkpoint an interrupted import left in the current directory')
 	opt_parser.add_argument('file', nargs='*', help='Specific file(s) to import. Default is to parse artists, labels, releases matching -d')
 	global options
 	options = opt_parser.parse_args(argv)
@@ -227,15 +396,53 @@ that --params is used, e.g.:
 		opt_parser.print_help()
 		sys.exit(1)
 
-	exporter = make_exporter(options)
-	parser = xml.sax.make_parser()
 	try:
-		parseArtists(parser, exporter)
-		parseLabels(parser, exporter)
-		parseReleases(parser, exporter)
-		parseMasters(parser, exporter)
+		jsonexporter.use_serializer(options.serializer)
+	except ImportError as e:
+		opt_parser.error('--serializer %s: %s' % (options.serializer, e))
+
+	if options.profile is not None:
+		if options.jobs > 1:
+			opt_parser.error('--profile cannot be combined with --jobs, profile a single process with -n instead')
+		if options.profile_memory > 0:
+			try:
+				discogsprofile._tracemalloc()
+			except ImportError as e:
+				opt_parser.error('--profile-memory: %s' % e)
+	elif options.profile_memory > 0:
+		opt_parser.error('--profile-memory needs --profile')
+
+	if options.resume:
+		if options.jobs > 1 or options.workers > 1:
+			opt_parser.error('--resume cannot be combined with --jobs or --workers')
+		if options.parser_backend == 'iterparse':
+			opt_parser.error('--resume needs the sax or expat parser backend, which tell the byte offset of a record')
+
+	global report
+	if options.report is not None:
+		report = discogsmetrics.Report(argv)
+		discogsmetrics.start_stages()
+
+	failed = True
+	try:
+		if options.concurrent:
+			status = parseConcurrently()
+			failed = status != 0
+			sys.exit(status)
+
+		exporter = make_exporter(options)
+		parser = xml.sax.make_parser()
+		try:
+			parseArtists(parser, exporter)
+			parseLabels(parser, exporter)
+			parseReleases(parser, exporter)
+			parseMasters(parser, exporter)
+		finally:
+			exporter.finish(completely_done = True)
+		failed = False
 	finally:
-		exporter.finish(completely_done = True)
+		if report is not None:
+			report.write(options.report, failed)
 
 if __name__ == "__main__":
 	main(sys.argv[1:])
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''Profiles of the parsing of each dump, for --profile DIR:
+
+	DIR/releases.pstats     cProfile statistics, for pstats, snakeviz, gprof2dot...
+	DIR/releases.collapsed  the stacks of the parsing thread sampled every few milliseconds,
+	                        one "outer;...;inner count" line per stack, for flamegraph.pl or speedscope
+	DIR/releases.1.tracemalloc, ...  with --profile-memory, snapshots taken every so many seconds
+	DIR/releases.memory.txt          and the lines that allocated the most, and the most since the first
+'''
+
+import cProfile
+import os
+import sys
+import threading
+import time
+
+SAMPLE_INTERVAL = 0.005  # seconds
+TRACEBACK_DEPTH = 25  # frames tracemalloc keeps per allocation
+TOP_LINES = 30  # lines listed in .memory.txt
+
+
+def _tracemalloc():
+	try:
+		import tracemalloc  # Python 3.4+, or pytracemalloc on a patched Python 2.7
+	except ImportError:
+		raise ImportError('Memory profiles need the tracemalloc module, which is in Python 3.4 and later, '
+				'or pytracemalloc on Python 2.7')
+	return tracemalloc
+
+
+def _frame_name(code):
+	return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+class Profile(object):
+	'''Profiles what the current thread does between start() and stop().
+
+	memory: seconds between tracemalloc snapshots, 0 for none.'''
+	def __init__(self, directory, name, memory=0):
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		self.path = os.path.join(directory, name)
+		self.memory = memory
+		self.tracemalloc = _tracemalloc() if memory > 0 else None
+		self._profile = cProfile.Profile()
+		self._stacks = {}
+		self._snapshots = []  # their files
+		self._first = self._last = None  # the snapshots compared in .memory.txt
+		self._stopped = False
+		self._thread = None
+		self._target = None
+
+	def start(self):
+		self._target = threading.current_thread().ident
+		if self.tracemalloc is not None:
+			self.tracemalloc.start(TRACEBACK_DEPTH)
+		self._thread = threading.Thread(target=self._sample)
+		self._thread.daemon = True
+		self._thread.start()
+		self._profile.enable()
+
+	def _sample(self):
+		'''Counts the stacks of the profiled thread, and takes the memory snapshots.'''
+		snapshot_at = time.time() + self.memory
+		while not self._stopped:
+			time.sleep(SAMPLE_INTERVAL)
+			frame = sys._current_frames().get(self._target)
+			if frame is not None:
+				names = []
+				while frame is not None:
+					names.append(_frame_name(frame.f_code))
+					frame = frame.f_back
+				stack = ';'.join(reversed(names))
+				self._stacks[stack] = self._stacks.get(stack, 0) + 1
+			if self.tracemalloc is not None and time.time() >= snapshot_at:
+				self._snapshot()
+				snapshot_at += self.memory
+
+	def _snapshot(self):
+		path = '%s.%d.tracemalloc' % (self.path, len(self._snapshots) + 1)
+		self._last = self.tracemalloc.take_snapshot()
+		self._last.dump(path)
+		self._snapshots.append(path)
+		if self._first is None:
+			self._first = self._last
+
+	def stop(self):
+		'''Stops profiling and writes the files, returns their names.'''
+		self._profile.disable()
+		self._stopped = True
+		self._thread.join()
+		written = [self.path + '.pstats', self.path + '.collapsed']
+		self._profile.dump_stats(written[0])
+		with open(written[1], 'w') as f:
+			for stack, count in sorted(self._stacks.iteritems()):
+				f.write('%s %d\n' % (stack, count))
+		if self.tracemalloc is not None:
+			self._snapshot()
+			self.tracemalloc.stop()
+			written.extend(self._snapshots)
+			written.append(self.path + '.memory.txt')
+			self._writeMemory(written[-1])
+		return written
+
+	def _writeMemory(self, path):
+		with open(path, 'w') as f:
+			f.write('Allocated at the end, by line:\n')
+			for stat in self._last.statistics('lineno')[:TOP_LINES]:
+				f.write('%s\n' % stat)
+			if self._first is not self._last:
+				f.write('\nAllocated since the first snapshot, by line:\n')
+				for stat in self._last.compare_to(self._first, 'lineno')[:TOP_LINES]:
+					f.write('%s\n' % stat)
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''Cuts an uncompressed dump into byte ranges holding whole records, so the
+ranges can be parsed independently of each other.
+
+Records are only ever top level elements of the dump and text content has its
+'<' escaped, so a '<release ' or '<release>' in the file always starts a record.
+'''
+
+import os
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def _find(f, patterns, offset):
+	'''Offset of the first of patterns found at or after offset, or None.'''
+	overlap = max(len(p) for p in patterns) - 1
+	f.seek(offset)
+	tail = ''
+	while 1:
+		block = f.read(BLOCK_SIZE)
+		if not block:
+			return None
+		data = tail + block
+		found = [i for i in (data.find(p) for p in patterns) if i != -1]
+		if found:
+			return offset - len(tail) + min(found)
+		tail = data[-overlap:]
+		offset += len(block)
+
+
+def _rfind(f, pattern, size):
+	'''Offset of the last pattern in the file, or None.'''
+	end = size
+	head = ''
+	while end > 0:
+		start = max(0, end - BLOCK_SIZE)
+		f.seek(start)
+		data = f.read(end - start) + head
+		i = data.rfind(pattern)
+		if i != -1:
+			return start + i
+		head = data[:len(pattern) - 1]
+		end = start
+	return None
+
+
+def split(filename, tag, parts):
+	'''Returns up to parts (start, end) byte ranges of filename which together
+	hold every <tag> record of the file and nothing else.'''
+	size = os.path.getsize(filename)
+	patterns = ('<%s ' % tag, '<%s>' % tag)
+	close_tag = '</%s>' % tag
+	with open(filename, 'rb') as f:
+		last = _rfind(f, close_tag, size)
+		if last is None:
+			return []
+		end = last + len(close_tag)
+		starts = []
+		for i in xrange(parts):
+			start = _find(f, patterns, size * i / parts)
+			if start is not None and start < end and start not in starts:
+				starts.append(start)
+	return zip(starts, starts[1:] + [end])
+
+
+class RangeFile(object):
+	'''Read-only file object over a byte range, wrapped in a synthetic <root> element.'''
+	def __init__(self, filename, start, end, root):
+		self._f = open(filename, 'rb')
+		self._f.seek(start)
+		self._left = end - start
+		self._head = '<%s>' % root
+		self._tail = '</%s>' % root
+
+	def read(self, size=BLOCK_SIZE):
+		if self._head:
+			data, self._head = self._head, ''
+			return data
+		if self._left > 0:
+			data = self._f.read(min(size, self._left))
+			if data:
+				self._left -= len(data)
+				return data
+			self._left = 0
+		data, self._tail = self._tail, ''
+		return data
+
+	def close(self):
+		self._f.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
@@ -3,8 +3,6 @@ drop table releases_extraartists;
 drop table releases_formats;
 drop table format;
 drop table releases_images;
-drop table tmp_releases_images;
-drop table tmp_image;
 drop table releases_labels;
 drop table release;
 drop table tracks_artists;
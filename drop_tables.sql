@@ -1,19 +1,18 @@
-DROP TABLE tmp_artists_images;
 DROP TABLE artists_images;
 DROP TABLE artist;
 DROP TABLE country;
 DROP TABLE genre;
-DROP TABLE tmp_image;
-DROP TABLE tmp_labels_images;
 DROP TABLE labels_images;
 DROP TABLE releases_artists;
 DROP TABLE releases_extraartists;
 DROP TABLE releases_formats;
-DROP TABLE tmp_releases_images;
 DROP TABLE releases_images;
 DROP TABLE releases_labels;
 DROP TABLE release;
 DROP TABLE role;
+DROP TABLE style;
+DROP TABLE join_relation;
+DROP TABLE format_description;
 DROP TABLE track;
 DROP TABLE tracks_extraartists;
 DROP TABLE tracks_artists;
@@ -21,7 +20,6 @@ DROP TABLE masters_artists;
 DROP TABLE masters_artists_joins;
 DROP TABLE masters_extraartists;
 DROP TABLE masters_formats;
-DROP TABLE tmp_masters_images;
 DROP TABLE masters_images;
 DROP TABLE master;
 DROP TABLE format;
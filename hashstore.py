@@ -0,0 +1,390 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+'''Digests of the records of the previous import, for finding the ones that changed.
+
+A store file is a 24 byte header, the sorted record ids as little-endian unsigned
+32 bit integers and the digests in the same order:
+
+	'DXHS' | version | count | digest size | digest name | ids[count] | digests[count]
+
+The ids are loaded into an array (4 bytes per record) and searched with bisect,
+the digests are only read from the mmap when an id is found. Every id looked up
+is ticked off in a bitmap (1 bit per record), the ones left over at the end of a
+run are the records that are no longer in the dump.
+
+A record's digest is taken over its canonical encoding: compact JSON with sorted
+keys, so it does not depend on dict order or on the --serializer.
+
+SeenSet keeps 64 bit digests the same compact way, for the strings (image uris) an
+exporter has to write only once; two strings can share a digest, so it asks its
+owner about a string whose digest it has, when it can.
+'''
+
+from array import array
+from bisect import bisect_left
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+from discogsmetrics import timed
+
+MAGIC = 'DXHS'
+VERSION = 2
+_header = struct.Struct('<4sIII8s')
+_id_type = 'I' if array('I').itemsize == 4 else 'L'
+SEEN_BUCKET_BITS = 16
+_seen_key = struct.Struct('>Q')
+_seen_mask = (1 << (64 - SEEN_BUCKET_BITS)) - 1
+# 48 bits fit a double exactly where unsigned long has only 32
+_seen_type = 'L' if array('L').itemsize >= 8 else 'd'
+
+
+def _blake2b():
+	try:
+		blake2b = hashlib.blake2b
+	except AttributeError:
+		from pyblake2 import blake2b
+	return lambda data: blake2b(data, digest_size=8).digest()
+
+
+def _xxhash():
+	import xxhash
+	return lambda data: xxhash.xxh64(data).digest()
+
+
+# name: (digest size, function returning the digest function)
+digests = {
+	'md5': (16, lambda: lambda data: hashlib.md5(data).digest()),
+	'blake2b': (8, _blake2b),
+	'xxhash': (8, _xxhash),
+	}
+
+
+def canonical(doc):
+	'''The encoding of a record (as from jsonexporter.as_dict) that its digest is taken over.'''
+	return json.dumps(doc, sort_keys=True, separators=(',', ':'))
+
+
+class Hasher(object):
+	'''Digests records with the named digest, in a pool of processes when there are several.'''
+	def __init__(self, name='md5', processes=0):
+		if name not in digests:
+			raise ValueError("Unknown digest '%s', use one of %s" % (name, ', '.join(sorted(digests))))
+		self.name = name
+		self.size, make = digests[name]
+		try:
+			self._digest = make()
+		except ImportError as e:
+			raise ValueError("Digest '%s' is not available: %s" % (name, e))
+		self._pool = None
+		if processes > 1:
+			self._pool = multiprocessing.Pool(processes, _initPoolHasher, (name, ))
+
+	@timed('hash')
+	def digests(self, docs):
+		'''The digests of docs, in the same order.'''
+		if self._pool is not None and len(docs) > 1:
+			return self._pool.map(_poolDigest, docs, chunksize=max(1, len(docs) / (4 * len(self._pool._pool))))
+		digest = self._digest
+		return [digest(canonical(doc)) for doc in docs]
+
+	def close(self):
+		if self._pool is not None:
+			self._pool.close()
+			self._pool.join()
+			self._pool = None
+
+
+_pool_digest = None
+
+
+def _initPoolHasher(name):
+	global _pool_digest
+	_pool_digest = digests[name][1]()
+
+
+def _poolDigest(doc):
+	return _pool_digest(canonical(doc))
+
+
+def _ids_from_string(data):
+	ids = array(_id_type)
+	ids.fromstring(data)
+	if sys.byteorder != 'little':
+		ids.byteswap()
+	return ids
+
+
+def _ids_to_string(ids):
+	if sys.byteorder != 'little':
+		ids = array(_id_type, ids)
+		ids.byteswap()
+	return ids.tostring()
+
+
+class HashStore(object):
+	'''The digests of one collection: get() answers from the store file as it was
+	opened, put() collects the digests of this run, save() merges both into the file.
+
+	A store file written with another digest is ignored, and replaced on save().'''
+	def __init__(self, path, digest='md5'):
+		self.path = path
+		self.digest = digest
+		self.digest_size = digests[digest][0]
+		self._new_ids = array(_id_type)
+		self._new_digests = bytearray()
+		self._new_sorted = True
+		self._open()
+
+	def _open(self):
+		self._map = None
+		self._ids = array(_id_type)
+		self._seen = bytearray()
+		self._drop_missing = False
+		self._digests_at = 0
+		self._next = 0
+		if not os.path.exists(self.path) or os.path.getsize(self.path) < _header.size:
+			return
+		with open(self.path, 'rb') as f:
+			magic, version, count, digest_size, digest = _header.unpack(f.read(_header.size))
+			if magic != MAGIC:
+				raise ValueError('%s is not a hash store' % self.path)
+			digest = digest.rstrip('\0')
+			if version != VERSION or digest != self.digest:
+				print '%s holds %s digests, every record counts as changed and gets %s digests.' % (
+						self.path, digest if version == VERSION else 'older', self.digest)
+				return
+			if count == 0:
+				return
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		self._ids = _ids_from_string(self._map[_header.size:_header.size + 4 * count])
+		self._seen = bytearray((count + 7) // 8)
+		self._digests_at = _header.size + 4 * count
+
+	def __len__(self):
+		return len(self._ids)
+
+	def index(self, id):
+		'''Position of id in the store file, or -1.'''
+		ids = self._ids
+		# the dumps are mostly in id order, so try right after the last hit first
+		i = self._next
+		if not (i < len(ids) and ids[i] == id):
+			i = bisect_left(ids, id)
+			if not (i < len(ids) and ids[i] == id):
+				return -1
+		self._next = i + 1
+		self._seen[i >> 3] |= 1 << (i & 7)
+		return i
+
+	def digest_at(self, i):
+		return self._digests(i, i + 1)
+
+	def _digests(self, i, k):
+		'''The digests of the store file from position i up to k, as one string.'''
+		return self._map[self._digests_at + i * self.digest_size:self._digests_at + k * self.digest_size]
+
+	def get(self, id):
+		'''The stored digest of id, or None.'''
+		i = self.index(id)
+		if i == -1:
+			return None
+		return self.digest_at(i)
+
+	def put(self, id, digest):
+		if len(self._new_ids) and id <= self._new_ids[-1]:
+			self._new_sorted = False
+		self._new_ids.append(id)
+		self._new_digests.extend(digest)
+
+	def dirty(self):
+		return len(self._new_ids) > 0 or self._drop_missing
+
+	def missing(self):
+		'''The ids of the store file that were not looked up since it was opened.'''
+		ids = self._ids
+		missing = array(_id_type)
+		for b, bits in enumerate(self._seen):
+			if bits != 0xff:
+				for i in xrange(b * 8, min(b * 8 + 8, len(ids))):
+					if not bits & (1 << (i & 7)):
+						missing.append(ids[i])
+		return missing
+
+	def drop_missing(self):
+		'''Leaves the missing() ids out of the file on save(), once they were deleted.'''
+		self._drop_missing = True
+
+	def _kept(self, i, k):
+		'''The runs of store file positions from i up to k that save() keeps.'''
+		if not self._drop_missing:
+			if i < k:
+				yield i, k
+			return
+		seen = self._seen
+		start = None
+		p = i
+		while p < k:
+			if p & 7 == 0 and p + 8 <= k and seen[p >> 3] in (0, 0xff):
+				step = 8
+				kept = seen[p >> 3] == 0xff
+			else:
+				step = 1
+				kept = seen[p >> 3] & (1 << (p & 7))
+			if kept:
+				if start is None:
+					start = p
+			elif start is not None:
+				yield start, p
+				start = None
+			p += step
+		if start is not None:
+			yield start, k
+
+	def _merged(self):
+		'''Yields what makes up the new store, in id order: (i, k, None) for the ids and digests
+		of the store file from position i up to k, (None, None, j) for the j-th put() of this run.'''
+		new_ids = self._new_ids
+		order = xrange(len(new_ids))
+		if not self._new_sorted:
+			order = sorted(order, key=new_ids.__getitem__)  # stable, so the last put of an id wins
+		old_ids = self._ids
+		i = 0
+		last = len(order) - 1
+		for n, j in enumerate(order):
+			id = new_ids[j]
+			if n < last and new_ids[order[n + 1]] == id:
+				continue
+			k = bisect_left(old_ids, id, i)
+			for run in self._kept(i, k):
+				yield run + (None, )
+			yield None, None, j
+			i = k + 1 if k < len(old_ids) and old_ids[k] == id else k
+		for run in self._kept(i, len(old_ids)):
+			yield run + (None, )
+
+	def save(self):
+		'''Writes the merged store to the file, if anything was put, and reopens it.'''
+		if not self.dirty():
+			return
+		if len(self._ids) == 0 and self._new_sorted and self._new_ids:
+			# first import, in id order: the store is what was put
+			self._write(self._new_ids, (self._new_digests, ))
+		else:
+			self._write(self._mergedIds(), self._mergedDigests())
+		self.close()
+		os.rename(self.path + '.tmp', self.path)
+		self._new_ids = array(_id_type)
+		self._new_digests = bytearray()
+		self._new_sorted = True
+		self._open()
+
+	def _mergedIds(self):
+		ids = array(_id_type)
+		for i, k, j in self._merged():
+			if j is None:
+				ids.extend(self._ids[i:k])
+			else:
+				ids.append(self._new_ids[j])
+		return ids
+
+	def _mergedDigests(self):
+		size = self.digest_size
+		for i, k, j in self._merged():
+			if j is None:
+				yield self._digests(i, k)
+			else:
+				yield self._new_digests[j * size:(j + 1) * size]
+
+	def _write(self, ids, digests):
+		with open(self.path + '.tmp', 'wb') as f:
+			f.write(_header.pack(MAGIC, VERSION, len(ids), self.digest_size, self.digest))
+			f.write(_ids_to_string(ids))
+			for chunk in digests:
+				f.write(chunk)
+
+	def close(self):
+		if self._map is not None:
+			self._map.close()
+			self._map = None
+
+
+class SeenSet(object):
+	'''A set of strings that keeps 8 bytes per member: the first 64 bits of its md5.
+
+	The top 16 bits pick one of 65536 buckets, each a sorted array of the other 48,
+	so adding a string costs a bisect and a short insert, and nothing is merged.
+
+	On its own the set is probabilistic: a string that shares its digest with one
+	added before counts as added too. With confirm(key), which tells whether key
+	itself was added (e.g. by looking for it in the database), it is exact; the
+	strings confirm() was asked about are then kept in full, so it is asked once each.'''
+	def __init__(self, confirm=None):
+		self._buckets = [None] * (1 << SEEN_BUCKET_BITS)
+		self._len = 0
+		self.confirm = confirm
+		self._confirmed = set()
+
+	def __len__(self):
+		return self._len
+
+	def add(self, key):
+		'''Adds key, returns whether it was not in the set yet.'''
+		data = key.encode('utf-8') if isinstance(key, unicode) else key
+		h, = _seen_key.unpack_from(hashlib.md5(data).digest())
+		bucket, low = h >> (64 - SEEN_BUCKET_BITS), h & _seen_mask
+		values = self._buckets[bucket]
+		if values is None:
+			self._buckets[bucket] = array(_seen_type, [low])
+		else:
+			i = bisect_left(values, low)
+			if i < len(values) and values[i] == low:
+				if self.confirm is None or data in self._confirmed:
+					return False
+				self._confirmed.add(data)
+				if self.confirm(key):
+					return False
+				# another string with the same digest, the bucket has that already
+				self._len += 1
+				return True
+			values.insert(i, low)
+		self._len += 1
+		return True
+
+
+def convert_md5(md5_path, store_path):
+	'''Writes the "id:hexdigest" lines of an .md5 file of the mongo exporter as a store file.
+
+	Those were taken over a non-canonical encoding, so a converted store finds no
+	record unchanged, but the ids it holds are still good for finding deleted records.'''
+	store = HashStore(store_path, 'md5')
+	with open(md5_path, 'rb') as f:
+		while 1:
+			lines = f.readlines(1024 * 1024)
+			if not lines:
+				break
+			for line in lines:
+				line = line.rstrip('\r\n')
+				if line:
+					id, hex_digest = line.split(':')
+					store.put(int(id), hex_digest.decode('hex'))
+	store.save()
+	store.close()
+	return len(store)
@@ -1,21 +1,87 @@
 import json
+import multiprocessing
+import sys
+from types import InstanceType
+from discogsmetrics import timed
 
-def jsonizer(obj, specify_object_type = True):
-	'''Assists in serializing models to JSON.
 
-	>>> json.dumps(an_artist, default=jsonizer)
-	'{"_type" : "Artist", "name" : ...
+@timed('serialize')
+def as_dict(obj, specify_object_type = True):
+	'''Converts a model, with the models in it, to dicts and lists any serializer or database driver takes.
+
+	>>> as_dict(an_artist)
+	{'object_type_name': 'Artist', 'name': ...
 	'''
+	return _as_dict(obj, specify_object_type)
+
+
+def _as_dict(obj, specify_object_type):
+	# object_type_name first, then the attributes, so that the keys come out in the
+	# order of the json.dumps(default=...) hook this replaced, and the digests of uniq= stay the same
 	j_dict = {}
 	if specify_object_type:
 		j_dict['object_type_name'] = obj.__class__.__name__
 	j_dict.update(obj.__dict__)
-	return j_dict 
+	for key, value in obj.__dict__.iteritems():
+		t = type(value)
+		if t is list or t is tuple or t is InstanceType:
+			j_dict[key] = _plain(value, specify_object_type)
+	return j_dict
+
+
+def _plain(value, specify_object_type):
+	t = type(value)
+	if t is list or t is tuple:
+		return [_plain(v, specify_object_type) for v in value]
+	if t is InstanceType:
+		return _as_dict(value, specify_object_type)
+	return value
+
+
+def _ujson():
+	import ujson
+	return ujson.dumps
+
+
+serializers = {
+	'json': lambda: json.dumps,
+	'ujson': _ujson,
+	}
+
+_dumps = json.dumps
+
+
+def use_serializer(name):
+	'''Selects the JSON library dumps() uses; raises ImportError when it is not installed.'''
+	global _dumps
+	_dumps = serializers[name]()
+
+
+@timed('serialize')
+def dumps(what):
+	'''Serializes plain dicts and lists, e.g. from as_dict(), to one line of JSON.'''
+	return _dumps(what)
+
+
+# the processes of -c, -j and -w share the console, and a write is only atomic on a
+# pipe up to PIPE_BUF (4096 bytes), less than a long release; made before they fork
+console_lock = multiprocessing.Lock()
+# set in the processes of -c, whose exporters have no shard but share the console all the same
+console_shared = False
+
+
+def write_console(text):
+	'''Writes text to stdout in one piece, whatever the other processes write.'''
+	with console_lock:
+		sys.stdout.write(text)
+		sys.stdout.flush()
 
 
 class JsonConsoleExporter:
-	def __init__(self, params, data_quality=[]):
+	def __init__(self, params, data_quality=[], shard=None):
 		self.min_data_quality = data_quality
+		# several processes share the console, see write_console()
+		self.shared = shard is not None or console_shared
 	
 	def good_quality(self, what):
 		if len(self.min_data_quality):
@@ -26,13 +92,19 @@ class JsonConsoleExporter:
 		if not self.good_quality(what):
 			return
 		j = self._store(what)
-		print j
+		if not self.shared:
+			print j
+		else:
+			write_console(j + '\n')
 		
+	def completed(self, entity):
+		pass
+
 	def finish(self, completely_done = False):
 		pass
 	
 	def _store(self, what):
-		return json.dumps(what, default=jsonizer)
+		return dumps(as_dict(what))
 
 	def storeArtist(self, artist):
 		self.dump(artist)
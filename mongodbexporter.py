@@ -1,75 +1,123 @@
 from datetime import date
-from hashlib import md5
-from jsonexporter import jsonizer as _jsonizer
-import json
+from jsonexporter import as_dict, dumps
 import os
+import hashstore
 import pymongo
+import time
+import urllib
 import urlparse
 
-
-def jsonizer(obj):
-	return _jsonizer(obj, specify_object_type=False)
+BATCH_SIZE = 1000
+OWN_OPTIONS = ('uniq', 'hashers', 'batch', 'window')
 
 
 class _MongoImportFile(object):
-	def __init__(self, name, path):
+	def __init__(self, name, path, shard=None):
 		self._path = os.path.abspath(os.path.expanduser(path))
+		if shard is not None:
+			name = '%s.%s' % (name, shard)
 		self._fname = os.path.join(self._path, name + '.json')
 		self._previous_md5_fname = os.path.join(self._path, name + '_previous.md5')
 		self._f = open(self._fname, 'a')
 
 	def update(self, id_dict, content, **kwargs):
-		line = json.dumps(content)
-		lines = line.splitlines()
-		if (len(lines) > 1):
-			line = ' '.join(lines)
-		self._f.writelines((line, '\n'))
-		#print '>%s: %s' % (self._fname, line)
+		# JSON serializers escape line breaks inside strings, so this is always one line
+		self._f.write(dumps(content) + '\n')
+
+	def initialize_unordered_bulk_op(self):
+		return _MongoImportBulk(self)
+
+	def remove(self, spec):
+		# mongoimport only adds, whoever loads the file drops the ids of these tombstones
+		today = "%s" % date.today()
+		for id in spec['id']['$in']:
+			self._f.write(dumps({'id': id, 'deleted': True, 'updated_on': today}) + '\n')
 
 	def ensure_index(self, name, *args, **kwargs):
 		pass
 
+	def flush(self):
+		self._f.flush()
+
+	def size(self):
+		'''How long the file is with everything written to it so far.'''
+		self._f.flush()
+		return os.fstat(self._f.fileno()).st_size
+
 	def close(self):
-		pass
 		if self._f is not None and not self._f.closed:
 			self._f.close()
-		if self._md5 is not None and not self._md5.closed:
-			self._md5.close()
+
+
+class _MongoImportBulk(object):
+	'''The part of pymongo's BulkOperationBuilder used for upserts, writing to a _MongoImportFile.'''
+	def __init__(self, import_file):
+		self._file = import_file
+		self._docs = []
+
+	def find(self, selector):
+		return self
+
+	def upsert(self):
+		return self
+
+	def replace_one(self, doc):
+		self._docs.append(doc)
+
+	def execute(self):
+		for doc in self._docs:
+			self._file.update({'id': doc['id']}, doc, upsert=True)
+		# the batch counts as written once it is out of our buffers, see on_commit
+		self._file.flush()
+		return {'nUpserted': len(self._docs), 'writeErrors': []}
 
 
 class _MongoImportFileSetConnectionMock(object):
-	def __init__(self, *args):
-		self._files = args
+	def __init__(self, file_set):
+		self._file_set = file_set
 
 	def disconnect(self, *args):
-		for open_file in (f for f in self._files if f is not None):
-			# close the files
-			try:
-				open_file.close()
-			except ValueError:
-				pass
+		self._file_set.close()
 
 
 class _MongoImportFileSet(object):
 	'''Interface to a set of mongo import files providing almost the same interface as mongoConnection[db_name] does.'''
-	def __init__(self, base_path):
+	def __init__(self, base_path, shard=None):
 		self._path = base_path
+		self._shard = shard
 		self._files = {}
 		self._artists = None
 		self._labels = None
 		self._releases = None
 		self._masters = None
 		self.collection_names = lambda: ('artists', 'labels', 'releases', 'masters')
-		self.connection = _MongoImportFileSetConnectionMock(*(self._artists, self._labels, self._releases, self._masters))
+		self.connection = _MongoImportFileSetConnectionMock(self)
 
 	def __getitem__(self, key):
 		if key in self.collection_names():
 			attr = self.__dict__['_' + key]
 			if attr is None:
-				attr = _MongoImportFile(key, self._path)
+				attr = _MongoImportFile(key, self._path, self._shard)
+				self.__dict__['_' + key] = attr
 			return attr
 		raise IndexError('Invalid key: %s' % key)
 
+	def sizes(self):
+		'''The length of each file written to, by path.'''
+		sizes = {}
+		for key in self.collection_names():
+			open_file = self.__dict__['_' + key]
+			if open_file is not None:
+				sizes[open_file._fname] = open_file.size()
+		return sizes
+
+	def close(self):
+		for key in self.collection_names():
+			open_file = self.__dict__['_' + key]
+			if open_file is not None:
+				open_file.close()
+				self.__dict__['_' + key] = None
+
 	def __getattr__(self, name):
 		if name in self.collection_names():
 			return self[name]
@@ -78,73 +126,93 @@ class _MongoImportFileSet(object):
 
 
 class _IdHashPairs(object):
-	'''Cache of the current records in the database indexed by id'''
-	def __init__(self, path):
+	'''Digests of the records currently in the database, by collection and id'''
+	def __init__(self, path, digest='md5', hashers=0):
 		self._path = os.path.abspath(os.path.expanduser(path))
-		self._hashes = {'artists': None, 'labels': None, 'releases': None, 'masters': None}
-		self._name = lambda x: os.path.join(self._path, '%s.md5' % x)
+		self._hasher = hashstore.Hasher(digest, hashers)
+		self._stores = {}
+
+	def _store(self, name):
+		store = self._stores.get(name)
+		if store is None:
+			fname = os.path.join(self._path, '%s.hashes' % name)
+			md5_name = os.path.join(self._path, '%s.md5' % name)
+			if not os.path.exists(fname) and os.path.exists(md5_name):
+				print 'Converting %s to %s.' % (md5_name, fname)
+				hashstore.convert_md5(md5_name, fname)
+			store = self._stores[name] = hashstore.HashStore(fname, self._hasher.name)
+		return store
+
+	def changed(self, collection, ids, docs):
+		'''The (position, digest) of the docs which are not in the database as they are.'''
+		store = self._store(collection)
+		return [(i, digest) for i, (id, digest) in enumerate(zip(ids, self._hasher.digests(docs)))
+				if store.get(int(id)) != digest]
+
+	def process(self, collection, id, digest):
+		self._store(collection).put(int(id), digest)
+
+	def missing(self, collection):
+		'''The ids of the previous import that did not come by in this one; they are
+		left out of the hash file on finish(), so the caller has to delete them.'''
+		store = self._store(collection)
+		missing = store.missing()
+		store.drop_missing()
+		return missing
 
-	def _load(self, name):
-		if self._hashes[name] is None:
-			try:
-				fname = self._name(name)
-				with open(fname, 'rb') as f:
-					name_hash = {}
-					while 1:
-						lines = f.readlines(10000)
-						if not lines:
-							break
-						for line in lines:
-							line = line.rstrip('\r\n')
-							old_id, md5 = line.split(':')
-							name_hash[int(old_id)] = md5
-					self._hashes[name] = name_hash
-			except IOError as e:
-				self._hashes[name] = {}
-
-	def _one_line(self, line):
-		lines = line.splitlines()
-		return ' '.join(lines) if (len(lines) > 1) else line
-
-	def is_uniq(self, collection, id, json_string):
-		self._load(collection)
-		new_md5 = md5(self._one_line(json_string)).hexdigest()
-		i_id = int(id)
-		if i_id in self._hashes[collection]:
-			old_md5 = self._hashes[collection][i_id]
-			if new_md5 == old_md5:
-				return (False, new_md5)
-			else:
-				return (True, new_md5)
-		else:
-			return (True, new_md5)
-
-	def process(self, collection, id, md5_digest):
-		self._load(collection)
-		i_id = int(id)
-		self._hashes[collection][i_id] = md5_digest
-
-	def finish(self):
+	def finish(self, completely_done=False):
 		# write hashes back to disk
-		for name in self._hashes:
+		for name, store in self._stores.iteritems():
 			try:
-				fname = self._name(name)
-				if self._hashes[name]:
-					with open(fname, 'w') as f:
-						for id, hash in self._hashes[name].iteritems():
-							f.writelines(('%s:%s' % (id, hash), '\n'))
-			except IOError as e:
+				store.save()
+			except (IOError, OSError) as e:
 				print 'IOError writing out %s: %s' % (name, e)
+		if completely_done:
+			self._hasher.close()
+
+
+class _PendingUpserts(object):
+	'''Documents of one collection waiting to be sent in one unordered bulk upsert.'''
+	def __init__(self):
+		self.ids = []
+		self.docs = []
+		self.started = None
+
+	def __len__(self):
+		return len(self.docs)
+
+	def append(self, id, doc):
+		if self.started is None:
+			self.started = time.time()
+		self.ids.append(id)
+		self.docs.append(doc)
 
 
 class MongoDbExporter(object):
-	def __init__(self, mongo_uri, data_quality=[]):
-		'''mongo_uri: mongodb://[username:password@]host1[:port1],...[,hostN[:portN]][/[database][?options]]'''
+	on_commit = None  # called after every bulk upsert, see discogshandler.PathHandler.commitPoint
+
+	def __init__(self, mongo_uri, data_quality=[], shard=None):
+		'''mongo_uri: mongodb://[username:password@]host1[:port1],...[,hostN[:portN]][/[database][?options]]
+
+		Records are sent in unordered bulk upserts of ?batch=N documents (default 1000),
+		or of what came in ?window=SECONDS, whichever is reached first.
+
+		?uniq=md5 (or blake2b or xxhash) only sends the records whose digest changed
+		since the previous import, ?hashers=N takes the digests in N processes.
+
+		shard: set when several exporters write the same dump at once. A file://
+		export then writes e.g. releases.3.json instead of releases.json.'''
 		# TODO: if uri is file://path/ - create a json dump for using with mongo import
 		self.min_data_quality = data_quality
 		self._options = {}
 		self._quick_uniq = None
+		self._shard = shard
+		self._pending = {}
 		self.connect(mongo_uri)
+		self._batch_size = int(self._options.get('batch', [BATCH_SIZE])[0])
+		self._window = float(self._options.get('window', [0])[0])
+		if shard is not None and self._quick_uniq is not None:
+			raise ValueError("?uniq keeps a single hash file per collection and cannot be used by several exporters at once")
 		# don't submit to mongo values that already exist - faster to compute it here then in mongo
 
 	def connect(self, mongo_uri):
@@ -154,9 +222,8 @@ class MongoDbExporter(object):
 			path = u.path
 			self._options = urlparse.parse_qs(u.query) if u.query else {}
 			path = u.netloc + path
-			self.db = _MongoImportFileSet(path)
-			if 'uniq' in self._options and 'md5' in self._options['uniq']:
-				self._quick_uniq = _IdHashPairs(path)
+			self.db = _MongoImportFileSet(path, self._shard)
+			self._quick_uniq = self._idHashPairs(path)
 		elif u.scheme == 'mongodb':
 			if '?' in u.path and u.query == '':
 				#url didn't parse it properly u.path is '/dbname?options
@@ -164,24 +231,25 @@ class MongoDbExporter(object):
 				self._options = urlparse.parse_qs(self._options) if self._options else {}
 			else:
 				db_name = u.path
+				self._options = urlparse.parse_qs(u.query) if u.query else {}
 			if db_name.startswith('/'):
 				db_name = db_name[1:]
+			# pymongo refuses options it does not know
+			mongo_options = [(k, v) for k, values in self._options.iteritems() for v in values if k not in OWN_OPTIONS]
+			mongo_uri = urlparse.urlunparse((u.scheme, u.netloc, '/' + db_name, '', urllib.urlencode(mongo_options), ''))
 			#print 'Connecting to db %s on %s with options.' % (db_name, mongo_uri, options)
 			mongo = pymongo.Connection(mongo_uri)
 			self.db = mongo[db_name]
-			if 'uniq' in self._options and 'md5' in self._options['uniq']:
-				self._quick_uniq = False
+			# the hashes of a direct import are kept in the current directory
+			self._quick_uniq = self._idHashPairs('.')
 		else:
 			raise ValueError("Invalid URI scheme: '%s'. Can only accept 'file' or 'mongodb'" % u.scheme)
 
-	def _is_uniq(self, collection, id, json_string):
-		if self._quick_uniq is not None:
-			return self._quick_uniq.is_uniq(collection, id, json_string)
-		return (True, None)
-
-	def _store_processed(self, collection, id, md5_digest):
-		if self._quick_uniq is not None:
-			self._quick_uniq.process(collection, id, md5_digest)
+	def _idHashPairs(self, path):
+		if 'uniq' not in self._options:
+			return None
+		hashers = int(self._options.get('hashers', [0])[0])
+		return _IdHashPairs(path, self._options['uniq'][0], hashers)
 
 	def good_quality(self, what):
 		if len(self.min_data_quality):
@@ -192,20 +260,85 @@ class MongoDbExporter(object):
 		if not self.good_quality(what):
 			# print "Bad quality: %s for %s" % (what.data_quality, what.id)
 			return
-		# have to convert it to json and back because
-		# on simple objects couchdb-python throws:
-		# TypeError: argument of type 'instance' is not iterable
-		# and on dicts:
-		# AttributeError: 'dict' object has no attribute 'read'
-		json_string = json.dumps(what, default=jsonizer)
-		uniq, md5 = self._is_uniq(collection, what.id, json_string)
-		if uniq:
-			doc = json.loads(json_string)
-			doc['updated_on'] = "%s" % date.today()
-			self.db[collection].update({'id': what.id}, doc, upsert=True)
-			self._store_processed(collection, what.id, md5)
+		pending = self._pending.setdefault(collection, _PendingUpserts())
+		pending.append(what.id, as_dict(what, specify_object_type=False))
+		if len(pending) >= self._batch_size or (self._window and time.time() - pending.started >= self._window):
+			self.flush(collection)
+			if self.on_commit is not None:
+				self.on_commit()
+
+	def flush(self, collection):
+		'''Sends the pending documents of collection in one unordered bulk upsert.'''
+		pending = self._pending.pop(collection, None)
+		if pending is None or len(pending) == 0:
+			return
+		if self._quick_uniq is not None:
+			changed = self._quick_uniq.changed(collection, pending.ids, pending.docs)
+			if len(changed) < len(pending):
+				pending.ids = [pending.ids[i] for i, digest in changed]
+				pending.docs = [pending.docs[i] for i, digest in changed]
+				if len(pending) == 0:
+					return
+			digests = [digest for i, digest in changed]
+		else:
+			digests = [None] * len(pending)
+		today = "%s" % date.today()
+		bulk = self.db[collection].initialize_unordered_bulk_op()
+		for id, doc in zip(pending.ids, pending.docs):
+			doc['updated_on'] = today
+			bulk.find({'id': id}).upsert().replace_one(doc)
+		failed = {}
+		try:
+			bulk.execute()
+		except pymongo.errors.BulkWriteError as bwe:
+			for error in bwe.details.get('writeErrors', []):
+				failed[pending.ids[error['index']]] = error.get('errmsg')
+			if not failed:
+				raise
+		if failed:
+			print 'Upserting %d of %d %s failed, ids: %s' % (len(failed), len(pending), collection,
+					', '.join(str(id) for id in sorted(failed)))
+			for message in sorted(set(failed.itervalues())):
+				print '  %s' % message
+		if self._quick_uniq is not None:
+			for id, digest in zip(pending.ids, digests):
+				if id not in failed:
+					self._quick_uniq.process(collection, id, digest)
+
+	def committedOutput(self):
+		'''For the checkpoint of --resume: the length of the files of a file:// export.'''
+		if isinstance(self.db, _MongoImportFileSet):
+			return self.db.sizes()
+		return None
+
+	def truncateOutput(self, sizes):
+		'''Cuts the files of a file:// export back to their length at the checkpoint a resumed
+		import starts from, as the records written after it are written again.'''
+		for path, size in sizes.iteritems():
+			if os.path.exists(path) and os.path.getsize(path) > size:
+				print 'Cutting %s back to the %d bytes of the checkpoint.' % (path, size)
+				with open(path, 'r+b') as f:
+					f.truncate(size)
+
+	def completed(self, entity):
+		'''With ?uniq=, deletes the records of the previous import that the dump no longer has.
+		A file:// export writes a tombstone line {"id": ..., "deleted": true} for each instead.'''
+		if self._quick_uniq is None:
+			return
+		collection = entity + 's'
+		self.flush(collection)
+		missing = self._quick_uniq.missing(collection)
+		if len(missing) == 0:
+			return
+		print 'Deleting %d %s that are no longer in the dump.' % (len(missing), collection)
+		for start in xrange(0, len(missing), self._batch_size):
+			self.db[collection].remove({'id': {'$in': list(missing[start:start + self._batch_size])}})
 
 	def finish(self, completely_done=False):
+		for collection in self._pending.keys():
+			self.flush(collection)
+		if self.on_commit is not None:
+			self.on_commit()
 		collections = self.db.collection_names()
 		if 'artists' in collections:
 			#self.db.artists.('id', background=True)
@@ -227,7 +360,7 @@ class MongoDbExporter(object):
 			self.db.masters.ensure_index('main_release', background=True, unique=True)
 		self.db.connection.disconnect()
 		if self._quick_uniq is not None:
-			self._quick_uniq.finish()
+			self._quick_uniq.finish(completely_done)
 
 	def storeLabel(self, label):
 		label.l_name = label.name.lower()
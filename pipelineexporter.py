@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import multiprocessing
+import Queue
+import sys
+import traceback
+
+BATCH_SIZE = 100  # records per queue item
+BATCHES_PER_WORKER = 4  # queued batches per worker before the parser has to wait
+
+
+def _work(make_exporter, shard, batches, errors):
+	'''Worker process: stores the batches of records with its own exporter until it gets None.'''
+	try:
+		exporter = make_exporter(shard)
+		while 1:
+			batch = batches.get()
+			if batch is None:
+				break
+			for method, record in batch:
+				getattr(exporter, method)(record)
+		exporter.finish(completely_done=True)
+	except BaseException:
+		errors.put('Exporter worker %d failed:\n%s' % (shard, traceback.format_exc()))
+
+
+class PipelineExporter(object):
+	'''Hands the parsed records to a pool of worker processes, each storing them
+	with its own exporter (and so its own connection), while the parser goes on.
+
+	The queue between the two is bounded, so a parser that is faster than the
+	exporters waits instead of piling up records in memory. The first error of
+	a worker is raised in the parsing process as a WorkerError.
+	'''
+	class WorkerError(Exception):
+		pass
+
+	def __init__(self, make_exporter, workers, first_shard=0, batch_size=BATCH_SIZE):
+		'''make_exporter(shard) returns the exporter of one worker.'''
+		self.batch_size = batch_size
+		self.batch = []
+		self.failed = False
+		self.batches = multiprocessing.Queue(workers * BATCHES_PER_WORKER)
+		self.errors = multiprocessing.Queue()
+		self.workers = []
+		# or the workers would print what is still buffered again
+		sys.stdout.flush()
+		for shard in xrange(first_shard, first_shard + workers):
+			worker = multiprocessing.Process(target=_work, args=(make_exporter, shard, self.batches, self.errors))
+			worker.start()
+			self.workers.append(worker)
+
+	def check(self):
+		try:
+			error = self.errors.get_nowait()
+		except Queue.Empty:
+			if all(worker.is_alive() for worker in self.workers):
+				return
+			dead = [w for w in self.workers if not w.is_alive() and w.exitcode]
+			if not dead:
+				return
+			error = 'Exporter worker exited with status %d.' % dead[0].exitcode
+		self.failed = True
+		# nobody is going to read what is still queued, do not wait for it on exit
+		self.batches.cancel_join_thread()
+		self.terminate()
+		raise PipelineExporter.WorkerError(error)
+
+	def put(self, item):
+		while 1:
+			try:
+				self.batches.put(item, timeout=1)
+				return
+			except Queue.Full:
+				self.check()
+
+	def store(self, method, record):
+		self.batch.append((method, record))
+		if len(self.batch) >= self.batch_size:
+			self.check()
+			self.put(self.batch)
+			self.batch = []
+
+	def storeArtist(self, artist):
+		self.store('storeArtist', artist)
+
+	def storeLabel(self, label):
+		self.store('storeLabel', label)
+
+	def storeRelease(self, release):
+		self.store('storeRelease', release)
+
+	def storeMaster(self, master):
+		self.store('storeMaster', master)
+
+	def completed(self, entity):
+		# the workers each see a part of the dump, none of them can tell what is missing from it
+		pass
+
+	def terminate(self):
+		for worker in self.workers:
+			if worker.is_alive():
+				worker.terminate()
+			worker.join()
+
+	def finish(self, completely_done=False):
+		if self.failed:
+			return
+		if len(self.batch) > 0:
+			self.put(self.batch)
+			self.batch = []
+		if not completely_done:
+			return
+		for worker in self.workers:
+			self.put(None)
+		while any(worker.is_alive() for worker in self.workers):
+			self.check()
+			for worker in self.workers:
+				worker.join(1)
+		self.check()
@@ -15,8 +15,14 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
 #import psycopg2
-import uuid
+from cStringIO import StringIO
+from jsonexporter import as_dict
+import jsonexporter
+from discogsmetrics import timed
+import hashstore
+import os
 import sys
+import re
 
 
 def untuple(what):
@@ -30,25 +36,261 @@ def flatten(what):
 	return list([i for sub in what for i in untuple(sub)])
 
 
+def split_options(connection_string, names):
+	'''Takes exporter options such as "flush=5000" out of a libpq connection string.
+
+	>>> split_options("dbname=discogs flush=5000", ('flush',))
+	('dbname=discogs', {'flush': '5000'})
+	'''
+	options = {}
+
+	def take(match):
+		options[match.group(1)] = match.group(2)
+		return ''
+	pattern = r"(?:^|\s)(%s)\s*=\s*(\S+)" % '|'.join(names)
+	return re.sub(pattern, take, connection_string or '').strip(), options
+
+
+# track ids are release id * TRACKS_PER_RELEASE + track number, the same in every import
+TRACKS_PER_RELEASE = 100000
+
+
+def track_id(release_id, trackno):
+	'''The bigint key of the trackno-th track (counting from 1) of a release.'''
+	if trackno >= TRACKS_PER_RELEASE:
+		raise ValueError('Release %s has more than %d tracks' % (release_id, TRACKS_PER_RELEASE - 1))
+	return int(release_id) * TRACKS_PER_RELEASE + trackno
+
+
+# tables of the low-cardinality values that the other tables refer to by id
+LOOKUPS = ('country', 'genre', 'style', 'role', 'join_relation', 'format_description')
+
+
+class Lookup(object):
+	'''Small integer ids for the values of a column with few different ones, which are
+	kept once in a table of their own; insert(table, name) adds one and returns its id,
+	or a LookupRef to it.'''
+	def __init__(self, table, insert):
+		self.table = table
+		self.insert = insert
+		self.ids = {}
+
+	def id(self, name):
+		'''The id of name, None for an empty one.'''
+		if not name:
+			return None
+		id = self.ids.get(name)
+		if id is None:
+			id = self.ids[name] = self.insert(self.table, name)
+		return id
+
+	def id_list(self, names):
+		return [self.id(name) for name in names if name]
+
+
+class LookupRef(object):
+	'''The id of a lookup value in SQL, as a subquery by its name, for where it is not known yet.'''
+	def __init__(self, table, name):
+		self.table = table
+		self.name = name
+
+	def sql(self):
+		return u'(SELECT id FROM %s WHERE name = %s)' % (self.table, sql_literal(self.name))
+
+
+def split_role(role):
+	'''A role of discogshandler.parse_roles() as its name and the details in brackets, or None.'''
+	if type(role) is tuple:
+		return role[0], role[1] or None
+	return role, None
+
+
+def nullable(what):
+	'''Empty strings and lists are stored as NULL, as the INSERT path does by leaving the column out.'''
+	if what is None or len(what) == 0:
+		return None
+	return what
+
+
+_copy_special = re.compile(u'[\\\\\t\n\r]')
+_copy_escapes = {u'\\': u'\\\\', u'\t': u'\\t', u'\n': u'\\n', u'\r': u'\\r'}
+_array_special = re.compile(u'[{}",\\\\ \t\n\r\v\f]')
+_record_special = re.compile(u'[()",\\\\ \t\n\r\v\f]')
+
+
+def _text(what):
+	if isinstance(what, unicode):
+		return what
+	if isinstance(what, str):
+		return what.decode('utf-8')
+	return unicode(what)
+
+
+def pg_array(what):
+	'''Text of a one dimensional array, quoted the way array_out does it.'''
+	elements = []
+	for element in what:
+		if element is None:
+			elements.append(u'NULL')
+			continue
+		element = _text(element)
+		if len(element) == 0 or element.upper() == u'NULL' or _array_special.search(element):
+			element = u'"%s"' % element.replace(u'\\', u'\\\\').replace(u'"', u'\\"')
+		elements.append(element)
+	return u'{%s}' % u','.join(elements)
+
+
+def pg_record(what):
+	'''Text of an anonymous record, as a tuple parameter ends up in a text column.'''
+	fields = []
+	for field in what:
+		if field is None:
+			fields.append(u'')
+			continue
+		field = _text(field)
+		if len(field) == 0 or _record_special.search(field):
+			field = u'"%s"' % field.replace(u'\\', u'\\\\').replace(u'"', u'""')
+		fields.append(field)
+	return u'(%s)' % u','.join(fields)
+
+
+def sql_literal(what):
+	'''A parameter as an SQL literal, as psycopg2 would send it.'''
+	if what is None:
+		return u'NULL'
+	if isinstance(what, (int, long, float)):
+		return unicode(what)
+	if isinstance(what, LookupRef):
+		return what.sql()
+	if isinstance(what, list):
+		if len(what) and isinstance(what[0], LookupRef):
+			return u'ARRAY[%s]' % u','.join(ref.sql() for ref in what)
+		what = pg_array(what)
+	elif isinstance(what, tuple):
+		what = pg_record(what)
+	else:
+		what = _text(what)
+	return u"'%s'" % what.replace(u"'", u"''")
+
+
+def copy_value(what):
+	'''One column of a row in COPY text format.'''
+	if what is None:
+		return u'\\N'
+	if isinstance(what, list):
+		what = pg_array(what)
+	elif isinstance(what, tuple):
+		what = pg_record(what)
+	else:
+		what = _text(what)
+	if _copy_special.search(what):
+		return _copy_special.sub(lambda m: _copy_escapes[m.group()], what)
+	return what
+
+
+def connect(connection_string):
+	'''Opens a connection in autocommit mode, exits if that fails.
+
+	schema=NAME in the connection string makes NAME the only schema on the search path,
+	so the tables are read and written there instead of in public.'''
+	import psycopg2
+	connection_string, options = split_options(connection_string, ('schema', ))
+	schema = options.get('schema')
+	if schema is not None and not re.match(r'^[a-z_][a-z0-9_]*$', schema):
+		raise ValueError("schema=%s is not a lower case SQL name" % schema)
+	try:
+		conn = psycopg2.connect(connection_string)
+		conn.set_isolation_level(0)
+		if schema is not None:
+			conn.cursor().execute("SET search_path TO %s;" % schema)
+	except psycopg2.Error, e:
+		print "%s" % (e.args)
+		sys.exit()
+	return conn
+
+
+def unique_images(images):
+	'''The images of a record, without the repeats of an uri and type that the dumps have.'''
+	seen = set()
+	for img in images:
+		if (img.uri, img.imageType) not in seen:
+			seen.add((img.uri, img.imageType))
+			yield img
+
+
+def unique_labels(labels):
+	'''The labels of a release, without the repeats of a name and catalog number.'''
+	seen = set()
+	for lbl in labels:
+		if (lbl.name, lbl.catno) not in seen:
+			seen.add((lbl.name, lbl.catno))
+			yield lbl
+
+
 class PostgresExporter(object):
 	class ExecuteError(Exception):
 		def __init__(self, args):
 			self.args = args
 
-	def __init__(self, connection_string, data_quality):
+	def __init__(self, connection_string, data_quality, shard=None):
 		self.formatNames = {}
+		# each image goes into image once, however many records show it
+		self.images = hashstore.SeenSet()
+		self.lookups = dict((table, Lookup(table, self.insertLookup)) for table in LOOKUPS)
 		self.connect(connection_string)
 		self.min_data_quality = data_quality
+		self.loadImages()
+		# a uri whose digest is there already is looked up, it may only share the digest
+		self.images.confirm = self.imageWritten
+		self.loadLookups()
 
 	def connect(self, connection_string):
+		self.conn = connect(connection_string)
+		self.cur = self.conn.cursor()
+		# new lookup values are committed at once, so that other processes and
+		# the foreign keys of a delta see them whatever the main connection does
+		self.lookup_cur = connect(connection_string).cursor()
+
+	def loadLookups(self):
+		'''Takes over the ids of the lookup values already in the database.'''
+		for table, lookup in self.lookups.iteritems():
+			self.lookup_cur.execute("SELECT name, id FROM %s;" % table)
+			lookup.ids.update(self.lookup_cur.fetchall())
+
+	def insertLookup(self, table, name):
 		import psycopg2
 		try:
-			self.conn = psycopg2.connect(connection_string)
-			self.cur = self.conn.cursor()
-			self.conn.set_isolation_level(0)
-		except psycopg2.Error, e:
-			print "%s" % (e.args)
-			sys.exit()
+			self.lookup_cur.execute("INSERT INTO %s(name) VALUES(%%s) ON CONFLICT (name) DO NOTHING;" % table, (name, ))
+			self.lookup_cur.execute("SELECT id FROM %s WHERE name = %%s;" % table, (name, ))
+			return self.lookup_cur.fetchone()[0]
+		except psycopg2.Error as e:
+			print "Error adding %r to %s: %s" % (name, table, e)
+			raise PostgresExporter.ExecuteError(e.args)
+
+	def loadImages(self):
+		'''Remembers the images already in the database, from an earlier import or from
+		the part of this one that --resume continues after.'''
+		import psycopg2
+		level = self.conn.isolation_level
+		if level == 0:
+			self.conn.set_isolation_level(1)  # a named (server side) cursor needs a transaction
+		try:
+			cur = self.conn.cursor('discogs_image_uris')
+			cur.itersize = 100000
+			cur.execute("SELECT uri FROM image;")
+			for uri, in cur:
+				self.images.add(uri)
+			cur.close()
+			self.conn.commit()
+		except psycopg2.Error as e:
+			print "Error reading the images already in the database: %s" % e
+			raise PostgresExporter.ExecuteError(e.args)
+		self.conn.set_isolation_level(level)
+
+	def imageWritten(self, uri):
+		'''Whether uri is in image, for the uris whose digest self.images has already.'''
+		self.execute("SELECT 1 FROM image WHERE uri = %s;", (uri, ))
+		return self.cur.fetchone() is not None
 
 	def good_quality(self, what):
 		if len(self.min_data_quality):
@@ -66,11 +308,22 @@ class PostgresExporter(object):
 				print "Error executing: %s" % query
 			raise PostgresExporter.ExecuteError(e.args)
 
+	def completed(self, table):
+		pass
+
 	def finish(self, completely_done=False):
 		self.conn.commit()
 		if completely_done:
 			self.cur.close()
 
+	def insertImages(self, images, table, column, owner_id):
+		for img in unique_images(images):
+			if self.images.add(img.uri):
+				self.execute("INSERT INTO image(uri, height, width, uri150) VALUES(%s,%s,%s,%s);",
+						(img.uri, img.height, img.width, img.uri150))
+			self.execute("INSERT INTO " + table + "(image_uri, type, " + column + ") VALUES(%s,%s,%s);",
+					(img.uri, img.imageType, owner_id))
+
 	def storeLabel(self, label):
 		if not self.good_quality(label):
 			return
@@ -107,17 +360,7 @@ class PostgresExporter(object):
 		except PostgresExporter.ExecuteError as e:
 			print "%s" % (e.args)
 			return
-		imgCols = "uri,height,width,uri150"
-		for img in label.images:
-			imgValues = []
-			imgValues.append(img.uri)
-			imgValues.append(img.height)
-			imgValues.append(img.width)
-			imgValues.append(img.uri150)
-			if len(imgValues) != 0:
-				imgQuery = "INSERT INTO tmp_image(" + imgCols + ") VALUES(%s,%s,%s,%s);"
-				self.execute(imgQuery, imgValues)
-				self.execute("INSERT INTO tmp_labels_images(image_uri, type, label_id) VALUES(%s,%s, %s);", (img.uri, img.imageType, label.id))
+		self.insertImages(label.images, 'labels_images', 'label_id', label.id)
 
 	def storeArtist(self, artist):
 		if not self.good_quality(artist):
@@ -162,17 +405,7 @@ class PostgresExporter(object):
 			print "%s" % (e.args)
 			return
 
-		imgCols = "uri,height,width,uri150"
-		for img in artist.images:
-			imgValues = []
-			imgValues.append(img.uri)
-			imgValues.append(img.height)
-			imgValues.append(img.width)
-			imgValues.append(img.uri150)
-			if len(imgValues) != 0:
-				imgQuery = "INSERT INTO tmp_image(" + imgCols + ") VALUES(%s,%s,%s,%s);"
-				self.execute(imgQuery, imgValues)
-				self.execute("INSERT INTO tmp_artists_images(image_uri, type, artist_id) VALUES(%s, %s, %s);", (img.uri, img.imageType, artist.id))
+		self.insertImages(artist.images, 'artists_images', 'artist_id', artist.id)
 
 	def storeRelease(self, release):
 		if not self.good_quality(release):
@@ -187,8 +420,8 @@ class PostgresExporter(object):
 		columns += ",barcode"
 
 		if len(release.country) != 0:
-			values.append(release.country)
-			columns += ",country"
+			values.append(self.lookups['country'].id(release.country))
+			columns += ",country_id"
 		if len(release.released) != 0:
 			values.append(release.released)
 			columns += ",released"
@@ -196,11 +429,11 @@ class PostgresExporter(object):
 			values.append(release.notes)
 			columns += ",notes"
 		if len(release.genres) != 0:
-			values.append(release.genres)
-			columns += ",genres"
+			values.append(self.lookups['genre'].id_list(release.genres))
+			columns += ",genre_ids"
 		if len(release.styles) != 0:
-			values.append(release.styles)
-			columns += ",styles"
+			values.append(self.lookups['style'].id_list(release.styles))
+			columns += ",style_ids"
 
 		# INSERT INTO DATABASE
 		escapeStrings = ''
@@ -215,18 +448,7 @@ class PostgresExporter(object):
 		except PostgresExporter.ExecuteError, e:
 			print "%s" % (e.args)
 			return
-		imgCols = "uri,height,width,uri150"
-		for img in release.images:
-			imgValues = []
-			imgValues.append(img.uri)
-			imgValues.append(img.height)
-			imgValues.append(img.width)
-			imgValues.append(img.uri150)
-			if len(imgValues) != 0:
-				imgQuery = "INSERT INTO tmp_image(" + imgCols + ") VALUES(%s,%s,%s,%s);"
-				self.execute(imgQuery, imgValues)
-				self.execute("INSERT INTO tmp_releases_images(image_uri, type,release_id) VALUES(%s,%s,%s);",
-						(img.uri, img.imageType, release.id))
+		self.insertImages(release.images, 'releases_images', 'release_id', release.id)
 		fmt_order = 0
 		for fmt in release.formats:
 			fmt_order = fmt_order + 1
@@ -237,41 +459,45 @@ class PostgresExporter(object):
 						self.execute("INSERT INTO format(name) VALUES(%s);", (fmt.name, ))
 					except PostgresExporter.ExecuteError, e:
 						print "%s" % (e.args)
-				query = "INSERT INTO releases_formats(release_id, position, format_name, qty, descriptions) VALUES(%s,%s,%s,%s,%s);"
-				self.execute(query, (release.id, fmt_order, fmt.name, fmt.qty, fmt.descriptions))
+				query = "INSERT INTO releases_formats(release_id, position, format_name, qty, description_ids) VALUES(%s,%s,%s,%s,%s);"
+				self.execute(query, (release.id, fmt_order, fmt.name, fmt.qty, self.lookups['format_description'].id_list(fmt.descriptions)))
 
 		labelQuery = "INSERT INTO releases_labels(release_id, label, catno) VALUES(%s,%s,%s);"
-		for lbl in release.labels:
+		for lbl in unique_labels(release.labels):
 			self.execute(labelQuery, (release.id, lbl.name, lbl.catno))
 
                 release_artist_order = 0;
 		for aj in release.artistJoins:
 			release_artist_order = release_artist_order + 1
-			query = "INSERT INTO releases_artists(release_id, position, artist_id, artist_name, join_relation, anv)  VALUES(%s, %s, %s, %s, %s, %s);"
-			self.execute(query, (release.id, release_artist_order, aj.artist_id, aj.artist_name, aj.join_relation, aj.anv ))
+			query = "INSERT INTO releases_artists(release_id, position, artist_id, artist_name, join_relation_id, anv)  VALUES(%s, %s, %s, %s, %s, %s);"
+			self.execute(query, (release.id, release_artist_order, aj.artist_id, aj.artist_name,
+					self.lookups['join_relation'].id(aj.join_relation), aj.anv))
 
 		for extr in release.extraartists:
 			for role in extr.roles:
-				self.execute("INSERT INTO releases_extraartists(release_id, artist_id, artist_name, role, anv) VALUES(%s, %s, %s, %s, %s);",
-					(release.id, extr.artist_id, extr.artist_name, role, extr.anv))
+				role, details = split_role(role)
+				self.execute("INSERT INTO releases_extraartists(release_id, artist_id, artist_name, role_id, role_details, anv) VALUES(%s, %s, %s, %s, %s, %s);",
+					(release.id, extr.artist_id, extr.artist_name, self.lookups['role'].id(role), details, extr.anv))
 
 		trackno = 0
 		for trk in release.tracklist:
-			trackid = str(uuid.uuid4())
 			trackno = trackno + 1
+			trackid = track_id(release.id, trackno)
 			self.execute("INSERT INTO track(release_id, title, duration, position, track_id, trackno) VALUES(%s,%s,%s,%s,%s,%s);",
 					(release.id, trk.title, trk.duration, trk.position, trackid, trackno))
 
                         track_artist_order = 0;
 			for aj in trk.artistJoins:
 				track_artist_order = track_artist_order + 1
-				query = "INSERT INTO tracks_artists(track_id, position, artist_name,artist_id, join_relation, anv) VALUES(%s, %s, %s, %s, %s, %s);"
-				self.execute(query, (trackid, track_artist_order, aj.artist_name, aj.artist_id, aj.join_relation, aj.anv ))
+				query = "INSERT INTO tracks_artists(track_id, position, artist_name,artist_id, join_relation_id, anv) VALUES(%s, %s, %s, %s, %s, %s);"
+				self.execute(query, (trackid, track_artist_order, aj.artist_name, aj.artist_id,
+						self.lookups['join_relation'].id(aj.join_relation), aj.anv))
 
 			for extr in trk.extraartists:
 				for role in extr.roles:
-					self.execute("INSERT INTO tracks_extraartists(track_id, artist_id, artist_name, role, anv) VALUES(%s, %s, %s, %s, %s);",
-						(trackid, extr.artist_id, extr.artist_name, role, extr.anv))
+					role, details = split_role(role)
+					self.execute("INSERT INTO tracks_extraartists(track_id, artist_id, artist_name, role_id, role_details, anv) VALUES(%s, %s, %s, %s, %s, %s);",
+						(trackid, extr.artist_id, extr.artist_name, self.lookups['role'].id(role), details, extr.anv))
 
 	def storeMaster(self, master):
 		if not self.good_quality(master):
@@ -290,11 +516,11 @@ class PostgresExporter(object):
 			values.append(master.notes)
 			columns += ",notes"
 		if len(master.genres) != 0:
-			values.append(master.genres)
-			columns += ",genres"
+			values.append(self.lookups['genre'].id_list(master.genres))
+			columns += ",genre_ids"
 		if len(master.styles) != 0:
-			values.append(master.styles)
-			columns += ",styles"
+			values.append(self.lookups['style'].id_list(master.styles))
+			columns += ",style_ids"
 
 		#INSERT INTO DATABASE
 		escapeStrings = ''
@@ -309,33 +535,23 @@ class PostgresExporter(object):
 		except PostgresExporter.ExecuteError, e:
 			print "%s" % (e.args)
 			return
-		imgCols = "uri,height,width,uri150"
-		for img in master.images:
-			imgValues = []
-			imgValues.append(img.uri)
-			imgValues.append(img.height)
-			imgValues.append(img.width)
-			imgValues.append(img.uri150)
-			if len(imgValues) != 0:
-				imgQuery = "INSERT INTO tmp_image(" + imgCols + ") VALUES(%s,%s,%s,%s);"
-				self.execute(imgQuery, imgValues)
-				self.execute("INSERT INTO tmp_masters_images(image_uri, type, master_id) VALUES(%s,%s,%s);",
-						(img.uri, img.imageType, master.id))
+		self.insertImages(master.images, 'masters_images', 'master_id', master.id)
 		if len(master.artists) > 1:
 			for artist in master.artists:
 				query = "INSERT INTO masters_artists(master_id, artist_name) VALUES(%s,%s);"
 				self.execute(query, (master.id, artist))
 			for aj in master.artistJoins:
 				query = """INSERT INTO masters_artists_joins
-												(master_id, join_relation, artist1, artist2)
+												(master_id, join_relation_id, artist1, artist2)
 												VALUES(%s,%s,%s,%s);"""
 				artistIdx = master.artists.index(aj.artist1) + 1
 				#The last join relation is not between artists but instead
 				#something like "Bob & Alice 'PRESENTS' - Cryptographic Tunes":
+				join_relation = self.lookups['join_relation'].id(aj.join_relation)
 				if artistIdx >= len(master.artists):
-					values = (master.id, aj.join_relation, '', '')  # join relation is between all artists and the album
+					values = (master.id, join_relation, '', '')  # join relation is between all artists and the album
 				else:
-					values = (master.id, aj.join_relation, aj.artist1, master.artists[artistIdx])
+					values = (master.id, join_relation, aj.artist1, master.artists[artistIdx])
 				self.execute(query, values)
 		else:
 			if len(master.artists) == 0:  # use anv if no artist name
@@ -347,34 +563,446 @@ class PostgresExporter(object):
 
 		for extr in master.extraartists:
 			# decide whether to insert flattened composite roles or take the first one from the tuple
-			self.execute("INSERT INTO masters_extraartists(master_id, artist_name, roles) VALUES(%s,%s,%s);",
-					(master.id, extr.name, map(lambda x: x[0] if type(x) is tuple else x, extr.roles)))
+			self.execute("INSERT INTO masters_extraartists(master_id, artist_name, role_ids) VALUES(%s,%s,%s);",
+					(master.id, extr.name, self.lookups['role'].id_list([split_role(r)[0] for r in extr.roles])))
 					#(master.id, extr.name, flatten(extr.roles)))
 
 
 class PostgresConsoleDumper(PostgresExporter):
+	'''Prints the statements PostgresExporter would run, as SQL for psql.'''
 
-	def __init__(self, connection_string):
-		super(PostgresConsoleDumper, self).__init__(connection_string)
-		self.q = lambda x: "'%s'" % x.replace("'", "\\'")
+	def __init__(self, connection_string, data_quality=[], shard=None):
+		# several processes share the console, see jsonexporter.write_console()
+		self.shared = shard is not None or jsonexporter.console_shared
+		super(PostgresConsoleDumper, self).__init__(connection_string, data_quality, shard)
 
 	def connect(self, connection_string):
 		pass
 
-	def qs(self, what):
-		ret = []
-		for w in what:
-			if type(w) == list:
-				ret.append(self.qs(w))
-			else:
-				#print "q(%s)==%s" % (w, self.q(w))
-				ret.append(self.q(w))
+	def loadImages(self):
+		pass
+
+	# there is no database to look a uri up in, so the images are deduped by digest alone
+	imageWritten = None
+
+	def loadLookups(self):
+		pass
 
-		return ret
+	def insertLookup(self, table, name):
+		# the database numbers the values, whatever other processes or imports added
+		self.execute("INSERT INTO " + table + "(name) VALUES(%s) ON CONFLICT (name) DO NOTHING;", (name, ))
+		return LookupRef(table, name)
 
 	def execute(self, query, params):
-		qparams = self.qs(params)
-		print(query % tuple(qparams))
+		statement = (query % tuple(sql_literal(p) for p in params)).encode('utf-8') + '\n'
+		if self.shared:
+			jsonexporter.write_console(statement)
+		else:
+			sys.stdout.write(statement)
 
-	def finish(self):
-		pass
+	def finish(self, completely_done=False):
+		sys.stdout.flush()
+
+
+class _CopyBuffer(object):
+	'''Rows waiting to be sent to one table through COPY ... FROM STDIN.'''
+	def __init__(self, table, columns):
+		self.statement = "COPY %s(%s) FROM STDIN;" % (table, ', '.join(columns))
+		self.lines = []
+
+	def __len__(self):
+		return len(self.lines)
+
+	def append(self, row):
+		self.lines.append(u'\t'.join([copy_value(v) for v in row]) + u'\n')
+
+	def flush(self, cur):
+		if len(self.lines) == 0:
+			return
+		data = StringIO(u''.join(self.lines).encode('utf-8'))
+		self.lines = []
+		cur.copy_expert(self.statement, data)
+
+
+class _InsertBuffer(object):
+	'''Rows waiting to be inserted into one table through a prepared multi-row INSERT.'''
+	def __init__(self, table, columns, page_size):
+		self.page_size = page_size
+		self.rows = []
+		self.prepared = False
+		self.name = 'discogs_insert_%s' % table
+		self.row_sql = '(' + ','.join(['%s'] * len(columns)) + ')'
+		self.insert_sql = 'INSERT INTO %s(%s) VALUES' % (table, ', '.join(columns))
+		placeholders = ','.join(['%s'] * (len(columns) * page_size))
+		self.execute_sql = 'EXECUTE %s(%s);' % (self.name, placeholders)
+		params = iter(xrange(1, len(columns) * page_size + 1))
+		pages = ['(' + ','.join(['$%d' % params.next() for c in columns]) + ')' for r in xrange(page_size)]
+		self.prepare_sql = 'PREPARE %s AS %s %s;' % (self.name, self.insert_sql, ','.join(pages))
+
+	def __len__(self):
+		return len(self.rows)
+
+	def append(self, row):
+		self.rows.append(row)
+
+	def flush(self, cur):
+		rows, self.rows = self.rows, []
+		full = len(rows) - len(rows) % self.page_size
+		if full and not self.prepared:
+			cur.execute(self.prepare_sql)
+			self.prepared = True
+		for start in xrange(0, full, self.page_size):
+			cur.execute(self.execute_sql, flatten(rows[start:start + self.page_size]))
+		if full < len(rows):
+			tail = rows[full:]
+			cur.execute(self.insert_sql + ','.join([self.row_sql] * len(tail)) + ';', flatten(tail))
+
+
+class _RecordHashes(object):
+	'''Digests of the records in the database, by table, from one import to the next.'''
+	def __init__(self, path, digest='md5'):
+		self._path = os.path.abspath(os.path.expanduser(path))
+		self._hasher = hashstore.Hasher(digest)
+		self._stores = {}
+
+	def _store(self, table):
+		store = self._stores.get(table)
+		if store is None:
+			fname = os.path.join(self._path, '%s.hashes' % table)
+			store = self._stores[table] = hashstore.HashStore(fname, self._hasher.name)
+		return store
+
+	def loaded(self, table):
+		'''Whether a previous import stored records of table.'''
+		return len(self._store(table)) > 0
+
+	def changed(self, table, record):
+		'''Whether record is not in the database as it is; if so its new digest is kept for save().'''
+		store = self._store(table)
+		digest = self._hasher.digests([as_dict(record, specify_object_type=False)])[0]
+		id = int(record.id)
+		if store.get(id) == digest:
+			return False
+		store.put(id, digest)
+		return True
+
+	def missing(self, table):
+		'''The ids of the previous import that did not come by in this one; they are
+		left out of the hash file on save(), so the caller has to delete them.'''
+		store = self._store(table)
+		missing = store.missing()
+		store.drop_missing()
+		return missing
+
+	def save(self):
+		for table, store in self._stores.iteritems():
+			try:
+				store.save()
+			except (IOError, OSError) as e:
+				print 'IOError writing out %s: %s' % (table, e)
+
+
+class _PostgresRowExporter(PostgresExporter):
+	'''Base for exporters writing fixed-shape rows, with NULL for empty fields, into per-table buffers.
+
+	uniq=md5 (or blake2b or xxhash) in the connection string only writes the records whose
+	digest changed since the previous import, replacing all their rows. The digests are kept
+	in <table>.hashes files in the directory given by hashes=DIR (default the current one).'''
+	tables = {
+		'artist': ('id', 'name', 'realname', 'profile', 'namevariations', 'urls', 'aliases', 'groups', 'members'),
+		'label': ('id', 'name', 'contactinfo', 'profile', 'parent_label', 'urls', 'sublabels'),
+		'release': ('id', 'title', 'status', 'barcode', 'country_id', 'released', 'notes', 'genre_ids', 'style_ids'),
+		'master': ('id', 'title', 'main_release', 'year', 'notes', 'genre_ids', 'style_ids'),
+		'format': ('name', ),
+		'image': ('uri', 'height', 'width', 'uri150'),
+		'artists_images': ('image_uri', 'type', 'artist_id'),
+		'labels_images': ('image_uri', 'type', 'label_id'),
+		'releases_images': ('image_uri', 'type', 'release_id'),
+		'masters_images': ('image_uri', 'type', 'master_id'),
+		'releases_formats': ('release_id', 'position', 'format_name', 'qty', 'description_ids'),
+		'releases_labels': ('release_id', 'label', 'catno'),
+		'releases_artists': ('release_id', 'position', 'artist_id', 'artist_name', 'join_relation_id', 'anv'),
+		'releases_extraartists': ('release_id', 'artist_id', 'artist_name', 'role_id', 'role_details', 'anv'),
+		'track': ('release_id', 'title', 'duration', 'position', 'track_id', 'trackno'),
+		'tracks_artists': ('track_id', 'position', 'artist_name', 'artist_id', 'join_relation_id', 'anv'),
+		'tracks_extraartists': ('track_id', 'artist_id', 'artist_name', 'role_id', 'role_details', 'anv'),
+		'masters_artists': ('master_id', 'artist_name'),
+		'masters_artists_joins': ('master_id', 'join_relation_id', 'artist1', 'artist2'),
+		'masters_extraartists': ('master_id', 'artist_name', 'role_ids'),
+		}
+	# where the rows of a record are, in the order they are deleted when it changed
+	_tracks = 'track_id IN (SELECT track_id FROM track WHERE release_id = ANY(%s))'
+	owned = {
+		'artist': (('artists_images', 'artist_id = ANY(%s)'), ('artist', 'id = ANY(%s)')),
+		'label': (('labels_images', 'label_id = ANY(%s)'), ('label', 'id = ANY(%s)')),
+		'release': (('tracks_artists', _tracks), ('tracks_extraartists', _tracks), ('track', 'release_id = ANY(%s)'),
+				('releases_formats', 'release_id = ANY(%s)'), ('releases_labels', 'release_id = ANY(%s)'),
+				('releases_artists', 'release_id = ANY(%s)'), ('releases_extraartists', 'release_id = ANY(%s)'),
+				('releases_images', 'release_id = ANY(%s)'), ('release', 'id = ANY(%s)')),
+		'master': (('masters_artists', 'master_id = ANY(%s)'), ('masters_artists_joins', 'master_id = ANY(%s)'),
+				('masters_extraartists', 'master_id = ANY(%s)'), ('masters_images', 'master_id = ANY(%s)'),
+				('master', 'id = ANY(%s)')),
+		}
+	# parent rows go in first, for the foreign keys create_indexes.sql adds
+	flush_order = sorted(tables, key=lambda t: (t not in ('artist', 'label', 'release', 'master', 'format', 'image'), t))
+	batch_size = 0  # records per transaction, 0 for no commits before finish()
+	on_commit = None  # called after every commit, see discogshandler.PathHandler.commitPoint
+
+	def __init__(self, connection_string, data_quality, shard=None):
+		connection_string, options = split_options(connection_string, ('uniq', 'hashes'))
+		self.buffers = dict((t, self.make_buffer(t, c)) for t, c in self.tables.iteritems())
+		self.pending = 0
+		self.hashes = None
+		self.replaced = {}
+		if 'uniq' in options:
+			if shard is not None:
+				raise ValueError("uniq keeps a single hash file per table and cannot be used by several exporters at once")
+			self.hashes = _RecordHashes(options.get('hashes', '.'), options['uniq'])
+		super(_PostgresRowExporter, self).__init__(connection_string, data_quality, shard)
+		if self.hashes is not None:
+			# a delta goes in as one transaction (or one per batch_size records), the hashes are saved after the last
+			self.conn.set_isolation_level(1)
+			self.execute("SELECT name FROM format;", None)
+			for name, in self.cur.fetchall():
+				self.formatNames[name] = True
+
+	def make_buffer(self, table, columns):
+		raise NotImplementedError()
+
+	def stored(self):
+		'''Called once a whole record has been written.'''
+		if self.batch_size:
+			self.pending += 1
+			if self.pending >= self.batch_size:
+				self.commit()
+
+	@timed('export')
+	def commit(self):
+		self.flushAll()
+		self.conn.commit()
+		self.pending = 0
+		if self.on_commit is not None:
+			self.on_commit()
+
+	def changed(self, table, record):
+		'''With uniq=, whether record has to be written; the rows of a changed record
+		that a previous import wrote are deleted before the next flush.'''
+		if self.hashes is None:
+			return True
+		if not self.hashes.changed(table, record):
+			return False
+		if self.hashes.loaded(table):
+			self.replaced.setdefault(table, []).append(int(record.id))
+		return True
+
+	def completed(self, table):
+		'''With uniq=, deletes the records of the previous import that the dump no longer has.'''
+		if self.hashes is None:
+			return
+		missing = self.hashes.missing(table)
+		if len(missing) > 0:
+			print "Deleting %d %s records that are no longer in the dump." % (len(missing), table)
+			self.replaced.setdefault(table, []).extend(missing)
+
+	def deleteReplaced(self):
+		import psycopg2
+		for table, ids in self.replaced.iteritems():
+			for owned, condition in self.owned[table]:
+				try:
+					self.cur.execute("DELETE FROM %s WHERE %s;" % (owned, condition), (list(ids), ))
+				except psycopg2.Error as e:
+					print "Error deleting changed %s records from %s: %s" % (table, owned, e)
+					raise PostgresExporter.ExecuteError(e.args)
+		self.replaced = {}
+
+	def write(self, table, row):
+		buffer = self.buffers[table]
+		buffer.append(row)
+		if len(buffer) >= self.flush_size:
+			if self.hashes is not None:
+				# a delta has the foreign keys in place, the parents of the rows must be there first
+				self.flushAll()
+			else:
+				self.flush(table)
+
+	@timed('export')
+	def flush(self, table):
+		import psycopg2
+		if self.replaced:
+			self.deleteReplaced()
+		try:
+			self.buffers[table].flush(self.cur)
+		except psycopg2.Error as e:
+			print "Error writing into %s: %s" % (table, e)
+			raise PostgresExporter.ExecuteError(e.args)
+
+	def flushAll(self):
+		for table in self.flush_order:
+			self.flush(table)
+
+	def imageWritten(self, uri):
+		self.flush('image')
+		return super(_PostgresRowExporter, self).imageWritten(uri)
+
+	def finish(self, completely_done=False):
+		self.flushAll()
+		super(_PostgresRowExporter, self).finish(completely_done)
+		if self.hashes is not None:
+			self.hashes.save()
+		if self.on_commit is not None:
+			self.on_commit()
+
+	def writeImages(self, images, table, owner_id):
+		for img in unique_images(images):
+			if self.images.add(img.uri):
+				self.write('image', (img.uri, img.height, img.width, img.uri150))
+			self.write(table, (img.uri, img.imageType, owner_id))
+
+	@timed('serialize')
+	def storeLabel(self, label):
+		if not self.good_quality(label) or not self.changed('label', label):
+			return
+		self.write('label', (label.id, label.name, nullable(label.contactinfo), nullable(label.profile),
+				nullable(label.parentLabel), nullable(label.urls), nullable(label.sublabels)))
+		self.writeImages(label.images, 'labels_images', label.id)
+		self.stored()
+
+	@timed('serialize')
+	def storeArtist(self, artist):
+		if not self.good_quality(artist) or not self.changed('artist', artist):
+			return
+		self.write('artist', (artist.id, artist.name, nullable(artist.realname), nullable(artist.profile),
+				nullable(artist.namevariations), nullable(artist.urls), nullable(artist.aliases),
+				nullable(artist.groups), nullable(artist.members)))
+		self.writeImages(artist.images, 'artists_images', artist.id)
+		self.stored()
+
+	@timed('serialize')
+	def storeRelease(self, release):
+		if not self.good_quality(release) or not self.changed('release', release):
+			return
+		self.write('release', (release.id, release.title, release.status, release.barcode,
+				self.lookups['country'].id(release.country), nullable(release.released), nullable(release.notes),
+				nullable(self.lookups['genre'].id_list(release.genres)), nullable(self.lookups['style'].id_list(release.styles))))
+		self.writeImages(release.images, 'releases_images', release.id)
+
+		fmt_order = 0
+		for fmt in release.formats:
+			fmt_order = fmt_order + 1
+			if not fmt.name in self.formatNames:
+				self.formatNames[fmt.name] = True
+				self.write('format', (fmt.name, ))
+			self.write('releases_formats', (release.id, fmt_order, fmt.name, fmt.qty,
+					self.lookups['format_description'].id_list(fmt.descriptions)))
+
+		for lbl in unique_labels(release.labels):
+			self.write('releases_labels', (release.id, lbl.name, lbl.catno))
+
+		release_artist_order = 0
+		for aj in release.artistJoins:
+			release_artist_order = release_artist_order + 1
+			self.write('releases_artists', (release.id, release_artist_order, aj.artist_id, aj.artist_name,
+					self.lookups['join_relation'].id(aj.join_relation), aj.anv))
+
+		for extr in release.extraartists:
+			for role in extr.roles:
+				role, details = split_role(role)
+				self.write('releases_extraartists', (release.id, extr.artist_id, extr.artist_name,
+						self.lookups['role'].id(role), details, extr.anv))
+
+		trackno = 0
+		for trk in release.tracklist:
+			trackno = trackno + 1
+			trackid = track_id(release.id, trackno)
+			self.write('track', (release.id, trk.title, trk.duration, trk.position, trackid, trackno))
+
+			track_artist_order = 0
+			for aj in trk.artistJoins:
+				track_artist_order = track_artist_order + 1
+				self.write('tracks_artists', (trackid, track_artist_order, aj.artist_name, aj.artist_id,
+						self.lookups['join_relation'].id(aj.join_relation), aj.anv))
+
+			for extr in trk.extraartists:
+				for role in extr.roles:
+					role, details = split_role(role)
+					self.write('tracks_extraartists', (trackid, extr.artist_id, extr.artist_name,
+							self.lookups['role'].id(role), details, extr.anv))
+		self.stored()
+
+	@timed('serialize')
+	def storeMaster(self, master):
+		if not self.good_quality(master) or not self.changed('master', master):
+			return
+		self.write('master', (master.id, master.title, master.main_release, master.year or None,
+				nullable(master.notes), nullable(self.lookups['genre'].id_list(master.genres)),
+				nullable(self.lookups['style'].id_list(master.styles))))
+		self.writeImages(master.images, 'masters_images', master.id)
+
+		if len(master.artists) > 1:
+			for artist in master.artists:
+				self.write('masters_artists', (master.id, artist))
+			for aj in master.artistJoins:
+				artistIdx = master.artists.index(aj.artist1) + 1
+				if artistIdx >= len(master.artists):
+					self.write('masters_artists_joins', (master.id, self.lookups['join_relation'].id(aj.join_relation), '', ''))
+				else:
+					self.write('masters_artists_joins', (master.id, self.lookups['join_relation'].id(aj.join_relation),
+							aj.artist1, master.artists[artistIdx]))
+		elif len(master.artists) == 0:
+			self.write('masters_artists', (master.id, master.anv))
+		else:
+			self.write('masters_artists', (master.id, master.artists[0]))
+
+		for extr in master.extraartists:
+			self.write('masters_extraartists', (master.id, extr.name,
+					self.lookups['role'].id_list([split_role(r)[0] for r in extr.roles])))
+		self.stored()
+
+
+class PostgresCopyExporter(_PostgresRowExporter):
+	'''Bulk loads into PostgreSQL with one buffered COPY stream per table.
+
+	Takes the same connection string as PostgresExporter, optionally followed
+	by flush=N, the number of rows buffered for a table before they are sent:
+	--params "dbname=discogs user=discogs flush=50000"
+
+	Every COPY commits on its own, unless commit=N is given: then the rows
+	of N records at a time go in as one transaction, which --resume can
+	continue after.
+	'''
+	def __init__(self, connection_string, data_quality, shard=None):
+		connection_string, options = split_options(connection_string, ('flush', 'commit'))
+		self.flush_size = int(options.get('flush', 10000))
+		self.batch_size = int(options.get('commit', 0))
+		super(PostgresCopyExporter, self).__init__(connection_string, data_quality, shard)
+
+	def make_buffer(self, table, columns):
+		return _CopyBuffer(table, columns)
+
+	def connect(self, connection_string):
+		super(PostgresCopyExporter, self).connect(connection_string)
+		self.conn.set_client_encoding('UTF8')
+		if self.batch_size:
+			self.conn.set_isolation_level(1)
+
+
+class PostgresBatchExporter(_PostgresRowExporter):
+	'''Loads into PostgreSQL in transactions of several records, for when COPY is not allowed.
+
+	Every table gets one prepared INSERT of page=N rows (default 100), with
+	NULL for empty fields so the statement never changes shape. A commit is
+	issued every batch=N records (default 1000):
+	--params "dbname=discogs user=discogs batch=5000 page=200"
+	'''
+	def __init__(self, connection_string, data_quality, shard=None):
+		connection_string, options = split_options(connection_string, ('batch', 'page'))
+		self.batch_size = int(options.get('batch', 1000))
+		self.flush_size = int(options.get('page', 100))
+		super(PostgresBatchExporter, self).__init__(connection_string, data_quality, shard)
+
+	def make_buffer(self, table, columns):
+		return _InsertBuffer(table, columns, self.flush_size)
+
+	def connect(self, connection_string):
+		super(PostgresBatchExporter, self).connect(connection_string)
+		self.conn.set_isolation_level(1)
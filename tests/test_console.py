@@ -0,0 +1,61 @@
+'''The JSON console output of the options that run several processes at once:
+every record has to come out as one line of its own.
+
+Run with: python -m unittest discover tests
+'''
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORDS = 300  # per dump, enough for releases longer than PIPE_BUF
+
+
+class ConsoleOutputTest(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.directory = tempfile.mkdtemp()
+		subprocess.check_call([sys.executable, os.path.join(ROOT, 'tools', 'make_dumps.py'),
+				'-n', str(RECORDS), '-o', cls.directory], stdout=open(os.devnull, 'w'))
+
+	@classmethod
+	def tearDownClass(cls):
+		shutil.rmtree(cls.directory)
+
+	def parse(self, *args):
+		'''The records discogsparser.py prints with args, failing on any line that is not one.'''
+		process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'discogsparser.py'), '-o', 'json', '-d', '20990101'] + list(args),
+				cwd=self.directory, stdout=subprocess.PIPE, stderr=open(os.devnull, 'w'))
+		output = process.communicate()[0]
+		self.assertEqual(process.returncode, 0)
+		records = []
+		for line in output.splitlines():
+			if line.startswith('{'):
+				records.append(json.loads(line))
+			elif not (line.startswith('Namespace(') or re.match(r'Parsed \d+ \w+( in \d+ jobs)?\.$', line)):
+				self.fail('Not a record: %r' % line[:200])
+		return records
+
+	def assertAllRecords(self, records):
+		counts = {}
+		for record in records:
+			counts[record['object_type_name']] = counts.get(record['object_type_name'], 0) + 1
+		self.assertEqual(counts, {'Artist': RECORDS, 'Label': RECORDS, 'Release': RECORDS, 'Master': RECORDS})
+
+	def test_concurrent(self):
+		self.assertAllRecords(self.parse('-c'))
+
+	def test_jobs(self):
+		self.assertAllRecords(self.parse('-j', '4'))
+
+	def test_workers(self):
+		self.assertAllRecords(self.parse('-w', '3'))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,39 @@
+'''The order tools/create_indexes.py runs the foreign keys in.
+
+Run with: python -m unittest discover tests
+'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools'))
+
+import create_indexes
+
+
+def key(table, references):
+	return create_indexes.Statement('ALTER TABLE ONLY %s ADD CONSTRAINT %s_%s_fkey FOREIGN KEY (x) REFERENCES %s(id)'
+			% (table, table, references, references))
+
+
+class ForeignKeyRoundsTest(unittest.TestCase):
+	def test_no_table_twice_in_a_round(self):
+		keys = [s for s in create_indexes.read_statements(create_indexes.STATEMENTS) if s.references is not None]
+		rounds = create_indexes.foreign_key_rounds(keys)
+		self.assertEqual(sorted(sum(rounds, [])), sorted(keys))
+		for keys in rounds:
+			tables = [s.table for s in keys] + [s.references for s in keys]
+			self.assertEqual(len(tables), len(set(tables)), tables)
+
+	def test_keys_onto_one_table_are_spread_over_rounds(self):
+		keys = [key('artists_images', 'image'), key('labels_images', 'image'), key('releases_images', 'image'),
+				key('releases_images', 'release'), key('releases_labels', 'release')]
+		self.assertEqual([[(s.table, s.references) for s in keys] for keys in create_indexes.foreign_key_rounds(keys)], [
+				[('artists_images', 'image'), ('releases_images', 'release')],
+				[('labels_images', 'image'), ('releases_labels', 'release')],
+				[('releases_images', 'image')],
+				])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,169 @@
+'''HashStore files across save() and reopening, and SeenSet with strings that share their digest.
+
+Run with: python -m unittest discover tests
+'''
+import hashlib
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashstore
+
+
+def digest(n):
+	return hashlib.md5(str(n)).digest()
+
+
+class HashStoreTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.path = os.path.join(self.directory, 'release.hashes')
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def reopen(self, store):
+		store.save()
+		store.close()
+		return hashstore.HashStore(self.path)
+
+	def test_put_and_get_across_save(self):
+		store = hashstore.HashStore(self.path)
+		self.assertEqual(len(store), 0)
+		self.assertEqual(store.get(1), None)
+		for id in (3, 1, 2):  # out of order, as -c/-w may store them
+			store.put(id, digest(id))
+		store = self.reopen(store)
+		self.assertEqual(len(store), 3)
+		self.assertEqual([store.get(id) for id in (1, 2, 3, 4)], [digest(1), digest(2), digest(3), None])
+
+	def test_update_and_add_merge_with_the_file(self):
+		store = hashstore.HashStore(self.path)
+		for id in (10, 20, 30):
+			store.put(id, digest(id))
+		store = self.reopen(store)
+		store.put(20, digest('changed'))
+		store.put(25, digest(25))
+		store.put(5, digest(5))
+		store.put(25, digest('last'))  # the last put of an id wins
+		self.assertEqual(store.get(20), digest(20))  # the file as it was opened, until save()
+		store = self.reopen(store)
+		self.assertEqual(len(store), 5)
+		self.assertEqual([store.get(id) for id in (5, 10, 20, 25, 30)],
+				[digest(5), digest(10), digest('changed'), digest('last'), digest(30)])
+
+	def test_save_without_puts_leaves_the_file_alone(self):
+		store = hashstore.HashStore(self.path)
+		store.put(1, digest(1))
+		store = self.reopen(store)
+		store.get(1)
+		self.assertFalse(store.dirty())
+		mtime = os.path.getmtime(self.path)
+		store.save()
+		self.assertEqual(os.path.getmtime(self.path), mtime)
+
+	def test_missing_after_a_partial_pass(self):
+		store = hashstore.HashStore(self.path)
+		for id in xrange(1, 21):
+			store.put(id, digest(id))
+		store = self.reopen(store)
+		for id in (1, 2, 5, 9, 10, 17, 42):
+			store.index(id)
+		self.assertEqual(list(store.missing()), [3, 4, 6, 7, 8, 11, 12, 13, 14, 15, 16, 18, 19, 20])
+
+	def test_missing_ids_are_kept_unless_dropped(self):
+		store = hashstore.HashStore(self.path)
+		for id in xrange(1, 11):
+			store.put(id, digest(id))
+		store = self.reopen(store)
+		for id in (1, 2, 3, 4, 6, 7, 8, 9, 10):
+			store.get(id)
+		store.put(11, digest(11))
+		store = self.reopen(store)
+		self.assertEqual(store.get(5), digest(5))
+
+	def test_drop_of_a_deleted_id(self):
+		store = hashstore.HashStore(self.path)
+		for id in xrange(1, 11):
+			store.put(id, digest(id))
+		store = self.reopen(store)
+		for id in (1, 2, 3, 4, 6, 7, 8, 9, 10):
+			store.get(id)
+		store.put(7, digest('changed'))
+		self.assertEqual(list(store.missing()), [5])
+		store.drop_missing()
+		store = self.reopen(store)
+		self.assertEqual(len(store), 9)
+		self.assertEqual(store.get(5), None)
+		self.assertEqual(store.get(7), digest('changed'))
+		self.assertEqual([store.get(id) for id in (1, 4, 6, 10)], [digest(1), digest(4), digest(6), digest(10)])
+
+	def test_older_version_file(self):
+		with open(self.path, 'wb') as f:
+			f.write(struct.pack('<4sIII8s', hashstore.MAGIC, hashstore.VERSION - 1, 1, 16, 'md5'))
+			f.write(struct.pack('<I', 1) + digest(1))
+		store = hashstore.HashStore(self.path)
+		self.assertEqual(len(store), 0)
+		self.assertEqual(store.get(1), None)
+		store.put(1, digest(1))
+		store = self.reopen(store)
+		self.assertEqual(store.get(1), digest(1))
+
+	def test_file_of_another_digest(self):
+		store = hashstore.HashStore(self.path, 'md5')
+		store.put(1, digest(1))
+		store.save()
+		store.close()
+		store = hashstore.HashStore(self.path, 'blake2b')
+		self.assertEqual(len(store), 0)
+
+	def test_not_a_store(self):
+		with open(self.path, 'wb') as f:
+			f.write('x' * 40)
+		self.assertRaises(ValueError, hashstore.HashStore, self.path)
+
+
+class _SharedDigest(object):
+	'''md5 with the same digest for every string in shared.'''
+	def __init__(self, shared):
+		self.shared = shared
+
+	def md5(self, data):
+		return hashlib.md5('' if data in self.shared else data)
+
+
+class SeenSetTest(unittest.TestCase):
+	def setUp(self):
+		hashstore.hashlib = _SharedDigest(('a', 'b'))
+
+	def tearDown(self):
+		hashstore.hashlib = hashlib
+
+	def test_without_confirm_a_shared_digest_counts_as_added(self):
+		seen = hashstore.SeenSet()
+		self.assertEqual([seen.add(k) for k in 'aba'], [True, False, False])
+		self.assertEqual(len(seen), 1)
+
+	def test_confirm_tells_strings_with_a_shared_digest_apart(self):
+		written, asked = set(), []
+
+		def confirm(key):
+			asked.append(key)
+			return key in written
+
+		seen = hashstore.SeenSet(confirm)
+		for key, new in zip('axbbaax', (True, True, True, False, False, False, False)):
+			self.assertEqual(seen.add(key), new, key)
+			if new:
+				written.add(key)
+		self.assertEqual(len(seen), 3)
+		self.assertEqual(asked, ['b', 'a', 'x'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+'''The text the Postgres exporters send without psycopg2's help: COPY columns,
+array and record literals, and the SQL literals of -o pgdump.
+
+Run with: python -m unittest discover tests
+'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postgresexporter import LookupRef, copy_value, pg_array, pg_record, sql_literal
+
+
+class PgArrayTest(unittest.TestCase):
+	def test_plain_elements(self):
+		self.assertEqual(pg_array([u'LP', u'Album', 3]), u'{LP,Album,3}')
+
+	def test_empty(self):
+		self.assertEqual(pg_array([]), u'{}')
+
+	def test_null_and_the_string_null(self):
+		self.assertEqual(pg_array([None, u'NULL', u'null']), u'{NULL,"NULL","null"}')
+
+	def test_empty_element(self):
+		self.assertEqual(pg_array([u'']), u'{""}')
+
+	def test_quoted_elements(self):
+		self.assertEqual(pg_array([u'a b', u'a,b', u'{x}', u'7"', u'C:\\dir']),
+				u'{"a b","a,b","{x}","7\\"","C:\\\\dir"}')
+
+	def test_whitespace(self):
+		self.assertEqual(pg_array([u'a\tb', u'a\nb']), u'{"a\tb","a\nb"}')
+
+	def test_non_ascii(self):
+		self.assertEqual(pg_array([u'33 ⅓ RPM', 'caf\xc3\xa9']), u'{"33 ⅓ RPM",café}')
+
+
+class PgRecordTest(unittest.TestCase):
+	def test_plain_fields(self):
+		self.assertEqual(pg_record((u'Other', u'Stage')), u'(Other,Stage)')
+
+	def test_null_and_empty(self):
+		self.assertEqual(pg_record((u'Remix', None)), u'(Remix,)')
+		self.assertEqual(pg_record((u'Remix', u'')), u'(Remix,"")')
+
+	def test_quoted_fields(self):
+		self.assertEqual(pg_record((u'Other', u'Stage Sound & "Light"')), u'(Other,"Stage Sound & ""Light""")')
+		self.assertEqual(pg_record((u'(a)', u'b\\c', u'd,e')), u'("(a)","b\\\\c","d,e")')
+
+
+class CopyValueTest(unittest.TestCase):
+	def test_null(self):
+		self.assertEqual(copy_value(None), u'\\N')
+
+	def test_plain(self):
+		self.assertEqual(copy_value(u'Title'), u'Title')
+		self.assertEqual(copy_value(42), u'42')
+		self.assertEqual(copy_value(u''), u'')
+
+	def test_escapes(self):
+		self.assertEqual(copy_value(u'a\\b\tc\nd\re'), u'a\\\\b\\tc\\nd\\re')
+
+	def test_the_string_backslash_n_is_not_null(self):
+		self.assertEqual(copy_value(u'\\N'), u'\\\\N')
+
+	def test_non_ascii(self):
+		self.assertEqual(copy_value(u'Москва 東京'), u'Москва 東京')
+		self.assertEqual(copy_value('caf\xc3\xa9'), u'café')
+
+	def test_array(self):
+		self.assertEqual(copy_value([u'12"', u'a\\b', u'x\ty']), u'{"12\\\\"","a\\\\\\\\b","x\\ty"}')
+		self.assertEqual(copy_value([]), u'{}')
+		self.assertEqual(copy_value([1, None]), u'{1,NULL}')
+
+	def test_record(self):
+		self.assertEqual(copy_value((u'Other', u'Stage\tLight')), u'(Other,"Stage\\tLight")')
+
+
+class SqlLiteralTest(unittest.TestCase):
+	def test_null_and_numbers(self):
+		self.assertEqual(sql_literal(None), u'NULL')
+		self.assertEqual(sql_literal(7), u'7')
+		self.assertEqual(sql_literal(7L), u'7')
+		self.assertEqual(sql_literal(1.5), u'1.5')
+
+	def test_quotes(self):
+		self.assertEqual(sql_literal(u"Rock 'n' Roll"), u"'Rock ''n'' Roll'")
+
+	def test_backslash_and_newline_are_kept(self):
+		# standard_conforming_strings: a backslash is not an escape in '...'
+		self.assertEqual(sql_literal(u'a\\b\nc'), u"'a\\b\nc'")
+
+	def test_non_ascii(self):
+		self.assertEqual(sql_literal(u'Café'), u"'Café'")
+
+	def test_array_and_record(self):
+		self.assertEqual(sql_literal([u"it's", u'a b']), u"'{it''s,\"a b\"}'")
+		self.assertEqual(sql_literal([]), u"'{}'")
+		self.assertEqual(sql_literal((u'Remix', None)), u"'(Remix,)'")
+
+	def test_lookup_refs(self):
+		self.assertEqual(sql_literal(LookupRef('genre', u"Rock 'n' Roll")),
+				u"(SELECT id FROM genre WHERE name = 'Rock ''n'' Roll')")
+		self.assertEqual(sql_literal([LookupRef('style', u'House'), LookupRef('style', u'Techno')]),
+				u"ARRAY[(SELECT id FROM style WHERE name = 'House'),(SELECT id FROM style WHERE name = 'Techno')]")
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,37 @@
+'''The order tools/refresh.py makes the tables of the staging schema logged in.
+
+Run with: python -m unittest discover tests
+'''
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tools'))
+
+import create_indexes
+import refresh
+
+
+class LoggedLevelsTest(unittest.TestCase):
+	def test_referenced_tables_first(self):
+		keys = [s for s in create_indexes.read_statements(create_indexes.STATEMENTS) if s.references is not None]
+		references = [(s.table, s.references) for s in keys]
+		tables = set(sum(references, ())) | set(['track'])
+		levels = refresh.logged_levels(tables, references)
+		self.assertEqual(sorted(sum(levels, [])), sorted(tables))
+		level_of = dict((table, i) for i, level in enumerate(levels) for table in level)
+		for table, referenced in references:
+			self.assertTrue(level_of[referenced] < level_of[table], (table, referenced))
+		# release refers to country and is referred to itself
+		self.assertTrue(level_of['country'] < level_of['release'] < level_of['releases_images'])
+		self.assertEqual(level_of['track'], 0)
+
+	def test_self_references_and_other_schemas_are_left_out(self):
+		self.assertEqual(refresh.logged_levels(['a', 'b'], [('a', 'a'), ('b', 'a'), ('b', 'elsewhere')]), [['a'], ['b']])
+
+	def test_circle(self):
+		self.assertRaises(ValueError, refresh.logged_levels, ['a', 'b'], [('a', 'b'), ('b', 'a')])
+
+
+if __name__ == '__main__':
+	unittest.main()
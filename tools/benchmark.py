@@ -0,0 +1,149 @@
+'''Times every handler with every exporter on synthetic dumps of several sizes, and
+writes the results as JSON, so runs of two versions can be compared.
+
+Usage: python tools/benchmark.py [-n 1000,10000] [-x null,json,mongo,pgdump] [-o results.json] [--compare old.json]
+
+The dumps are written by make_dumps.py into a temporary directory, unless --dumps
+points to a directory with discogs_DATE_*.xml files (of -d DATE) to use instead.
+The json and pgdump outputs go to /dev/null, mongo to file:// in a temporary directory.
+'''
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discogsparser
+from make_dumps import ENTITIES, make_dumps
+from parser_benchmark import NullExporter, backends
+
+
+def make_exporter(name, workdir):
+	'''The exporter, the output it writes to (closed after the run) and the directory to remove.'''
+	if name == 'null':
+		return NullExporter(), None, None
+	module_name, class_name = discogsparser.exporters[name].split('.')
+	module = __import__(module_name)
+	if name == 'mongo':
+		directory = tempfile.mkdtemp(dir=workdir)
+		return getattr(module, class_name)('file://%s/' % directory), None, directory
+	return getattr(module, class_name)(None), open(os.devnull, 'w'), None
+
+
+def run(entity, filename, exporter_name, backend, workdir):
+	'''Parses filename once, returns its result.'''
+	exporter, output, directory = make_exporter(exporter_name, workdir)
+	module_name, class_name = discogsparser.entities[entity]
+	handler = getattr(__import__(module_name), class_name)(exporter, ignore_missing_tags=True)
+	stdout = sys.stdout
+	if output is not None:
+		sys.stdout = output
+	try:
+		start = time.time()
+		backends[backend](handler, filename)
+		exporter.finish(completely_done=True)
+		elapsed = time.time() - start
+	finally:
+		sys.stdout = stdout
+		if output is not None:
+			output.close()
+		if directory is not None:
+			shutil.rmtree(directory)
+	size = os.path.getsize(filename)
+	return {'entity': entity, 'exporter': exporter_name, 'backend': backend, 'records': handler.count,
+			'bytes': size, 'seconds': round(elapsed, 3),
+			'records_per_second': round(handler.count / max(elapsed, 0.001), 1),
+			'mb_per_second': round(size / 1048576.0 / max(elapsed, 0.001), 2)}
+
+
+def version():
+	here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	try:
+		return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=here,
+				stderr=open(os.devnull, 'w')).strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def key(result):
+	return (result['size'], result['entity'], result['exporter'], result['backend'])
+
+
+def compare(results, old_path):
+	'''Prints how much faster (>1) or slower each result is than the same one of an earlier run.'''
+	with open(old_path) as f:
+		old = json.load(f)
+	before = dict((key(r), r) for r in old['results'])
+	print 'Compared with %s (%s):' % (old_path, old.get('version'))
+	for result in results:
+		earlier = before.get(key(result))
+		if earlier is not None and result['seconds']:
+			print '  %s %s %s %s: %.2fx' % (result['size'], result['entity'], result['exporter'], result['backend'],
+					earlier['seconds'] / result['seconds'])
+
+
+def main(argv):
+	opt_parser = argparse.ArgumentParser(description='Time the handlers and exporters')
+	opt_parser.add_argument('-n', '--sizes', default='1000,10000', help='Comma-separated records per dump to generate (default 1000,10000)')
+	opt_parser.add_argument('-x', '--exporters', default='null,json,mongo,pgdump', help='Comma-separated exporters to time (default null,json,mongo,pgdump)')
+	opt_parser.add_argument('-b', '--backends', default='sax', help='Comma-separated parser backends (default sax)')
+	opt_parser.add_argument('-e', '--entities', default=','.join(ENTITIES), help='Comma-separated dumps to time (default all four)')
+	opt_parser.add_argument('-r', '--repeat', type=int, default=1, help='Runs of each, the fastest counts (default 1)')
+	opt_parser.add_argument('--seed', type=int, default=0, help='Seed of the generated dumps')
+	opt_parser.add_argument('--dumps', help='Directory with the dumps to time instead of generated ones')
+	opt_parser.add_argument('-d', '--date', default='20990101', help='Date of the dumps in --dumps')
+	opt_parser.add_argument('-o', '--output', help='Write the results as JSON to this file')
+	opt_parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+	options = opt_parser.parse_args(argv)
+
+	entities = options.entities.split(',')
+	workdir = tempfile.mkdtemp(prefix='discogs-benchmark-')
+	results = []
+	skipped = set()
+	try:
+		if options.dumps:
+			sets = [('dumps', dict((e, os.path.join(options.dumps, 'discogs_%s_%s.xml' % (options.date, e))) for e in entities))]
+		else:
+			sets = []
+			for size in options.sizes.split(','):
+				directory = os.path.join(workdir, size)
+				os.mkdir(directory)
+				made = make_dumps(directory, options.date, int(size), seed=options.seed, entities=entities)
+				sets.append((int(size), dict((e, filename) for e, (filename, count) in made.iteritems())))
+		for size, files in sets:
+			for entity in entities:
+				for exporter_name in options.exporters.split(','):
+					for backend in options.backends.split(','):
+						if exporter_name in skipped:
+							continue
+						try:
+							runs = [run(entity, files[entity], exporter_name, backend, workdir) for i in xrange(options.repeat)]
+						except ImportError as e:
+							print '%s: skipped, %s' % (exporter_name, e)
+							skipped.add(exporter_name)
+							continue
+						result = min(runs, key=lambda r: r['seconds'])
+						result['size'] = size
+						results.append(result)
+						print '%s %s %s %s: %d records in %.2fs, %d records/s, %.2f MB/s' % (size, entity, exporter_name,
+								backend, result['records'], result['seconds'], result['records_per_second'], result['mb_per_second'])
+	finally:
+		shutil.rmtree(workdir)
+
+	if options.output:
+		with open(options.output, 'w') as f:
+			json.dump({'version': version(), 'python': platform.python_version(), 'platform': platform.platform(),
+					'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=1, sort_keys=True)
+			f.write('\n')
+	if options.compare:
+		compare(results, options.compare)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
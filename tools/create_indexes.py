@@ -0,0 +1,198 @@
+'''Runs the statements of create_indexes.sql over several connections at once, after an import.
+
+Usage: python tools/create_indexes.py -p "dbname=discogs user=discogs" [-j 4] [-m 1GB] [-f create_indexes.sql]
+
+The statements on one table run one after the other on one connection, in the order
+of the file, since a primary key locks its whole table; the tables are spread over
+the -j connections, largest first. The foreign keys go in afterwards, once all the
+primary keys they refer to are there, in rounds of keys that share no table: adding
+one locks both its table and the one it refers to against the others. Constraints and
+indexes that already exist are skipped, so after a failure the same command carries
+on with what is missing.
+'''
+import argparse
+import os
+import Queue
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import postgresexporter
+
+STATEMENTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'create_indexes.sql')
+
+_constraint = re.compile(r'ALTER TABLE (?:ONLY )?(\w+) ADD CONSTRAINT (\w+) (PRIMARY KEY|UNIQUE|FOREIGN KEY .* REFERENCES (\w+))', re.I | re.S)
+_index = re.compile(r'CREATE (?:UNIQUE )?INDEX (\w+) ON (?:ONLY )?(\w+)', re.I)
+# statements that are run again every time
+_table_statements = (
+	('delete', re.compile(r'DELETE FROM (\w+)', re.I)),
+	('analyze', re.compile(r'ANALYZE (\w+)', re.I)),
+	('set logged', re.compile(r'ALTER TABLE (?:ONLY )?(\w+) SET LOGGED', re.I)),
+	)
+
+
+class Statement(object):
+	'''One statement of the file, with the table it works on and the constraint or index it makes.'''
+	def __init__(self, sql):
+		self.sql = sql
+		self.name = self.references = None
+		match = _constraint.match(sql)
+		if match:
+			self.table, self.name, self.references = match.group(1), match.group(2), match.group(4)
+			self.kind = 'constraint'
+			return
+		match = _index.match(sql)
+		if match:
+			self.name, self.table = match.groups()
+			self.kind = 'index'
+			return
+		for kind, pattern in _table_statements:
+			match = pattern.match(sql)
+			if match:
+				self.table = match.group(1)
+				self.kind = kind
+				return
+		raise ValueError('Cannot tell which table this is on: %s' % sql)
+
+	def __str__(self):
+		return '%s on %s' % (self.name or self.kind, self.table)
+
+
+def split_sql(path):
+	'''The statements of an SQL file, without its -- comments, on one line each.'''
+	with open(path) as f:
+		lines = [line for line in f if not line.lstrip().startswith('--')]
+	return [' '.join(sql.split()) for sql in ''.join(lines).split(';') if sql.strip()]
+
+
+def read_statements(path):
+	return [Statement(sql) for sql in split_sql(path)]
+
+
+def by_table(statements):
+	'''The statements grouped by table, in the order of the file.'''
+	groups = {}
+	for statement in statements:
+		groups.setdefault(statement.table, []).append(statement)
+	return groups
+
+
+def foreign_key_rounds(statements):
+	'''The foreign keys in rounds in which no two of them are on or refer to the same
+	table, in the order given otherwise.'''
+	rounds = []
+	for statement in statements:
+		tables = set([statement.table, statement.references])
+		for used, keys in rounds:
+			if not used & tables:
+				break
+		else:
+			used, keys = set(), []
+			rounds.append((used, keys))
+		used.update(tables)
+		keys.append(statement)
+	return [keys for used, keys in rounds]
+
+
+class Builder(object):
+	def __init__(self, connection_string, jobs, maintenance_work_mem):
+		self.connections = []
+		for i in xrange(jobs):
+			conn = postgresexporter.connect(connection_string)
+			cur = conn.cursor()
+			cur.execute("SET maintenance_work_mem = %s;", (maintenance_work_mem, ))
+			self.connections.append(conn)
+		self.failed = []
+		self._lock = threading.Lock()
+
+	def say(self, line):
+		with self._lock:
+			sys.stdout.write(line + '\n')
+			sys.stdout.flush()
+
+	def sizes(self):
+		cur = self.connections[0].cursor()
+		cur.execute("SELECT c.relname, pg_total_relation_size(c.oid) FROM pg_class c "
+				"JOIN pg_namespace n ON n.oid = c.relnamespace WHERE c.relkind = 'r' AND n.nspname = current_schema();")
+		return dict(cur.fetchall())
+
+	def exists(self, cur, statement):
+		if statement.kind == 'constraint':
+			cur.execute("SELECT 1 FROM pg_constraint c JOIN pg_namespace n ON n.oid = c.connamespace "
+					"WHERE c.conname = %s AND n.nspname = current_schema();", (statement.name, ))
+		elif statement.kind == 'index':
+			cur.execute("SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+					"WHERE c.relname = %s AND c.relkind = 'i' AND n.nspname = current_schema();", (statement.name, ))
+		else:
+			return False
+		return cur.fetchone() is not None
+
+	def run(self, conn, statement):
+		import psycopg2
+		cur = conn.cursor()
+		try:
+			if self.exists(cur, statement):
+				self.say('   exists  %s' % statement)
+				return
+			start = time.time()
+			cur.execute(statement.sql + ';')
+			self.say('%8.1fs  %s' % (time.time() - start, statement))
+		except psycopg2.Error as e:
+			self.failed.append(statement)
+			self.say('  FAILED  %s: %s' % (statement, str(e).strip()))
+
+	def work(self, conn, groups):
+		while 1:
+			try:
+				group = groups.get_nowait()
+			except Queue.Empty:
+				return
+			for statement in group:
+				self.run(conn, statement)
+
+	def build(self, statements):
+		'''Runs the statements grouped by table, the biggest tables first, on all connections;
+		the foreign keys among them one round of foreign_key_rounds() after the other.'''
+		sizes = self.sizes()
+		groups = sorted(by_table([s for s in statements if s.references is None]).iteritems(),
+				key=lambda item: -sizes.get(item[0], 0))
+		self.run_groups([group for table, group in groups])
+		keys = sorted([s for s in statements if s.references is not None], key=lambda s: -sizes.get(s.table, 0))
+		for batch in foreign_key_rounds(keys):
+			self.run_groups([[key] for key in batch])
+
+	def run_groups(self, groups):
+		'''Runs each group of statements in order on one connection, the groups side by side.'''
+		queue = Queue.Queue()
+		for group in groups:
+			queue.put(group)
+		threads = [threading.Thread(target=self.work, args=(conn, queue)) for conn in self.connections]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+
+def main(argv):
+	opt_parser = argparse.ArgumentParser(description='Create the indexes and constraints of an imported database in parallel')
+	opt_parser.add_argument('-p', '--params', required=True, help='Connection string, as for discogsparser.py')
+	opt_parser.add_argument('-j', '--jobs', type=int, default=4, help='Connections building at the same time (default 4)')
+	opt_parser.add_argument('-m', '--maintenance-work-mem', default='1GB', help='maintenance_work_mem of each connection (default 1GB)')
+	opt_parser.add_argument('-f', '--file', default=STATEMENTS, help='The statements to run (default create_indexes.sql)')
+	options = opt_parser.parse_args(argv)
+
+	statements = read_statements(options.file)
+	builder = Builder(options.params, max(1, options.jobs), options.maintenance_work_mem)
+	start = time.time()
+	builder.build([s for s in statements if s.references is None])
+	builder.build([s for s in statements if s.references is not None])
+	print '%d statements in %.1fs, %d failed' % (len(statements), time.time() - start, len(builder.failed))
+	if builder.failed:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
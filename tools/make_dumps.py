@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+'''Writes synthetic discogs_DATE_{artists,labels,masters,releases}.xml dumps of any size,
+with the elements of the real ones and their mix of short and long records: tracklists,
+credits, images, notes and sublabels vary the way they do in the monthly dumps.
+The same seed gives the same dumps.
+
+Usage: python tools/make_dumps.py [-n 10000 | --size 100] [-d 20990101] [-o DIR] [artists labels ...]
+'''
+import argparse
+import math
+import os
+import random
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+ENTITIES = ('artists', 'labels', 'masters', 'releases')
+
+WORDS = (u'love night sound dance deep house soul city light dream fire blue time black star '
+		u'heart electric world sun rain fever gold moon low high machine tribe shadow ocean '
+		u'caf\xe9 na\xefve s\xf8nder m\xfcnchen 東京 Москва αλφα').split()
+GENRES = {
+	u'Electronic': (u'House', u'Techno', u'Ambient', u'Trance', u'Drum n Bass', u'Electro', u'Minimal'),
+	u'Rock': (u'Punk', u'Indie Rock', u'Alternative Rock', u'Hard Rock', u'Psychedelic Rock'),
+	u'Jazz': (u'Soul-Jazz', u'Fusion', u'Bop', u'Free Jazz'),
+	u'Hip Hop': (u'Boom Bap', u'Instrumental', u'Conscious'),
+	u'Pop': (u'Synth-pop', u'Ballad', u'Europop'),
+	u'Funk / Soul': (u'Disco', u'Funk', u'Rhythm & Blues'),
+	u'Classical': (u'Baroque', u'Modern', u'Romantic'),
+	u'Folk, World, & Country': (u'Folk', u'Country', u'African'),
+	}
+FORMATS = ((u'Vinyl', 40), (u'CD', 30), (u'File', 12), (u'Cassette', 8), (u'CDr', 5), (u'Box Set', 2), (u'DVD', 3))
+DESCRIPTIONS = (u'LP', u'Album', u'12"', u'7"', u'45 RPM', u'33 ⅓ RPM', u'Single', u'EP', u'Compilation',
+		u'Reissue', u'Remastered', u'Promo', u'Limited Edition', u'Stereo', u'MP3', u'FLAC')
+ROLES = (u'Producer', u'Written-By', u'Mixed By', u'Mastered By', u'Remix', u'Vocals', u'Guitar', u'Bass',
+		u'Drums', u'Design', u'Photography By', u'Engineer', u'Lacquer Cut By', u'Keyboards', u'Executive-Producer')
+ROLE_DETAILS = (u'Assistant', u'Additional', u'Dub', u'Backing', u'Electric', u'Remix')
+JOINS = (u',', u'&', u'Feat.', u'Vs.', u'And', u'Presents', u'/')
+COUNTRIES = (u'US', u'UK', u'Germany', u'France', u'Japan', u'Netherlands', u'Italy', u'Canada', u'Europe',
+		u'Sweden', u'Spain', u'Belgium', u'Russia', u'Brazil', u'Australia')
+QUALITIES = ((u'Needs Vote', 55), (u'Correct', 25), (u'Complete and Correct', 8), (u'Needs Minor Changes', 9),
+		(u'Needs Major Changes', 2), (u'Entirely Incorrect', 1))
+STATUSES = ((u'Accepted', 97), (u'Draft', 2), (u'Deleted', 1))
+IDENTIFIERS = (u'Barcode', u'Matrix / Runout', u'Label Code', u'Rights Society', u'Mastering SID Code')
+COMPANY_TYPES = ((13, u'Phonographic Copyright (p)'), (14, u'Copyright (c)'), (17, u'Pressed By'),
+		(19, u'Distributed By'), (29, u'Mastered At'), (9, u'Licensed From'))
+
+
+def weighted(rnd, choices):
+	total = sum(w for c, w in choices)
+	n = rnd.uniform(0, total)
+	for choice, w in choices:
+		n -= w
+		if n <= 0:
+			return choice
+	return choices[-1][0]
+
+
+def lognormal(rnd, median, sigma, low, high):
+	'''An int around median with a long tail, between low and high.'''
+	return max(low, min(high, int(round(rnd.lognormvariate(math.log(median), sigma)))))
+
+
+def maybe(rnd, p):
+	return rnd.random() < p
+
+
+class Generator(object):
+	'''Builds the records; ids run from 1 to the number of records of each dump,
+	so artists, labels and masters referred to mostly exist.'''
+	def __init__(self, seed=0, counts=None):
+		self.rnd = random.Random(seed)
+		self.counts = dict.fromkeys(ENTITIES, 1000)
+		self.counts.update(counts or {})
+
+	def words(self, low, high):
+		rnd = self.rnd
+		return u' '.join(rnd.choice(WORDS) for i in xrange(rnd.randint(low, high))).capitalize()
+
+	def name(self):
+		name = self.words(1, 3)
+		if maybe(self.rnd, 0.05):
+			name += u' (%d)' % self.rnd.randint(2, 9)
+		return name
+
+	def text(self, median, sigma=1.0):
+		'''Notes or a profile: sentences over several lines, sometimes with markup.'''
+		rnd = self.rnd
+		size = lognormal(rnd, median, sigma, 10, 30000)
+		lines, length = [], 0
+		while length < size:
+			line = u'. '.join(self.words(4, 14) for i in xrange(rnd.randint(1, 4))) + u'.'
+			if maybe(rnd, 0.1):
+				line = u'[a=%s] & <%s> "%s"' % (self.name(), rnd.choice(WORDS), line)
+			lines.append(line)
+			length += len(line) + 1
+		return u'\n'.join(lines)
+
+	def ref(self, entity):
+		return self.rnd.randint(1, max(self.counts[entity], 1))
+
+	def images(self, kind, id, median):
+		rnd = self.rnd
+		if maybe(rnd, 0.3):
+			return u'<images/>' if maybe(rnd, 0.5) else u''
+		out = [u'<images>']
+		for i in xrange(lognormal(rnd, median, 0.7, 1, 40)):
+			size = rnd.choice((150, 300, 500, 600))
+			out.append(u'<image height="%d" type="%s" uri="http://api.discogs.com/image/%s-%d-%d.jpeg" '
+					u'uri150="http://api.discogs.com/image/%s-150-%d-%d.jpeg" width="%d"/>' % (
+					size, u'primary' if i == 0 else u'secondary', kind, id, i, kind, id, i, size))
+		out.append(u'</images>')
+		return u''.join(out)
+
+	def credit(self, role=True, join=u''):
+		'''An <artist> of artists or extraartists.'''
+		rnd = self.rnd
+		roles = u''
+		if role:
+			roles = u', '.join(rnd.choice(ROLES) + (u' [%s]' % rnd.choice(ROLE_DETAILS) if maybe(rnd, 0.15) else u'')
+					for i in xrange(lognormal(rnd, 1, 0.5, 1, 5)))
+		anv = self.name() if maybe(rnd, 0.1) else u''
+		tracks = u'A1 to B2' if role and maybe(rnd, 0.1) else u''
+		return u'<artist><id>%d</id><name>%s</name><anv>%s</anv><join>%s</join><role>%s</role><tracks>%s</tracks></artist>' % (
+				self.ref('artists'), escape(self.name()), escape(anv), escape(join), escape(roles), tracks)
+
+	def artists(self, credits=None):
+		rnd = self.rnd
+		n = 1 if maybe(rnd, 0.8) else rnd.randint(2, 4)
+		joins = [rnd.choice(JOINS) for i in xrange(n - 1)] + [u'']
+		out = u'<artists>%s</artists>' % u''.join(self.credit(False, join) for join in joins)
+		if credits is not None:
+			out += u'<extraartists>%s</extraartists>' % u''.join(self.credit() for i in xrange(credits))
+		return out
+
+	def genres(self, out):
+		rnd = self.rnd
+		genres = rnd.sample(sorted(GENRES), lognormal(rnd, 1, 0.5, 1, 3))
+		styles = set()
+		for genre in genres:
+			styles.update(rnd.sample(GENRES[genre], rnd.randint(0, 2)))
+		out.append(u'<genres>%s</genres>' % u''.join(u'<genre>%s</genre>' % escape(g) for g in genres))
+		if styles:
+			out.append(u'<styles>%s</styles>' % u''.join(u'<style>%s</style>' % escape(s) for s in sorted(styles)))
+
+	def videos(self, out, p):
+		rnd = self.rnd
+		if maybe(rnd, p):
+			out.append(u'<videos>')
+			for i in xrange(lognormal(rnd, 2, 0.6, 1, 20)):
+				out.append(u'<video duration="%d" embed="true" src="http://www.youtube.com/watch?v=%08x">'
+						u'<title>%s</title><description>%s</description></video>' % (
+						rnd.randint(60, 900), rnd.getrandbits(32), escape(self.name()), escape(self.words(3, 12))))
+			out.append(u'</videos>')
+
+	def track(self, position, sub=False):
+		rnd = self.rnd
+		out = [u'<track><position>%s</position><title>%s</title><duration>%s</duration>' % (
+				position, escape(self.words(1, 5)), u'%d:%02d' % (rnd.randint(1, 12), rnd.randint(0, 59)) if maybe(rnd, 0.7) else u'')]
+		if maybe(rnd, 0.1):
+			out.append(u'<artists>%s</artists>' % self.credit(False))
+		if maybe(rnd, 0.15):
+			out.append(u'<extraartists>%s</extraartists>' % u''.join(self.credit() for i in xrange(lognormal(rnd, 1, 0.7, 1, 8))))
+		if not sub and maybe(rnd, 0.02):
+			out.append(u'<sub_tracks>%s</sub_tracks>' % u''.join(self.track(u'%s.%s' % (position, c), True) for c in u'abc'))
+		out.append(u'</track>')
+		return u''.join(out)
+
+	def release(self, id):
+		rnd = self.rnd
+		out = [u'<release id="%d" status="%s">' % (id, weighted(rnd, STATUSES)), self.images('R', id, 2)]
+		credits = 0 if maybe(rnd, 0.35) else lognormal(rnd, 4, 0.9, 1, 200)
+		out.append(self.artists(credits))
+		out.append(u'<title>%s</title>' % escape(self.words(1, 6)))
+		out.append(u'<labels>%s</labels>' % u''.join(u'<label catno=%s name=%s/>' % (
+				quoteattr(u'%s %d' % (rnd.choice(WORDS)[:3].upper(), rnd.randint(1, 9999)) if maybe(rnd, 0.9) else u'none'),
+				quoteattr(self.name())) for i in xrange(1 if maybe(rnd, 0.85) else rnd.randint(2, 4))))
+		out.append(u'<formats>')
+		for i in xrange(1 if maybe(rnd, 0.9) else rnd.randint(2, 3)):
+			descriptions = rnd.sample(DESCRIPTIONS, rnd.randint(0, 4))
+			out.append(u'<format name=%s qty="%d" text="%s">%s</format>' % (quoteattr(weighted(rnd, FORMATS)),
+					1 if maybe(rnd, 0.85) else rnd.randint(2, 12), u'Gatefold' if maybe(rnd, 0.05) else u'',
+					u'<descriptions>%s</descriptions>' % u''.join(u'<description>%s</description>' % escape(d) for d in descriptions)
+					if descriptions else u''))
+		out.append(u'</formats>')
+		self.genres(out)
+		if maybe(rnd, 0.9):
+			out.append(u'<country>%s</country>' % rnd.choice(COUNTRIES))
+		if maybe(rnd, 0.85):
+			year = rnd.randint(1950, 2014)
+			out.append(u'<released>%s</released>' % (u'%d-%02d-%02d' % (year, rnd.randint(1, 12), rnd.randint(1, 28))
+					if maybe(rnd, 0.4) else unicode(year)))
+		if maybe(rnd, 0.45):
+			out.append(u'<notes>%s</notes>' % escape(self.text(200, 1.4)))
+		if maybe(rnd, 0.6):
+			out.append(u'<master_id is_main_release="%s">%d</master_id>' % (
+					u'true' if maybe(rnd, 0.3) else u'false', self.ref('masters')))
+		out.append(u'<data_quality>%s</data_quality>' % weighted(rnd, QUALITIES))
+		out.append(u'<tracklist>')
+		sides = u'AB' if maybe(rnd, 0.4) else u''
+		n = lognormal(rnd, 8, 0.6, 1, 300)
+		for i in xrange(n):
+			position = u'%s%d' % (sides[i * 2 / n], i % max(n / 2, 1) + 1) if sides else unicode(i + 1)
+			out.append(self.track(position))
+		out.append(u'</tracklist>')
+		if maybe(rnd, 0.6):
+			out.append(u'<identifiers>%s</identifiers>' % u''.join(u'<identifier description=%s type=%s value=%s/>' % (
+					quoteattr(rnd.choice((u'', u'Side A', u'Text', u'Scanned'))), quoteattr(rnd.choice(IDENTIFIERS)),
+					quoteattr(u'%d' % rnd.getrandbits(40))) for i in xrange(lognormal(rnd, 2, 0.8, 1, 30))))
+		self.videos(out, 0.25)
+		if maybe(rnd, 0.4):
+			out.append(u'<companies>')
+			for i in xrange(lognormal(rnd, 2, 0.7, 1, 20)):
+				type_id, type_name = rnd.choice(COMPANY_TYPES)
+				company = self.ref('labels')
+				out.append(u'<company><id>%d</id><name>%s</name><catno></catno><entity_type>%d</entity_type>'
+						u'<entity_type_name>%s</entity_type_name><resource_url>http://api.discogs.com/labels/%d</resource_url></company>' % (
+						company, escape(self.name()), type_id, escape(type_name), company))
+			out.append(u'</companies>')
+		out.append(u'</release>')
+		return u''.join(out)
+
+	def names(self, tag, inner, n):
+		if n == 0:
+			return u''
+		return u'<%s>%s</%s>' % (tag, u''.join(inner() for i in xrange(n)), tag)
+
+	def artist(self, id):
+		rnd = self.rnd
+		out = [u'<artist>', self.images('A', id, 1), u'<id>%d</id><name>%s</name>' % (id, escape(self.name()))]
+		if maybe(rnd, 0.2):
+			out.append(u'<realname>%s</realname>' % escape(self.name()))
+		out.append(u'<profile>%s</profile>' % (escape(self.text(150, 1.5)) if maybe(rnd, 0.4) else u''))
+		out.append(u'<data_quality>%s</data_quality>' % weighted(rnd, QUALITIES))
+		out.append(self.names(u'urls', lambda: u'<url>http://www.%s.com/</url>' % rnd.choice(WORDS[:20]),
+				0 if maybe(rnd, 0.7) else lognormal(rnd, 2, 0.7, 1, 30)))
+		out.append(self.names(u'namevariations', lambda: u'<name>%s</name>' % escape(self.name()),
+				0 if maybe(rnd, 0.6) else lognormal(rnd, 2, 0.9, 1, 60)))
+		refs = lambda: u'<name id="%d">%s</name>' % (self.ref('artists'), escape(self.name()))
+		out.append(self.names(u'aliases', refs, 0 if maybe(rnd, 0.8) else lognormal(rnd, 1, 0.8, 1, 30)))
+		if maybe(rnd, 0.08):
+			out.append(u'<members>%s</members>' % u''.join(u'<id>%d</id><name id="%d">%s</name>' % (m, m, escape(self.name()))
+					for m in (self.ref('artists') for i in xrange(lognormal(rnd, 3, 0.6, 1, 40)))))
+		out.append(self.names(u'groups', refs, 0 if maybe(rnd, 0.85) else lognormal(rnd, 1, 0.7, 1, 20)))
+		out.append(u'</artist>')
+		return u''.join(out)
+
+	def label(self, id):
+		rnd = self.rnd
+		out = [u'<label>', self.images('L', id, 1), u'<id>%d</id><name>%s</name>' % (id, escape(self.name()))]
+		out.append(u'<contactinfo>%s</contactinfo>' % (escape(self.text(60, 0.6)) if maybe(rnd, 0.2) else u''))
+		out.append(u'<profile>%s</profile>' % (escape(self.text(120, 1.2)) if maybe(rnd, 0.3) else u''))
+		out.append(u'<data_quality>%s</data_quality>' % weighted(rnd, QUALITIES))
+		if maybe(rnd, 0.15):
+			out.append(u'<parentLabel id="%d">%s</parentLabel>' % (self.ref('labels'), escape(self.name())))
+		out.append(self.names(u'urls', lambda: u'<url>http://www.%s.com/</url>' % rnd.choice(WORDS[:20]),
+				0 if maybe(rnd, 0.7) else lognormal(rnd, 1, 0.6, 1, 10)))
+		out.append(self.names(u'sublabels', lambda: u'<label id="%d">%s</label>' % (self.ref('labels'), escape(self.name())),
+				0 if maybe(rnd, 0.9) else lognormal(rnd, 3, 1.2, 1, 500)))
+		out.append(u'</label>')
+		return u''.join(out)
+
+	def master(self, id):
+		rnd = self.rnd
+		out = [u'<master id="%d"><main_release>%d</main_release>' % (id, self.ref('releases')), self.images('M', id, 2)]
+		out.append(self.artists())
+		self.genres(out)
+		out.append(u'<year>%d</year>' % (rnd.randint(1950, 2014) if maybe(rnd, 0.95) else 0))
+		out.append(u'<title>%s</title>' % escape(self.words(1, 6)))
+		out.append(u'<data_quality>%s</data_quality>' % weighted(rnd, QUALITIES))
+		if maybe(rnd, 0.1):
+			out.append(u'<notes>%s</notes>' % escape(self.text(150, 1.2)))
+		self.videos(out, 0.4)
+		out.append(u'</master>')
+		return u''.join(out)
+
+
+def write_dump(generator, entity, filename, records=None, size=None):
+	'''Writes records records, or as many as it takes to fill size bytes; returns the number written.'''
+	record = getattr(generator, entity[:-1])
+	count, written = 0, 0
+	with open(filename, 'wb') as f:
+		head = '<%s>' % entity
+		f.write(head)
+		written += len(head)
+		while (records is not None and count < records) or (size is not None and written < size):
+			data = record(count + 1).encode('utf-8') + '\n'
+			f.write(data)
+			written += len(data)
+			count += 1
+		f.write('</%s>\n' % entity)
+	return count
+
+
+def make_dumps(directory, date, records=None, size=None, seed=0, entities=ENTITIES):
+	'''Writes the dumps of entities into directory, returns {entity: (file name, records)}.'''
+	counts = {}
+	if records is not None:
+		counts = dict.fromkeys(ENTITIES, records)
+	elif size is not None:
+		# the ids referred to stay in about the range the other dumps end up with
+		counts = {'artists': size / 900, 'labels': size / 700, 'masters': size / 700, 'releases': size / 3500}
+	generator = Generator(seed, counts)
+	made = {}
+	for entity in entities:
+		filename = os.path.join(directory, 'discogs_%s_%s.xml' % (date, entity))
+		made[entity] = (filename, write_dump(generator, entity, filename, records, size))
+	return made
+
+
+def main(argv):
+	opt_parser = argparse.ArgumentParser(description='Write synthetic discogs dumps')
+	opt_parser.add_argument('-n', '--records', type=int, help='Records per dump (default 1000)')
+	opt_parser.add_argument('--size', type=float, help='Size of each dump in MB, instead of -n')
+	opt_parser.add_argument('-d', '--date', default='20990101', help='Date in the file names (default 20990101)')
+	opt_parser.add_argument('-o', '--directory', default='.', help='Where to write the dumps (default: here)')
+	opt_parser.add_argument('--seed', type=int, default=0, help='Seed of the random numbers, the same seed gives the same dumps')
+	opt_parser.add_argument('entity', nargs='*', help='Dumps to write: artists, labels, masters and/or releases (default all four)')
+	options = opt_parser.parse_args(argv)
+	for entity in options.entity:
+		if entity not in ENTITIES:
+			opt_parser.error('Unknown dump %s' % entity)
+	if options.records is not None and options.size is not None:
+		opt_parser.error('-n and --size cannot be combined')
+	size = int(options.size * 1024 * 1024) if options.size is not None else None
+	records = options.records if options.records is not None or size is not None else 1000
+	made = make_dumps(options.directory, options.date, records, size, options.seed, options.entity or ENTITIES)
+	for entity in options.entity or ENTITIES:
+		filename, count = made[entity]
+		print '%s: %d records, %.1f MB' % (filename, count, os.path.getsize(filename) / 1048576.0)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,24 @@
+'''Converts the .md5 files of older ?uniq=md5 imports to .hashes stores.
+
+Usage: python tools/md5_to_hashstore.py artists.md5 releases.md5 ...
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashstore
+
+
+def main(argv):
+	if not argv:
+		print __doc__
+		sys.exit(1)
+	for md5_name in argv:
+		store_name = os.path.splitext(md5_name)[0] + '.hashes'
+		count = hashstore.convert_md5(md5_name, store_name)
+		print '%s: %d records written to %s' % (md5_name, count, store_name)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
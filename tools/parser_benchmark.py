@@ -0,0 +1,79 @@
+'''Times the parser backends on some dumps, with an exporter that drops every record.
+
+Usage: python tools/parser_benchmark.py [-b sax,expat] discogs_20111101_artists.xml ...
+'''
+import argparse
+import os
+import sys
+import time
+import xml.sax
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discogsexpat
+import discogsiterparser
+from discogsparser import entities
+
+
+class NullExporter(object):
+	def storeArtist(self, artist):
+		pass
+
+	def storeLabel(self, label):
+		pass
+
+	def storeRelease(self, release):
+		pass
+
+	def storeMaster(self, master):
+		pass
+
+	def completed(self, entity):
+		pass
+
+	def finish(self, completely_done=False):
+		pass
+
+
+def run_sax(handler, filename):
+	parser = xml.sax.make_parser()
+	parser.setContentHandler(handler)
+	parser.parse(filename)
+
+
+backends = {
+	'sax': run_sax,
+	'iterparse': discogsiterparser.parse,
+	'expat': discogsexpat.parse,
+	}
+
+
+def make_handler(filename):
+	for entity, (module_name, class_name) in entities.iteritems():
+		if filename.endswith('_%s.xml' % entity):
+			return getattr(__import__(module_name), class_name)(NullExporter(), ignore_missing_tags=True)
+	raise ValueError('Not a discogs dump: %s' % filename)
+
+
+def main(argv):
+	opt_parser = argparse.ArgumentParser(description='Compare the parser backends')
+	opt_parser.add_argument('-b', '--backends', default='sax,iterparse,expat', help='Comma-separated list of backends to time')
+	opt_parser.add_argument('file', nargs='+', help='Uncompressed dump(s)')
+	options = opt_parser.parse_args(argv)
+
+	for filename in options.file:
+		baseline = None
+		for backend in options.backends.split(','):
+			handler = make_handler(filename)
+			start = time.time()
+			backends[backend](handler, filename)
+			elapsed = time.time() - start
+			if baseline is None:
+				baseline = elapsed
+			print '%s %s: %d records in %.2fs, %d records/s, %.2fx' % (
+					os.path.basename(filename), backend, handler.count, elapsed,
+					handler.count / elapsed if elapsed else 0, baseline / elapsed if elapsed else 0)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
@@ -0,0 +1,215 @@
+'''Replaces the whole database with newer dumps while it stays readable: the dumps
+go into a staging schema, which is made ready there and then swapped with the live one.
+
+Usage: python tools/refresh.py -p "dbname=discogs user=discogs" run -- --sanitize -o pgcopy -d 20140601
+
+or a step at a time:
+
+	python tools/refresh.py -p "dbname=discogs user=discogs" prepare
+	python discogsparser.py --sanitize -o pgcopy -p "dbname=discogs user=discogs schema=discogs_staging" -d 20140601
+	python tools/refresh.py -p "dbname=discogs user=discogs" publish
+
+prepare   creates the staging schema anew, with the UNLOGGED tables of create_tables.sql
+publish   runs fix_db.sql and create_indexes.sql in the staging schema, makes its tables
+          logged, analyzes them, then in one transaction renames the live schema to the
+          previous one (dropping the one before that) and the staging schema to the live one
+rollback  swaps the live schema and the previous one back, in one transaction; the schema
+          it takes out becomes the staging schema
+
+The live schema is the first one on the search path of the connection, public unless
+a schema is named after the user. Each stage prints how long it took.
+'''
+import argparse
+from contextlib import contextmanager
+import os
+import re
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import create_indexes
+import postgresexporter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@contextmanager
+def stage(name):
+	print '%s...' % name
+	sys.stdout.flush()
+	start = time.time()
+	yield
+	print '%s: %.1fs' % (name, time.time() - start)
+	sys.stdout.flush()
+
+
+def schema_exists(cur, schema):
+	cur.execute("SELECT 1 FROM pg_namespace WHERE nspname = %s;", (schema, ))
+	return cur.fetchone() is not None
+
+
+def logged_levels(tables, references):
+	'''The tables in the order SET LOGGED can go through them, as a list of levels: a logged
+	table cannot refer to an unlogged one, so a table comes after all those it refers to
+	((table, referenced table) pairs), and the tables of one level refer to none of each other.'''
+	refers_to = dict((table, set()) for table in tables)
+	for table, referenced in references:
+		if table in refers_to and referenced in refers_to and table != referenced:
+			refers_to[table].add(referenced)
+	levels = []
+	done = set()
+	while len(done) < len(refers_to):
+		level = sorted(t for t, referenced in refers_to.iteritems() if t not in done and referenced <= done)
+		if not level:
+			raise ValueError('The foreign keys between %s go round in a circle' % ', '.join(sorted(set(refers_to) - done)))
+		levels.append(level)
+		done.update(level)
+	return levels
+
+
+class Refresh(object):
+	def __init__(self, options):
+		self.params = options.params
+		self.staging = options.staging
+		self.previous = options.previous
+		self.jobs = options.jobs
+		self.maintenance_work_mem = options.maintenance_work_mem
+		self.conn = postgresexporter.connect(self.params)
+		self.cur = self.conn.cursor()
+		self.live = options.live
+		if self.live is None:
+			self.cur.execute("SELECT current_schema();")
+			self.live, = self.cur.fetchone()
+		if len(set([self.live, self.staging, self.previous])) < 3:
+			raise ValueError('The live, staging and previous schemas need three different names')
+
+	def staged(self, params):
+		return '%s schema=%s' % (params, self.staging)
+
+	def prepare(self):
+		with stage('prepare'):
+			self.cur.execute("DROP SCHEMA IF EXISTS %s CASCADE;" % self.staging)
+			self.cur.execute("CREATE SCHEMA %s;" % self.staging)
+			self.cur.execute("SET search_path TO %s;" % self.staging)
+			for sql in create_indexes.split_sql(os.path.join(ROOT, 'create_tables.sql')):
+				if sql.lower().startswith('set search_path'):
+					continue
+				self.cur.execute(sql.replace('SCHEMA public', 'SCHEMA %s' % self.staging) + ';')
+			self.cur.execute("SET search_path TO %s;" % self.live)
+
+	def load(self, parser_args):
+		with stage('import'):
+			status = subprocess.call([sys.executable, os.path.join(ROOT, 'discogsparser.py')] + parser_args +
+					['-p', self.staged(self.params)])
+		if status != 0:
+			print 'The import failed, the live schema %s is left as it is' % self.live
+			sys.exit(status)
+
+	def publish(self):
+		if not schema_exists(self.cur, self.staging):
+			print 'There is no schema %s, run prepare and the import first' % self.staging
+			sys.exit(1)
+		staged = postgresexporter.connect(self.staged(self.params))
+		cur = staged.cursor()
+		with stage('fix_db.sql'):
+			for sql in create_indexes.split_sql(os.path.join(ROOT, 'fix_db.sql')):
+				cur.execute(sql + ';')
+		builder = create_indexes.Builder(self.staged(self.params), self.jobs, self.maintenance_work_mem)
+		with stage('create_indexes.sql'):
+			statements = create_indexes.read_statements(create_indexes.STATEMENTS)
+			builder.build([s for s in statements if s.references is None])
+			builder.build([s for s in statements if s.references is not None])
+		if builder.failed:
+			print '%d statements failed, the live schema %s is left as it is' % (len(builder.failed), self.live)
+			sys.exit(1)
+		cur.execute("SELECT c.relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+				"WHERE c.relkind = 'r' AND n.nspname = %s;", (self.staging, ))
+		tables = [table for table, in cur.fetchall()]
+		cur.execute("SELECT t.relname, r.relname FROM pg_constraint c JOIN pg_class t ON t.oid = c.conrelid "
+				"JOIN pg_class r ON r.oid = c.confrelid JOIN pg_namespace n ON n.oid = c.connamespace "
+				"WHERE c.contype = 'f' AND n.nspname = %s;", (self.staging, ))
+		references = cur.fetchall()
+		with stage('set logged'):
+			for level in logged_levels(tables, references):
+				builder.build([create_indexes.Statement('ALTER TABLE %s SET LOGGED' % t) for t in level])
+				if builder.failed:
+					break
+		with stage('analyze'):
+			builder.build([create_indexes.Statement('ANALYZE %s' % t) for t in tables])
+		if builder.failed:
+			print '%d statements failed, the live schema %s is left as it is' % (len(builder.failed), self.live)
+			sys.exit(1)
+		with stage('swap'):
+			self.swap([self.previous], [(self.live, self.previous), (self.staging, self.live)])
+		print '%s is live, the one it replaced is kept as %s' % (self.staging, self.previous)
+
+	def rollback(self):
+		if not schema_exists(self.cur, self.previous):
+			print 'There is no schema %s to go back to' % self.previous
+			sys.exit(1)
+		with stage('swap'):
+			self.swap([self.staging], [(self.live, self.staging), (self.previous, self.live)])
+		print '%s is live again, the one it replaced is kept as %s' % (self.previous, self.staging)
+
+	def swap(self, drops, renames):
+		'''Drops and renames schemas in one transaction.'''
+		import psycopg2
+		self.conn.set_isolation_level(1)
+		try:
+			for schema in drops:
+				self.cur.execute("DROP SCHEMA IF EXISTS %s CASCADE;" % schema)
+			for old, new in renames:
+				self.cur.execute("ALTER SCHEMA %s RENAME TO %s;" % (old, new))
+			self.conn.commit()
+		except psycopg2.Error:
+			self.conn.rollback()
+			raise
+		finally:
+			self.conn.set_isolation_level(0)
+
+
+def main(argv):
+	opt_parser = argparse.ArgumentParser(description='Refresh the database through a staging schema')
+	opt_parser.add_argument('-p', '--params', required=True, help='Connection string, as for discogsparser.py, without schema=')
+	opt_parser.add_argument('--live', help='The schema the readers use (default the first one on the search path)')
+	opt_parser.add_argument('--staging', default='discogs_staging', help='Schema the dumps are loaded into (default discogs_staging)')
+	opt_parser.add_argument('--previous', default='discogs_previous', help='Schema the replaced one is kept in (default discogs_previous)')
+	opt_parser.add_argument('-j', '--jobs', type=int, default=4, help='Connections building indexes at the same time (default 4)')
+	opt_parser.add_argument('-m', '--maintenance-work-mem', default='1GB', help='maintenance_work_mem of each of them (default 1GB)')
+	opt_parser.add_argument('command', choices=['prepare', 'publish', 'rollback', 'run'],
+			help='With run, the options of discogsparser.py follow after --')
+	parser_args = []
+	if '--' in argv:
+		argv, parser_args = argv[:argv.index('--')], argv[argv.index('--') + 1:]
+	options = opt_parser.parse_args(argv)
+
+	for schema in (options.live, options.staging, options.previous):
+		if schema is not None and not re.match(r'^[a-z_][a-z0-9_]*$', schema):
+			opt_parser.error('%s is not a lower case SQL name' % schema)
+	if options.command == 'run':
+		if not parser_args:
+			opt_parser.error('run needs the options of discogsparser.py after --')
+		if '-p' in parser_args or '--params' in parser_args:
+			opt_parser.error('the import gets -p from refresh.py, with schema= added')
+	elif parser_args:
+		opt_parser.error('only run takes options for discogsparser.py')
+	if 'schema=' in options.params or 'uniq=' in options.params:
+		opt_parser.error('the staging schema is loaded in full, -p takes neither schema= nor uniq=')
+
+	refresh = Refresh(options)
+	start = time.time()
+	if options.command in ('prepare', 'run'):
+		refresh.prepare()
+	if options.command == 'run':
+		refresh.load(parser_args)
+	if options.command in ('publish', 'run'):
+		refresh.publish()
+	if options.command == 'rollback':
+		refresh.rollback()
+	print 'total: %.1fs' % (time.time() - start)
+
+
+if __name__ == '__main__':
+	main(sys.argv[1:])